@@ -4,3 +4,7 @@ from django.apps import AppConfig
 class ApiConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'api'
+
+    def ready(self):
+        # invalidação dos caches do download-xml (device_cache) via signals de core.models
+        from api import signals  # noqa: F401
@@ -0,0 +1,10 @@
+"""
+Offline micro-benchmarks for the provisioning hot path.
+
+Each module exposes a run(...) function returning plain rows (dicts) and is driven by a
+management command (api/management/commands/bench_*.py), e.g.:
+
+    python manage.py bench_render --lines 4000
+    python manage.py bench_provisioning --devices 5000 --output before.json
+    python manage.py bench_provisioning --devices 5000 --compare before.json
+"""
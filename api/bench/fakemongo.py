@@ -0,0 +1,93 @@
+"""
+In-process stand-in for the Mongo database used by download-xml, so the benchmark runs
+without a Mongo server.
+
+Only what the provisioning hot path needs is implemented: find/find_one with equality
+filters, insert_many and aggregate() over the stages produced by
+api.views._template_lookup_pipeline ($match, $limit, $addFields, $unionWith, $sort,
+$project). Every read is counted in FakeMongoDB.queries.
+"""
+
+import copy
+import threading
+
+
+def _matches(doc: dict, query: dict) -> bool:
+    return all(doc.get(field) == value for field, value in (query or {}).items())
+
+
+class FakeCollection:
+    def __init__(self, db, name: str):
+        self._db = db
+        self.name = name
+        self.docs = []
+
+    def insert_many(self, docs):
+        self.docs.extend(copy.deepcopy(list(docs)))
+
+    def find(self, query=None, projection=None):
+        self._db._count()
+        return [copy.deepcopy(d) for d in self.docs if _matches(d, query)]
+
+    def find_one(self, query=None, projection=None):
+        self._db._count()
+        for doc in self.docs:
+            if _matches(doc, query):
+                return copy.deepcopy(doc)
+        return None
+
+    def count_documents(self, query=None):
+        self._db._count()
+        return sum(1 for d in self.docs if _matches(d, query))
+
+    def aggregate(self, pipeline):
+        self._db._count()
+        return iter([copy.deepcopy(d) for d in self._run(self.docs, pipeline)])
+
+    def _run(self, docs, pipeline):
+        out = list(docs)
+        for stage in pipeline:
+            (op, arg), = stage.items()
+            if op == "$match":
+                out = [d for d in out if _matches(d, arg)]
+            elif op == "$limit":
+                out = out[:arg]
+            elif op == "$addFields":
+                out = [dict(d, **arg) for d in out]
+            elif op == "$unionWith":
+                other = self._db.get_collection(arg["coll"])
+                out = out + other._run(other.docs, arg.get("pipeline") or [])
+            elif op == "$sort":
+                for field, direction in reversed(list(arg.items())):
+                    out.sort(key=lambda d: d.get(field), reverse=direction < 0)
+            elif op == "$project":
+                hidden = {f for f, v in arg.items() if not v}
+                out = [{k: v for k, v in d.items() if k not in hidden} for d in out]
+            else:
+                raise NotImplementedError(f"fake Mongo does not support {op}")
+        return out
+
+
+class FakeMongoDB:
+    def __init__(self):
+        self._collections = {}
+        self._lock = threading.Lock()
+        self.queries = 0
+
+    def _count(self):
+        with self._lock:
+            self.queries += 1
+
+    def get_collection(self, name: str) -> FakeCollection:
+        coll = self._collections.get(name)
+        if coll is None:
+            coll = self._collections[name] = FakeCollection(self, name)
+        return coll
+
+    def __getattr__(self, name):
+        if name.startswith("_"):
+            raise AttributeError(name)
+        return self.get_collection(name)
+
+    def __getitem__(self, name):
+        return self.get_collection(name)
@@ -0,0 +1,96 @@
+"""
+Synthetic provisioning fleet for the load benchmark: device profiles and DeviceConfig rows
+in the (benchmark) SQL database, one template per vendor model in a FakeMongoDB, and
+vendor-style User-Agents ('vendor model version mac') to replay against download-xml.
+"""
+
+import random
+
+from api.bench.fakemongo import FakeMongoDB
+from api.bench.render import vendor_xml_template
+from api.utils.templates import TEMPLATES_COLLECTION, encode_template_body, template_keys
+
+# (vendor, models, firmware version) as the phones announce themselves
+VENDORS = [
+    ("Yealink", ("SIP-T46S", "SIP-T54W", "SIP-T31P"), "66.86.0.15"),
+    ("Grandstream", ("GXP2170", "GRP2614"), "1.0.11.3"),
+    ("Fanvil", ("X4U", "X3S"), "2.12.1"),
+    ("Polycom", ("VVX411", "VVX250"), "6.4.3.1"),
+    ("Cisco", ("CP-8841",), "12.8.1"),
+]
+
+CREATE_CHUNK = 1000
+
+
+def device_mac(index: int) -> str:
+    # prefixo 02: MAC localmente administrado, nunca colide com um aparelho real
+    return f"02{index:010x}"
+
+
+def unknown_mac(rng: random.Random) -> str:
+    return f"0e{rng.getrandbits(40):010x}"
+
+
+class Fleet:
+    def __init__(self, mongo, devices):
+        self.mongo = mongo
+        # [(mac, vendor, model, version)]
+        self.devices = devices
+
+    def user_agents(self, count: int, unknown_ratio: float = 0.0, seed: int = 0) -> list:
+        """count User-Agents drawn from the fleet; unknown_ratio of them carry unregistered MACs."""
+        rng = random.Random(seed)
+        agents = []
+        for _ in range(count):
+            if not self.devices or rng.random() < unknown_ratio:
+                vendor, models, version = rng.choice(VENDORS)
+                agents.append(f"{vendor} {rng.choice(models)} {version} {unknown_mac(rng)}")
+            else:
+                mac, vendor, model, version = rng.choice(self.devices)
+                agents.append(f"{vendor} {model} {version} {mac}")
+        return agents
+
+
+def template_docs(template_lines: int = 200) -> list:
+    body = vendor_xml_template(template_lines)
+    docs = []
+    for vendor, models, _ in VENDORS:
+        for model in models:
+            doc = {"_id": model.lower(), "model": model, "vendor": vendor, "extension": "xml"}
+            doc.update(template_keys(doc))
+            doc.update(encode_template_body(f"<!-- {vendor} {model} -->\n{body}"))
+            docs.append(doc)
+    return docs
+
+
+def build_fleet(devices: int = 1000, profiles: int = 10, template_lines: int = 200, seed: int = 0) -> Fleet:
+    """Create the synthetic fleet in the current database (which should be a throwaway one)."""
+    from core.models import DeviceConfig, DeviceProfile
+
+    rng = random.Random(seed)
+    DeviceProfile.objects.bulk_create([
+        DeviceProfile(name=f"bench-{i}", sip_server=f"sip{i}.bench.example", voice_codecs="PCMU,PCMA",
+                      vlan_active=bool(i % 2), vlan_id=100 + i if i % 2 else None)
+        for i in range(max(1, profiles))
+    ])
+    profile_ids = list(DeviceProfile.objects.filter(name__startswith="bench-").values_list("pk", flat=True))
+
+    fleet = []
+    batch = []
+    for i in range(devices):
+        vendor, models, version = rng.choice(VENDORS)
+        mac = device_mac(i)
+        fleet.append((mac, vendor, rng.choice(models), version))
+        batch.append(DeviceConfig(
+            identifier=f"{1000 + i}", mac_address=mac, profile_id=rng.choice(profile_ids),
+            user_register=f"{1000 + i}", passwd_register="bench", display_name=f"Ramal {1000 + i}",
+        ))
+        if len(batch) >= CREATE_CHUNK:
+            DeviceConfig.objects.bulk_create(batch)
+            batch = []
+    if batch:
+        DeviceConfig.objects.bulk_create(batch)
+
+    mongo = FakeMongoDB()
+    mongo.get_collection(TEMPLATES_COLLECTION).insert_many(template_docs(template_lines))
+    return Fleet(mongo, fleet)
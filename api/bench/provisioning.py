@@ -0,0 +1,297 @@
+"""
+Load benchmark of download-xml against a synthetic fleet (api.bench.fleet), fully offline:
+the SQL side is whatever database is active (the bench_provisioning command creates a
+throwaway SQLite test database) and Mongo is replaced by api.bench.fakemongo.
+
+Two drivers replay the same User-Agent list:
+ - client: django.test.Client in this thread (URL resolution, middleware, view; no sockets);
+ - wsgi:   Django's threaded WSGI server on 127.0.0.1 driven by `concurrency` keep-alive
+           http.client connections, i.e. the full request path of a real worker.
+
+Per driver: req/s, p50/p95/p99 latency, and SQL statements / Mongo reads per request.
+SQL is counted with connection.execute_wrapper() around request handling only, so the
+batched background writers (api.utils.events, api.utils.device_touch) are not included.
+Results can be saved as JSON and compared with an earlier run (save_results / compare).
+"""
+
+from contextlib import contextmanager
+import http.client
+import json
+import math
+import platform
+import subprocess
+import threading
+import time
+
+import django
+from django.db import connection
+
+from api.utils import (
+    compression, device_cache, device_touch, events, generations, known_devices, ratelimit, template_cache,
+)
+
+DRIVERS = ("client", "wsgi")
+URL = "/api/download-xml/"
+# métricas comparadas entre execuções: (chave, maior é melhor)
+COMPARED = (
+    ("rps", True),
+    ("p50_ms", False),
+    ("p95_ms", False),
+    ("p99_ms", False),
+    ("sql_per_request", False),
+    ("mongo_per_request", False),
+)
+# variação abaixo disso (em %) é tratada como ruído
+NOISE_PCT = 2.0
+
+
+def percentile(sorted_values: list, pct: float) -> float:
+    """Nearest-rank percentile of an already sorted list."""
+    if not sorted_values:
+        return 0.0
+    rank = max(1, math.ceil(pct / 100.0 * len(sorted_values)))
+    return sorted_values[min(rank, len(sorted_values)) - 1]
+
+
+class _QueryCounter:
+    """connection.execute_wrapper() hook counting SQL statements (thread-safe)."""
+
+    def __init__(self):
+        self.count = 0
+        self._lock = threading.Lock()
+
+    def __call__(self, execute, sql, params, many, context):
+        with self._lock:
+            self.count += 1
+        return execute(sql, params, many, context)
+
+
+@contextmanager
+def fake_mongo(db):
+    """Route api.views' Mongo lookups to db for the duration of the block."""
+    from api import views
+
+    original = views.get_mongo_client
+    views.get_mongo_client = lambda: db
+    try:
+        yield db
+    finally:
+        views.get_mongo_client = original
+
+
+def _reset_worker_state() -> None:
+    template_cache.clear()
+    device_cache.clear()
+    compression.clear()
+    known_devices.set_index(None)
+    ratelimit.set_limiter(None)
+    generations.set_generations(None)
+    # como um worker recém-iniciado (post_worker_init): filtro pronto antes do primeiro request
+    known_devices.warm_up()
+    index = known_devices.get_index()
+    if index is not None:
+        index.join()
+
+
+def _close_background_writers() -> None:
+    for previous in (events.set_recorder(None), device_touch.set_coalescer(None)):
+        if previous is not None:
+            previous.close()
+
+
+def _summarize(driver: str, latencies: list, statuses: dict, elapsed: float, sql: int, mongo: int) -> dict:
+    latencies = sorted(latencies)
+    n = len(latencies)
+    return {
+        "driver": driver,
+        "requests": n,
+        "rps": n / elapsed if elapsed > 0 else 0.0,
+        "p50_ms": percentile(latencies, 50) * 1000.0,
+        "p95_ms": percentile(latencies, 95) * 1000.0,
+        "p99_ms": percentile(latencies, 99) * 1000.0,
+        "sql_per_request": sql / n if n else 0.0,
+        "mongo_per_request": mongo / n if n else 0.0,
+        "statuses": {str(k): v for k, v in sorted(statuses.items())},
+    }
+
+
+def run_client(agents: list, mongo, warmup: int = 0) -> dict:
+    from django.test import Client
+
+    client = Client()
+    for ua in agents[:warmup]:
+        client.get(URL, HTTP_USER_AGENT=ua)
+
+    counter = _QueryCounter()
+    latencies = []
+    statuses = {}
+    mongo_before = mongo.queries
+    started = time.perf_counter()
+    with connection.execute_wrapper(counter):
+        for ua in agents:
+            t0 = time.perf_counter()
+            response = client.get(URL, HTTP_USER_AGENT=ua)
+            latencies.append(time.perf_counter() - t0)
+            statuses[response.status_code] = statuses.get(response.status_code, 0) + 1
+    elapsed = time.perf_counter() - started
+    return _summarize("client", latencies, statuses, elapsed, counter.count, mongo.queries - mongo_before)
+
+
+@contextmanager
+def wsgi_server(counter: _QueryCounter):
+    """Django's threaded WSGI server on an ephemeral port; yields the port."""
+    from django.core.handlers.wsgi import WSGIHandler
+    from django.core.servers.basehttp import ThreadedWSGIServer, WSGIRequestHandler
+
+    class QuietHandler(WSGIRequestHandler):
+        # sem isso cabeçalhos e corpo saem em segmentos separados e o ACK atrasado custa ~40 ms
+        disable_nagle_algorithm = True
+
+        def log_message(self, *args):
+            pass
+
+    handler = WSGIHandler()
+
+    def application(environ, start_response):
+        with connection.execute_wrapper(counter):
+            return handler(environ, start_response)
+
+    server = ThreadedWSGIServer(("127.0.0.1", 0), QuietHandler, allow_reuse_address=False)
+    server.set_app(application)
+    thread = threading.Thread(target=server.serve_forever, name="bench-wsgi", daemon=True)
+    thread.start()
+    try:
+        yield server.server_address[1]
+    finally:
+        server.shutdown()
+        server.server_close()
+        thread.join(timeout=5)
+
+
+def _replay(port: int, agents: list, concurrency: int, latencies: list, statuses: dict) -> float:
+    """Send agents over `concurrency` keep-alive connections; returns the wall time."""
+    lock = threading.Lock()
+    chunks = [agents[i::concurrency] for i in range(concurrency)]
+    errors = []
+
+    def worker(chunk):
+        conn = http.client.HTTPConnection("127.0.0.1", port, timeout=30)
+        local, codes = [], {}
+        try:
+            for ua in chunk:
+                t0 = time.perf_counter()
+                conn.request("GET", URL, headers={"User-Agent": ua, "Host": "127.0.0.1"})
+                response = conn.getresponse()
+                response.read()
+                local.append(time.perf_counter() - t0)
+                codes[response.status] = codes.get(response.status, 0) + 1
+        except Exception as exc:
+            errors.append(exc)
+        finally:
+            conn.close()
+        with lock:
+            latencies.extend(local)
+            for code, n in codes.items():
+                statuses[code] = statuses.get(code, 0) + n
+
+    threads = [threading.Thread(target=worker, args=(chunk,)) for chunk in chunks if chunk]
+    started = time.perf_counter()
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    elapsed = time.perf_counter() - started
+    if errors:
+        raise errors[0]
+    return elapsed
+
+
+def run_wsgi(agents: list, mongo, warmup: int = 0, concurrency: int = 4) -> dict:
+    concurrency = max(1, int(concurrency))
+    counter = _QueryCounter()
+    with wsgi_server(counter) as port:
+        if warmup:
+            _replay(port, agents[:warmup], concurrency, [], {})
+        counter.count = 0
+        latencies = []
+        statuses = {}
+        mongo_before = mongo.queries
+        elapsed = _replay(port, agents, concurrency, latencies, statuses)
+    return _summarize("wsgi", latencies, statuses, elapsed, counter.count, mongo.queries - mongo_before)
+
+
+def run(fleet, requests: int = 2000, drivers=DRIVERS, warmup: int = 200, concurrency: int = 4,
+        unknown_ratio: float = 0.05, seed: int = 0) -> list:
+    """
+    Replay `requests` User-Agents from fleet through each driver. Every driver starts from
+    cold per-worker caches; the first `warmup` agents are sent (unmeasured) before the run.
+    """
+    agents = fleet.user_agents(requests, unknown_ratio=unknown_ratio, seed=seed)
+    rows = []
+    with fake_mongo(fleet.mongo):
+        for driver in drivers:
+            if driver not in DRIVERS:
+                raise ValueError(f"unknown driver {driver!r}; use one of {DRIVERS}")
+            _reset_worker_state()
+            if driver == "client":
+                row = run_client(agents, fleet.mongo, warmup=warmup)
+            else:
+                row = run_wsgi(agents, fleet.mongo, warmup=warmup, concurrency=concurrency)
+            row["concurrency"] = 1 if driver == "client" else concurrency
+            rows.append(row)
+        _close_background_writers()
+    return rows
+
+
+def _git_revision() -> str:
+    try:
+        out = subprocess.run(["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True, timeout=5)
+        return out.stdout.strip()
+    except Exception:
+        return ""
+
+
+def save_results(path: str, rows: list, params: dict) -> dict:
+    data = {
+        "meta": {
+            "created": time.strftime("%Y-%m-%dT%H:%M:%S%z"),
+            "git": _git_revision(),
+            "python": platform.python_version(),
+            "django": django.get_version(),
+            "database": connection.vendor,
+            "params": params,
+        },
+        "rows": rows,
+    }
+    with open(path, "w", encoding="utf-8") as fh:
+        json.dump(data, fh, indent=2, sort_keys=True)
+    return data
+
+
+def load_results(path: str) -> dict:
+    with open(path, "r", encoding="utf-8") as fh:
+        return json.load(fh)
+
+
+def compare(rows: list, baseline: list) -> list:
+    """
+    Per driver present in both runs: [(driver, metric, before, after, change %, verdict)],
+    verdict being "better", "worse" or "same" (change within NOISE_PCT).
+    """
+    before = {row["driver"]: row for row in baseline}
+    out = []
+    for row in rows:
+        old = before.get(row["driver"])
+        if old is None:
+            continue
+        for metric, higher_is_better in COMPARED:
+            a, b = old.get(metric), row.get(metric)
+            if a is None or b is None:
+                continue
+            change = ((b - a) / a * 100.0) if a else 0.0
+            if abs(change) < NOISE_PCT:
+                verdict = "same"
+            else:
+                verdict = "better" if (b > a) == higher_is_better else "worse"
+            out.append((row["driver"], metric, a, b, change, verdict))
+    return out
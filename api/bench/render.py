@@ -0,0 +1,106 @@
+"""
+Render micro-benchmark: today's request path vs. the compiled RenderPlan.
+
+Compares, on a synthetic large vendor XML template:
+ - parse + render + regex: Template(template_str) per call, Django render, %%...%% regex pass
+   (what download_config did per request before the template cache);
+ - cached Template + regex: parse once, Django render + regex pass per call;
+ - render plan: compile_plan() once, single-pass render per call.
+"""
+
+import time
+
+from django.template import Context, Template
+
+from api.utils.render_plan import compile_plan, substitute_percent_placeholders
+
+
+def vendor_xml_template(lines: int = 2000) -> str:
+    """Yealink-like XML config with a mix of {{ name }} and %%name%% placeholders."""
+    rows = ['<?xml version="1.0" encoding="UTF-8"?>', "<config>"]
+    for i in range(lines):
+        mod = i % 8
+        if mod == 0:
+            rows.append(f'  <item key="account.{i}.sip_server.1.address">{{{{ sipserver }}}}</item>')
+        elif mod == 1:
+            rows.append(f'  <item key="account.{i}.sip_server.1.port">%%port%%</item>')
+        elif mod == 2:
+            rows.append(f'  <item key="account.{i}.user_name">%%user%%</item>')
+        elif mod == 3:
+            rows.append(f'  <item key="account.{i}.display_name">{{{{ displayname }}}}</item>')
+        elif mod == 4:
+            rows.append(f'  <item key="network.vlan.{i}.enable">%%vlanactive%%</item>')
+        else:
+            rows.append(f'  <item key="features.static.{i}">static-value-{i}</item>')
+    rows.append("</config>")
+    return "\n".join(rows)
+
+
+def sample_context() -> dict:
+    return {
+        "vendor": "Yealink",
+        "model": "T46S",
+        "version": "66.86.0.15",
+        "identifier": "1001",
+        "account": "1001",
+        "displayname": "Recepção & Cia",
+        "user": "1001",
+        "passwd": "secret",
+        "macaddress": "001565aabbcc",
+        "sipserver": "sip.example.com",
+        "port": 5060,
+        "vlanactive": True,
+        "vlanid": 20,
+        "codecs": "PCMU,PCMA",
+    }
+
+
+def _per_call(fn, iterations: int, repeats: int = 3) -> float:
+    """Best-of-repeats seconds per call."""
+    best = None
+    for _ in range(repeats):
+        start = time.perf_counter()
+        for _ in range(iterations):
+            fn()
+        elapsed = (time.perf_counter() - start) / iterations
+        best = elapsed if best is None else min(best, elapsed)
+    return best
+
+
+def run(lines: int = 2000, iterations: int = 200) -> list:
+    template_str = vendor_xml_template(lines)
+    context = sample_context()
+    parsed = Template(template_str)
+    plan = compile_plan(template_str)
+
+    def parse_render_regex():
+        rendered = Template(template_str).render(Context(context))
+        return substitute_percent_placeholders(rendered, context)
+
+    def cached_template_regex():
+        return substitute_percent_placeholders(parsed.render(Context(context)), context)
+
+    def render_plan():
+        return plan.render(context)
+
+    expected = parse_render_regex()
+    variants = [
+        ("parse + render + regex", parse_render_regex),
+        ("cached Template + regex", cached_template_regex),
+        ("render plan", render_plan),
+    ]
+    for name, fn in variants:
+        if fn() != expected:
+            raise AssertionError(f"{name} output differs from the legacy pipeline")
+
+    rows = []
+    baseline = None
+    for name, fn in variants:
+        seconds = _per_call(fn, iterations)
+        baseline = baseline or seconds
+        rows.append({
+            "variant": name,
+            "ms_per_call": seconds * 1000.0,
+            "speedup": baseline / seconds if seconds else 0.0,
+        })
+    return rows
@@ -0,0 +1,82 @@
+"""
+User-Agent parsing micro-benchmark over a corpus of real phone UAs.
+
+Compares, per UA:
+ - legacy split: the old whitespace split into 'vendor model version identifier' (which
+   mis-parses or rejects the Grandstream/Polycom/Cisco formats);
+ - registry, uncached: first-token dispatch + vendor regex (UserAgentRegistry.parse_uncached);
+ - registry, memoized: the same through the LRU keyed by the raw UA (what download_config uses).
+"""
+
+import time
+
+from api.utils.user_agents import UserAgentRegistry
+
+CORPUS = (
+    "Yealink SIP-T46S 66.86.0.15 80:5e:c0:12:34:56",
+    "Yealink SIP-T54W 96.86.0.70 249ad8aabbcc",
+    "Yealink W60B 77.83.0.85 80:5e:c0:ab:cd:ef",
+    "Fanvil X4 2.4.5.1 0c383e112233",
+    "Fanvil X3SG 2.12.16 0c:38:3e:3f:5a:6b",
+    "Grandstream Model HW GXP2170 SW 1.0.11.3 DevId 000b82aabbcc",
+    "Grandstream Model HW GRP2614 V1.0A SW 1.0.5.15 DevId c074ad112233",
+    "Grandstream GXP2000 (HW 1.0, SW 1.0.9.69, DevId 000b82a1b2c3)",
+    "FileTransport PolycomVVX-VVX_411-UA/5.9.5.0614 (SN:0004f2aabbcc) Type/Application",
+    "FileTransport PolycomRealPresenceTrio-Trio_8800-UA/5.4.1.16972 (SN:64167f001122) Type/Application",
+    "PolycomSoundPointIP-SPIP_450-UA/4.0.3.7562 (SN:0004f2ddeeff)",
+    "Cisco/SPA504G-7.5.5 (0018B9AABBCC)(CCQ162306EA)",
+    "Cisco-CP-7841-3PCC/11.3.1 (00562b043615)",
+    "Linksys/SPA942-6.1.5(a) (4FFF00000000)",
+    "Ale H2P 2.10 3c28a60357a0",
+)
+
+
+def legacy_split(user_agent: str):
+    parts = (user_agent or "").strip().split()
+    if len(parts) < 4:
+        return None
+    return parts[0], parts[1], parts[2], " ".join(parts[3:])
+
+
+def fleet_agents(corpus=CORPUS, devices: int = 500) -> list:
+    """One UA per phone: the corpus formats with a distinct MAC-ish suffix per device."""
+    agents = []
+    for i in range(devices):
+        ua = corpus[i % len(corpus)]
+        agents.append(ua.replace("aabbcc", f"{i:06x}", 1) if "aabbcc" in ua else ua)
+    return agents
+
+
+def _per_call(fn, agents: list, repeats: int = 3) -> float:
+    """Best-of-repeats seconds per UA."""
+    best = None
+    for _ in range(repeats):
+        start = time.perf_counter()
+        for ua in agents:
+            fn(ua)
+        elapsed = (time.perf_counter() - start) / len(agents)
+        best = elapsed if best is None else min(best, elapsed)
+    return best
+
+
+def run(devices: int = 500, rounds: int = 20) -> list:
+    agents = fleet_agents(devices=devices) * rounds
+    registry = UserAgentRegistry()
+    variants = [
+        ("legacy split", legacy_split),
+        ("registry, uncached", registry.parse_uncached),
+        ("registry, memoized", registry.parse),
+    ]
+    rows = []
+    baseline = None
+    for name, fn in variants:
+        seconds = _per_call(fn, agents)
+        baseline = baseline or seconds
+        accepted = sum(1 for ua in CORPUS if fn(ua) is not None)
+        rows.append({
+            "variant": name,
+            "us_per_call": seconds * 1e6,
+            "speedup": baseline / seconds if seconds else 0.0,
+            "accepted": f"{accepted}/{len(CORPUS)}",
+        })
+    return rows
@@ -0,0 +1,96 @@
+import os
+import shutil
+import tempfile
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+from django.test.utils import override_settings, setup_test_environment, teardown_test_environment
+
+from api.bench import fleet as bench_fleet
+from api.bench import provisioning as bench
+
+
+class Command(BaseCommand):
+    help = (
+        "Load benchmark of download-xml on a synthetic fleet: throwaway SQLite test database, "
+        "in-process Mongo stand-in, Django test Client and/or a real threaded WSGI server."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--devices", type=int, default=2000, help="DeviceConfig rows in the synthetic fleet.")
+        parser.add_argument("--profiles", type=int, default=20, help="DeviceProfile rows.")
+        parser.add_argument("--requests", type=int, default=2000, help="Measured requests per driver.")
+        parser.add_argument("--warmup", type=int, default=200, help="Unmeasured requests sent first (0 = cold caches).")
+        parser.add_argument("--driver", choices=bench.DRIVERS + ("both",), default="both")
+        parser.add_argument("--concurrency", type=int, default=4, help="Keep-alive connections for the wsgi driver.")
+        parser.add_argument("--unknown-ratio", type=float, default=0.05,
+                            help="Fraction of requests with an unregistered MAC (scanners, new phones).")
+        parser.add_argument("--template-lines", type=int, default=200, help="<item> lines per synthetic template.")
+        parser.add_argument("--seed", type=int, default=0)
+        parser.add_argument("--output", help="Save results as JSON to this path.")
+        parser.add_argument("--compare", help="JSON results of an earlier run to compare against.")
+
+    def handle(self, *args, **options):
+        if connection.vendor != "sqlite":
+            raise CommandError(
+                "bench_provisioning runs on SQLite only; use e.g. DJANGO_SETTINGS_MODULE=provision.settings_local"
+            )
+        baseline = None
+        if options["compare"]:
+            try:
+                baseline = bench.load_results(options["compare"])
+            except (OSError, ValueError) as exc:
+                raise CommandError(f"cannot read {options['compare']}: {exc}")
+
+        drivers = bench.DRIVERS if options["driver"] == "both" else (options["driver"],)
+        params = {k: options[k] for k in ("devices", "profiles", "requests", "warmup", "concurrency",
+                                          "unknown_ratio", "template_lines", "seed")}
+        params["drivers"] = list(drivers)
+
+        tmpdir = tempfile.mkdtemp(prefix="bench-provisioning-")
+        # banco de teste em arquivo: as threads do servidor WSGI abrem suas próprias conexões
+        connection.settings_dict.setdefault("TEST", {})["NAME"] = os.path.join(tmpdir, "bench.sqlite3")
+        setup_test_environment()
+        old_name = connection.creation.create_test_db(verbosity=0, autoclobber=True, serialize=False)
+        try:
+            # a frota inteira vem de 127.0.0.1 e repete MACs: sem limites de taxa no benchmark
+            no_limits = dict(getattr(settings, "PROVISION_RATE_LIMIT", None) or {}, ENABLED=False)
+            with override_settings(ALLOWED_HOSTS=[*settings.ALLOWED_HOSTS, "127.0.0.1"], PROVISION_RATE_LIMIT=no_limits):
+                self.stdout.write(f"Building fleet: {options['devices']} devices, {options['profiles']} profiles")
+                fleet = bench_fleet.build_fleet(
+                    devices=options["devices"], profiles=options["profiles"],
+                    template_lines=options["template_lines"], seed=options["seed"],
+                )
+                rows = bench.run(
+                    fleet, requests=options["requests"], drivers=drivers, warmup=options["warmup"],
+                    concurrency=options["concurrency"], unknown_ratio=options["unknown_ratio"], seed=options["seed"],
+                )
+        finally:
+            connection.creation.destroy_test_db(old_name, verbosity=0)
+            teardown_test_environment()
+            shutil.rmtree(tmpdir, ignore_errors=True)
+
+        self._print_rows(rows)
+        if baseline is not None:
+            self._print_comparison(bench.compare(rows, baseline.get("rows") or []), baseline.get("meta") or {})
+        if options["output"]:
+            bench.save_results(options["output"], rows, params)
+            self.stdout.write(f"Results saved to {options['output']}")
+
+    def _print_rows(self, rows):
+        self.stdout.write(f"  {'driver':<7} {'req/s':>9} {'p50 ms':>8} {'p95 ms':>8} {'p99 ms':>8} {'sql/req':>8} {'mongo/req':>9}  statuses")
+        for row in rows:
+            self.stdout.write(
+                f"  {row['driver']:<7} {row['rps']:9.1f} {row['p50_ms']:8.2f} {row['p95_ms']:8.2f} {row['p99_ms']:8.2f} "
+                f"{row['sql_per_request']:8.2f} {row['mongo_per_request']:9.3f}  {row['statuses']}"
+            )
+
+    def _print_comparison(self, changes, meta):
+        self.stdout.write(f"Compared with {meta.get('created', '?')} (git {meta.get('git') or '?'}):")
+        if not changes:
+            self.stdout.write("  no driver in common")
+        styles = {"better": self.style.SUCCESS, "worse": self.style.WARNING}
+        for driver, metric, before, after, change, verdict in changes:
+            mark = styles.get(verdict, str)(verdict)
+            self.stdout.write(f"  {driver:<7} {metric:<18} {before:10.3f} -> {after:10.3f}  {change:+7.1f}%  {mark}")
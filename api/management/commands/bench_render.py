@@ -0,0 +1,18 @@
+from django.core.management.base import BaseCommand
+
+from api.bench import render as render_bench
+
+
+class Command(BaseCommand):
+    help = "Micro-benchmark: Django Template + %%...%% regex pass vs. compiled RenderPlan on a large vendor XML template."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--lines", type=int, default=2000, help="Number of <item> lines in the synthetic template.")
+        parser.add_argument("--iterations", type=int, default=200, help="Render calls per measurement.")
+
+    def handle(self, *args, **options):
+        lines = options["lines"]
+        iterations = options["iterations"]
+        self.stdout.write(f"Template: {lines} lines, {iterations} renders per measurement (best of 3)")
+        for row in render_bench.run(lines=lines, iterations=iterations):
+            self.stdout.write(f"  {row['variant']:<26} {row['ms_per_call']:9.3f} ms/call  x{row['speedup']:.1f}")
@@ -0,0 +1,21 @@
+from django.core.management.base import BaseCommand
+
+from api.bench import user_agents as ua_bench
+
+
+class Command(BaseCommand):
+    help = "Micro-benchmark: legacy User-Agent split vs. the vendor parser registry (uncached and memoized)."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--devices", type=int, default=500, help="Distinct User-Agents in the synthetic fleet.")
+        parser.add_argument("--rounds", type=int, default=20, help="Times each User-Agent is parsed per measurement.")
+
+    def handle(self, *args, **options):
+        devices = options["devices"]
+        rounds = options["rounds"]
+        self.stdout.write(f"Fleet: {devices} User-Agents x {rounds} rounds per measurement (best of 3)")
+        for row in ua_bench.run(devices=devices, rounds=rounds):
+            self.stdout.write(
+                f"  {row['variant']:<20} {row['us_per_call']:8.2f} us/call  x{row['speedup']:.1f}"
+                f"  corpus accepted {row['accepted']}"
+            )
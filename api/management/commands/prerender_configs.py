@@ -0,0 +1,44 @@
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import close_old_connections
+
+from api.prerender import DEFAULT_BATCH_SIZE, prerender
+from api.utils.artifacts import ArtifactStore, _artifact_settings
+
+
+class Command(BaseCommand):
+    help = (
+        "Pre-render every provisioned device's configuration into the content-addressed artifact store, "
+        "re-rendering only devices whose device/profile/template/User-Agent changed since the last run."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--dir", help="Artifact directory (default: settings.PROVISION_ARTIFACTS['DIR']).")
+        parser.add_argument("--workers", type=int, help="Render processes (0 = in-process; default: settings or CPU count).")
+        parser.add_argument("--batch-size", type=int, default=DEFAULT_BATCH_SIZE, help="Devices per pool task.")
+        parser.add_argument("--force", action="store_true", help="Re-render every device.")
+        parser.add_argument("--prune", action="store_true", help="Delete artifacts no longer referenced.")
+        parser.add_argument("--interval", type=float, default=0,
+                            help="Keep running, one pass every N seconds (periodic job / sidecar).")
+
+    def handle(self, *args, **options):
+        conf = _artifact_settings()
+        root = options["dir"] or conf.get("DIR")
+        if not root:
+            raise CommandError(
+                "No artifact directory: set PROVISION_ARTIFACTS_DIR (a volume mounted on the web instances too) "
+                "or pass --dir."
+            )
+        workers = options["workers"] if options["workers"] is not None else conf.get("WORKERS")
+        store = ArtifactStore(root)
+
+        while True:
+            stats = prerender(store, workers=workers, batch_size=options["batch_size"],
+                              force=options["force"], prune=options["prune"])
+            line = stats.summary() + (f", {stats.pruned} files pruned" if options["prune"] else "")
+            self.stdout.write(self.style.SUCCESS(line) if not stats.failed else self.style.WARNING(line))
+            if not options["interval"]:
+                break
+            close_old_connections()
+            time.sleep(options["interval"])
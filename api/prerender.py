@@ -0,0 +1,240 @@
+"""
+Incremental pre-render of device configurations into the artifact store (api.utils.artifacts).
+
+For every DeviceConfig with a successful download in Provisioning, the last User-Agent and
+filename seen for it tell which template and context download-xml would use. The ETag of that
+render (api.views.config_validators) is computed without rendering; devices whose ETag is
+already in the store are skipped, so a run only re-renders devices whose DeviceConfig/
+DeviceProfile updated_at, template version or User-Agent changed.
+
+Rendering is spread over a process pool: work is grouped by template, each task carries the
+template text once plus a batch of contexts, and workers write the artifacts themselves.
+"""
+
+from concurrent.futures import ProcessPoolExecutor
+import logging
+import multiprocessing
+import os
+import time
+
+from django.db.models import Max
+
+from api.utils import compression
+from api.utils.templates import template_text
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_BATCH_SIZE = 500
+
+_worker_plans = {}
+
+
+class PrerenderStats:
+    def __init__(self):
+        self.devices = 0
+        self.no_user_agent = 0
+        self.no_template = 0
+        self.unchanged = 0
+        self.rendered = 0
+        self.failed = 0
+        self.pruned = 0
+        self.started = time.monotonic()
+        self.elapsed = 0.0
+
+    def summary(self) -> str:
+        return (
+            f"{self.devices} devices: {self.rendered} rendered, {self.unchanged} unchanged, "
+            f"{self.no_user_agent} never provisioned, {self.no_template} without template, "
+            f"{self.failed} failed in {self.elapsed:.2f}s"
+        )
+
+
+def last_user_agents() -> dict:
+    """device_id -> (user_agent, filename) of its last successful download-xml."""
+    from core.models import Provisioning
+
+    last_ids = (
+        Provisioning.objects.filter(status=Provisioning.STATUS_OK, device__isnull=False)
+        .values("device_id").annotate(last_id=Max("id")).values("last_id")
+    )
+    rows = Provisioning.objects.filter(id__in=last_ids).values_list("device_id", "user_agent", "filename")
+    return {device_id: (user_agent, filename) for device_id, user_agent, filename in rows.iterator()}
+
+
+def _render_batch(template_id, version, template_str, root, items):
+    """Process-pool task: render items [(key, etag, context)] and store them. Returns [(key, etag, sha|None)]."""
+    from api.utils.artifacts import ArtifactStore
+    from api.utils.render_plan import compile_plan
+
+    plan = _worker_plans.get((template_id, version))
+    if plan is None:
+        plan = _worker_plans[(template_id, version)] = compile_plan(template_str)
+    store = ArtifactStore(root)
+    codings = compression.available_codings()
+    results = []
+    for key, etag, context in items:
+        try:
+            content = plan.render(context).encode("utf-8")
+            sha = store.put(etag, content)
+            # variantes gzip/br prontas para o download-xml (e para o gzip_static do nginx)
+            for coding in codings:
+                if compression.should_compress(content, coding):
+                    store.put_encoded(sha, coding, compression.compress(content, coding))
+            results.append((key, etag, sha))
+        except Exception:
+            logger.exception("Pre-render failed for %s", key)
+            results.append((key, etag, None))
+    return results
+
+
+def _init_worker():
+    import django
+    from django.apps import apps
+
+    if not apps.ready:
+        django.setup()
+
+
+def _load_template(views, template_cache, template_ref, model_q, ext):
+    """(CachedTemplate, template text) para a chave, ou None se ausente/inválido."""
+    doc = views.get_template_body(views.get_template_from_mongo(model_q, ext, template_ref))
+    try:
+        text = template_text(doc)
+    except ValueError:
+        logger.exception("Template %s has an unreadable body; skipping its devices", doc.get("_id"))
+        return None
+    if not isinstance(text, str):
+        return None
+    try:
+        return template_cache.build_entry(doc, text), text
+    except Exception:
+        logger.exception("Template %s cannot be compiled; skipping its devices", doc.get("_id"))
+        return None
+
+
+def _pending_work(store, manifest, stats, force):
+    """Yield (template_key, template_str, key, etag, context, mac, ext) for devices that need a render."""
+    from api import views
+    from api.utils import template_cache
+    from core.models import DeviceConfig
+
+    user_agents = last_user_agents()
+    templates = {}
+    for device in DeviceConfig.objects.select_related("profile").order_by("pk").iterator(chunk_size=2000):
+        stats.devices += 1
+        seen = user_agents.get(device.pk)
+        ua_data = views.parse_user_agent_string(seen[0]) if seen else None
+        if not ua_data:
+            stats.no_user_agent += 1
+            continue
+        ext = views.config_extension(seen[1])
+        model_q = (ua_data[1] or "").strip().lower()
+        template_ref = device.profile.template_ref if device.profile else None
+
+        tkey = template_cache.lookup_key(template_ref, model_q, ext)
+        if tkey not in templates:
+            templates[tkey] = _load_template(views, template_cache, template_ref, model_q, ext)
+        resolved = templates[tkey]
+        if resolved is None:
+            stats.no_template += 1
+            continue
+        entry, text = resolved
+
+        key = f"{device.pk}.{ext}"
+        etag, _ = views.config_validators(device, entry, ua_data, ext)
+        previous = manifest.get(key)
+        if not force and previous and previous["etag"] == etag and store.has(etag):
+            stats.unchanged += 1
+            continue
+        yield (entry.template_id, entry.version), text, key, etag, views.build_context(device, ua_data), device.mac_address, ext
+
+
+class _InlineExecutor:
+    """Executor mínimo para workers=0: executa cada tarefa na hora, no próprio processo."""
+
+    class _Done:
+        def __init__(self, value):
+            self._value = value
+
+        def done(self):
+            return True
+
+        def result(self):
+            return self._value
+
+    def submit(self, fn, *args):
+        return self._Done(fn(*args))
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+
+def prerender(store, workers: int = None, batch_size: int = DEFAULT_BATCH_SIZE, force: bool = False,
+              prune: bool = False) -> PrerenderStats:
+    """
+    Run one incremental pre-render pass into store. workers=None uses os.cpu_count() processes,
+    workers=0 renders in this process. Only one batch per template is held in memory at a time
+    (plus batches in flight in the pool).
+    """
+    from core.models import DeviceConfig
+
+    stats = PrerenderStats()
+    manifest = store.load_manifest()
+    current = dict(manifest)
+    batch_size = max(1, int(batch_size))
+
+    max_in_flight = 2 * (workers or os.cpu_count() or 1)
+    if workers == 0:
+        executor = _InlineExecutor()
+    else:
+        # spawn: os workers não herdam conexões de banco nem os threads de gravação deste processo
+        executor = ProcessPoolExecutor(max_workers=workers or os.cpu_count(), initializer=_init_worker,
+                                       mp_context=multiprocessing.get_context("spawn"))
+
+    devices = {}
+    texts = {}
+    batches = {}
+    futures = []
+
+    def submit(tkey, items):
+        futures.append(executor.submit(_render_batch, tkey[0], tkey[1], texts[tkey], store.root, items))
+
+    def collect(block: bool):
+        for future in list(futures):
+            if not block and not future.done():
+                continue
+            futures.remove(future)
+            for key, etag, sha in future.result():
+                mac, ext = devices.pop(key)
+                if sha is None:
+                    stats.failed += 1
+                    continue
+                store.link_device(ext, mac, sha)
+                current[key] = {"etag": etag, "sha256": sha, "mac": mac}
+                stats.rendered += 1
+
+    with executor:
+        for tkey, text, key, etag, context, mac, ext in _pending_work(store, manifest, stats, force):
+            devices[key] = (mac, ext)
+            texts[tkey] = text
+            items = batches.setdefault(tkey, [])
+            items.append((key, etag, context))
+            if len(items) >= batch_size:
+                submit(tkey, batches.pop(tkey))
+                collect(block=len(futures) >= max_in_flight)
+        for tkey, items in batches.items():
+            submit(tkey, items)
+        collect(block=True)
+
+    # devices removidos saem do manifest
+    existing = {str(pk) for pk in DeviceConfig.objects.values_list("pk", flat=True)}
+    current = {k: v for k, v in current.items() if k.split(".", 1)[0] in existing}
+    store.save_manifest(current)
+    if prune:
+        stats.pruned = store.prune(current)
+    stats.elapsed = time.monotonic() - stats.started
+    logger.info("Pre-render finished: %s", stats.summary())
+    return stats
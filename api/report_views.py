@@ -0,0 +1,54 @@
+from django.http import JsonResponse
+from django.views.decorators.http import require_GET
+from oauth2_provider.decorators import protected_resource
+
+from core import rollups
+
+# group_by accepted by the API -> rollup column
+GROUP_BY_FIELDS = {
+    "bucket": "bucket", "vendor": "vendor", "model": "model", "version": "version",
+    "status": "status", "profile": "profile_pk",
+}
+DEFAULT_GROUP_BY = ("vendor", "model", "status")
+MAX_ROWS = 5000
+
+
+@require_GET
+@protected_resource(scopes=["read"])
+def provisioning_stats(request, *args, **kwargs):
+    """
+    Provisioning counts read only from the hourly/daily rollup tables (core.rollups).
+
+    Query parameters:
+      - period: "hour" (default, last 24 h) or "day" (last 30 days);
+      - since / until: ISO 8601 bounds (UTC when no offset is given);
+      - vendor, model, version, status, profile: exact-match filters;
+      - group_by: comma-separated subset of bucket,vendor,model,version,status,profile.
+    Requires an OAuth2 token with the 'read' scope.
+    """
+    try:
+        params = rollups.report_params(request.GET)
+    except ValueError as exc:
+        return JsonResponse({"error": str(exc)}, status=400)
+
+    requested = request.GET.get("group_by")
+    names = [g.strip() for g in requested.split(",") if g.strip()] if requested else list(DEFAULT_GROUP_BY)
+    unknown = [g for g in names if g not in GROUP_BY_FIELDS]
+    if unknown:
+        return JsonResponse({"error": f"invalid group_by: {', '.join(unknown)}"}, status=400)
+    group_by = [GROUP_BY_FIELDS[g] for g in names]
+
+    rows = rollups.query(group_by=group_by, limit=MAX_ROWS, **params)
+    for row in rows:
+        if "bucket" in row:
+            row["bucket"] = row["bucket"].isoformat()
+        if "profile_pk" in row:
+            row["profile"] = row.pop("profile_pk") or None
+    return JsonResponse({
+        "period": params["period"],
+        "since": params["since"].isoformat(),
+        "until": params["until"].isoformat() if params["until"] else None,
+        "group_by": names,
+        "rows": rows,
+        "truncated": len(rows) >= MAX_ROWS,
+    })
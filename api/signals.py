@@ -0,0 +1,34 @@
+"""
+Invalidação (e atualização do filtro de dispositivos conhecidos) dos caches por worker do download-xml quando devices/perfis mudam.
+
+Conectado em ApiConfig.ready(). Com um cache compartilhado, perfis não varrem o cache: o
+save/delete avança a geração do perfil (api.utils.generations) e as entradas dos seus devices
+deixam de valer em todos os workers. Sem ele, a varredura local continua.
+QuerySet.update()/bulk_create não disparam estes signals; nesses casos as entradas expiram
+pelo TTL de settings.PROVISION_DEVICE_CACHE.
+"""
+
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+
+from api.utils import device_cache, generations, known_devices
+from core.models import DeviceConfig, DeviceProfile
+
+
+@receiver(post_save, sender=DeviceConfig, dispatch_uid="api.device_cache.device_saved")
+@receiver(post_delete, sender=DeviceConfig, dispatch_uid="api.device_cache.device_deleted")
+def invalidate_device_cache(sender, instance, **kwargs):
+    device_cache.invalidate_device(pk=instance.pk, mac_address=instance.mac_address,
+                                   identifier=instance.identifier)
+    if kwargs.get("signal") is post_save:
+        known_devices.note_device(instance.mac_address, instance.identifier)
+
+
+@receiver(post_save, sender=DeviceProfile, dispatch_uid="api.device_cache.profile_saved")
+@receiver(post_delete, sender=DeviceProfile, dispatch_uid="api.device_cache.profile_deleted")
+def invalidate_profile_cache(sender, instance, **kwargs):
+    generations.bump_profile(instance.pk)
+    if not generations.is_shared():
+        # gerações desativadas ou fora de um cache compartilhado: varredura local
+        # (outros workers esperam o TTL)
+        device_cache.invalidate_profile(instance.pk)
@@ -0,0 +1,55 @@
+import pytest
+
+from api import views
+from api.bench import fleet as bench_fleet
+from api.bench import provisioning as bench
+from api.bench.fakemongo import FakeMongoDB
+from api.utils.templates import TEMPLATES_COLLECTION
+
+
+def test_percentile_nearest_rank():
+    values = list(range(1, 101))
+    assert bench.percentile(values, 50) == 50
+    assert bench.percentile(values, 99) == 99
+    assert bench.percentile([], 95) == 0.0
+    assert bench.percentile([7], 99) == 7
+
+
+def test_fake_mongo_runs_template_lookup_pipeline():
+    db = FakeMongoDB()
+    db.get_collection(TEMPLATES_COLLECTION).insert_many([
+        {"_id": "fallback", "model_lc": "other", "extension": "xml", "template": "generic"},
+        {"_id": "sip-t46s", "model_lc": "sip-t46s", "extension": "xml", "template": "t46s"},
+    ])
+    doc = next(db.device_templates.aggregate(views._template_lookup_pipeline(None, "sip-t46s", "xml")))
+    assert doc["template"] == "t46s"
+    assert "_rank" not in doc
+    doc = next(db.device_templates.aggregate(views._template_lookup_pipeline(None, "gxp2170", "xml")))
+    assert doc["template"] == "generic"
+    assert db.queries == 2
+
+
+def test_compare_flags_regressions_and_ignores_noise():
+    before = [{"driver": "client", "rps": 100.0, "p50_ms": 2.0, "p95_ms": 5.0, "p99_ms": 9.0,
+               "sql_per_request": 1.0, "mongo_per_request": 0.0}]
+    after = [{"driver": "client", "rps": 150.0, "p50_ms": 2.01, "p95_ms": 6.0, "p99_ms": 9.0,
+              "sql_per_request": 0.0, "mongo_per_request": 0.0}]
+    verdicts = {metric: verdict for _, metric, _, _, _, verdict in bench.compare(after, before)}
+    assert verdicts["rps"] == "better"
+    assert verdicts["p50_ms"] == "same"
+    assert verdicts["p95_ms"] == "worse"
+    assert verdicts["sql_per_request"] == "better"
+
+
+@pytest.mark.django_db
+def test_client_driver_on_synthetic_fleet():
+    fleet = bench_fleet.build_fleet(devices=20, profiles=2, template_lines=10)
+    rows = bench.run(fleet, requests=60, drivers=("client",), warmup=60, unknown_ratio=0.0)
+    (row,) = rows
+    assert row["driver"] == "client"
+    assert row["requests"] == 60
+    assert row["statuses"] == {"200": 60}
+    # o aquecimento repete os mesmos User-Agents: aparelhos e templates já estão em cache
+    assert row["sql_per_request"] == 0
+    assert row["mongo_per_request"] == 0
+    assert views.get_mongo_client is not fleet.mongo
@@ -0,0 +1,96 @@
+import pytest
+from django.test import Client, RequestFactory
+
+import api.views as views
+from api.utils import client_ip, events, ratelimit
+from api.utils.client_ip import ClientIPResolver, TrustedNetworks
+from core.models import Provisioning
+
+
+def test_trusted_networks_match_by_prefix():
+    trusted = TrustedNetworks(["10.0.0.0/8", "192.168.1.0/24", "2001:db8::/32"])
+    ip = client_ip._parse_ip
+    assert ip("10.20.30.40") in trusted
+    assert ip("192.168.1.7") in trusted
+    assert ip("192.168.2.7") not in trusted
+    assert ip("2001:db8::1") in trusted
+    assert ip("::ffff:10.1.1.1") in trusted
+    assert ip("8.8.8.8") not in trusted
+
+
+@pytest.mark.parametrize("xff,remote,expected", [
+    # proxy confiável: o hop mais à direita não confiável é o cliente, mesmo com lixo à esquerda
+    ("1.1.1.1, 5.6.7.8, 10.0.0.2", "127.0.0.1", ("5.6.7.8", None)),
+    ("192.168.0.5, 1.2.3.4", "10.0.0.1", ("1.2.3.4", "192.168.0.5")),
+    # REMOTE_ADDR não confiável: X-Forwarded-For forjado é ignorado
+    ("1.1.1.1", "9.9.9.9", ("9.9.9.9", None)),
+    # só proxies confiáveis: aparelho na mesma LAN
+    ("192.168.0.50, 10.0.0.2", "127.0.0.1", ("192.168.0.50", "192.168.0.50")),
+    # hop inválido interrompe a caminhada
+    ("garbage, 10.0.0.2", "127.0.0.1", ("10.0.0.2", "10.0.0.2")),
+    ("", "bogus", (None, None)),
+])
+def test_resolver_walks_forwarded_for_right_to_left(xff, remote, expected):
+    # loopback + a faixa do load balancer (10.0.0.0/8)
+    assert ClientIPResolver(("127.0.0.0/8", "10.0.0.0/8")).resolve(xff, remote) == expected
+
+
+def test_private_addresses_are_not_trusted_by_default():
+    # aparelho atrás de um proxy/NAT da LAN forja um hop público à esquerda: ignorado
+    resolver = ClientIPResolver()
+    assert resolver.resolve("8.8.8.8", "10.0.0.2") == ("10.0.0.2", "10.0.0.2")
+    assert resolver.resolve("8.8.8.8, 192.168.0.50", "192.168.0.1") == ("192.168.0.1", "192.168.0.1")
+    assert resolver.resolve("8.8.8.8, 5.6.7.8", "127.0.0.1") == ("5.6.7.8", None)
+
+
+def test_reported_private_ip_does_not_override_the_resolved_one():
+    factory = RequestFactory()
+    lan = factory.get("/", HTTP_X_PRIVATE_IP="192.168.0.77", REMOTE_ADDR="10.0.0.9")
+    assert views._extract_private_ip(lan) == "10.0.0.9"
+    behind_nat = factory.get("/", HTTP_X_FORWARDED_FOR="192.168.1.20, 5.6.7.8", HTTP_X_LOCAL_IP="192.168.0.77")
+    assert views._extract_private_ip(behind_nat) == "192.168.1.20"
+
+
+def test_resolutions_are_memoized_per_header_pair():
+    resolver = ClientIPResolver()
+    resolver.resolve("1.2.3.4", "127.0.0.1")
+    resolver.resolve("1.2.3.4", "127.0.0.1")
+    resolver.resolve("1.2.3.4", "10.0.0.1")
+    assert resolver.stats()["hits"] == 1 and resolver.stats()["size"] == 2
+
+
+def test_trusted_proxies_come_from_settings(settings):
+    settings.PROVISION_CLIENT_IP = {"TRUSTED_PROXIES": "35.191.0.0/16"}
+    client_ip.set_resolver(None)
+    request = RequestFactory().get("/", HTTP_X_FORWARDED_FOR="203.0.113.9, 35.191.4.4", REMOTE_ADDR="35.191.1.1")
+    assert views._extract_public_ip(request) == "203.0.113.9"
+    # 10.x não está na lista configurada: não é seguido
+    request = RequestFactory().get("/", HTTP_X_FORWARDED_FOR="203.0.113.9", REMOTE_ADDR="10.0.0.1")
+    assert views._extract_public_ip(request) == "10.0.0.1"
+
+
+def test_spoofed_hops_do_not_become_the_client():
+    factory = RequestFactory()
+    spoofed = factory.get("/", HTTP_X_FORWARDED_FOR="8.8.8.8, 5.6.7.8", REMOTE_ADDR="127.0.0.1")
+    assert views._extract_public_ip(spoofed) == "5.6.7.8"
+    direct = factory.get("/", HTTP_X_FORWARDED_FOR="8.8.8.8", HTTP_X_PRIVATE_IP="192.168.0.77", REMOTE_ADDR="5.6.7.8")
+    assert views._extract_public_ip(direct) == "5.6.7.8"
+    assert views._extract_private_ip(direct) == "192.168.0.77"
+
+
+@pytest.mark.django_db
+def test_event_and_rate_limit_use_the_resolved_client(settings):
+    settings.PROVISION_RATE_LIMIT = {"ENABLED": True, "MAC_RATE": 0, "IP_RATE": 0.01, "IP_BURST": 1}
+    settings.PROVISION_CLIENT_IP = {"TRUSTED_PROXIES": "10.0.0.0/8"}
+    ratelimit.set_limiter(None)
+    recorder = events.ProvisioningRecorder(background=False, max_batch=100)
+    events.set_recorder(recorder)
+    client = Client()
+    headers = {"HTTP_USER_AGENT": "scanner", "REMOTE_ADDR": "10.0.0.2"}
+
+    client.get("/api/download-xml/", HTTP_X_FORWARDED_FOR="203.0.113.1", **headers)
+    # outro cliente atrás do mesmo proxy tem o seu próprio limite
+    assert client.get("/api/download-xml/", HTTP_X_FORWARDED_FOR="203.0.113.2", **headers).status_code == 403
+    assert client.get("/api/download-xml/", HTTP_X_FORWARDED_FOR="203.0.113.1", **headers).status_code == 429
+    recorder.flush()
+    assert sorted(Provisioning.objects.values_list("public_ip", flat=True)) == ["203.0.113.1", "203.0.113.2"]
@@ -0,0 +1,86 @@
+import gzip
+
+import pytest
+from django.test import Client, RequestFactory
+
+import api.views as views
+from api.utils import compression
+from api.utils.artifacts import ArtifactStore
+from core.models import DeviceProfile, DeviceConfig
+
+UA = "Yealink T46 66.1 aabbcc0000c1"
+BODY = "<cfg>" + "<item>{{ sipserver }}</item>" * 100 + "</cfg>"
+
+
+def _request(accept):
+    return RequestFactory().get("/", HTTP_ACCEPT_ENCODING=accept)
+
+
+@pytest.mark.parametrize("accept,expected", [
+    ("gzip, deflate", "gzip"),
+    ("br;q=0.5, gzip;q=0.8", "gzip"),
+    ("gzip;q=0", None),
+    ("*", "gzip"),
+    ("identity", None),
+    ("", None),
+])
+def test_negotiate_honours_q_values(monkeypatch, accept, expected):
+    monkeypatch.setattr(compression, "brotli", None)
+    assert compression.negotiate(_request(accept)) == expected
+
+
+def test_negotiate_vendor_opt_out_and_disabled(settings, monkeypatch):
+    monkeypatch.setattr(compression, "brotli", None)
+    settings.PROVISION_COMPRESSION = {"EXCLUDE_VENDORS": "Grandstream, fanvil"}
+    assert compression.negotiate(_request("gzip"), vendor="grandstream") is None
+    assert compression.negotiate(_request("gzip"), vendor="Yealink") == "gzip"
+    settings.PROVISION_COMPRESSION = {"ENABLED": False}
+    assert compression.negotiate(_request("gzip")) is None
+    assert compression.variant_etag('"abc"', "gzip") == '"abc-gzip"'
+
+
+@pytest.fixture
+def device(db, monkeypatch, settings):
+    settings.PROVISION_COMPRESSION = {"MIN_SIZE": 256, "EXCLUDE_VENDORS": "fanvil"}
+    monkeypatch.setattr(compression, "brotli", None)
+    monkeypatch.setattr(views, "get_template_from_mongo", lambda model, ext, ref=None: {"_id": "gz", "template": BODY})
+    profile = DeviceProfile.objects.create(name="GZ", sip_server="sip.example.com")
+    return DeviceConfig.objects.create(profile=profile, identifier="gz-1", mac_address="aabbcc0000c1")
+
+
+def test_download_is_gzipped_with_its_own_etag_and_cached(device):
+    client = Client()
+    plain = client.get("/api/download-xml/", HTTP_USER_AGENT=UA)
+    assert "Content-Encoding" not in plain and plain["Vary"] == "Accept-Encoding"
+
+    first = client.get("/api/download-xml/", HTTP_USER_AGENT=UA, HTTP_ACCEPT_ENCODING="gzip")
+    assert first["Content-Encoding"] == "gzip"
+    assert gzip.decompress(first.content) == plain.content
+    assert first["ETag"] == plain["ETag"][:-1] + '-gzip"'
+    assert int(first["Content-Length"]) == len(first.content) < len(plain.content)
+
+    second = client.get("/api/download-xml/", HTTP_USER_AGENT=UA, HTTP_ACCEPT_ENCODING="gzip")
+    assert second.content == first.content
+    assert compression.stats()["hits"] == 1
+
+    not_modified = client.get("/api/download-xml/", HTTP_USER_AGENT=UA, HTTP_ACCEPT_ENCODING="gzip",
+                              HTTP_IF_NONE_MATCH=first["ETag"])
+    assert not_modified.status_code == 304
+    # o ETag da representação gzip não valida a identity
+    assert client.get("/api/download-xml/", HTTP_USER_AGENT=UA, HTTP_IF_NONE_MATCH=first["ETag"]).status_code == 200
+
+
+def test_excluded_vendor_gets_identity(device):
+    resp = Client().get("/api/download-xml/", HTTP_USER_AGENT="Fanvil X4 1.0 aabbcc0000c1", HTTP_ACCEPT_ENCODING="gzip")
+    assert resp.status_code == 200
+    assert "Content-Encoding" not in resp
+
+
+def test_artifact_encoded_variants_are_read_and_kept_by_prune(tmp_path):
+    store = ArtifactStore(tmp_path)
+    sha = store.put('"e1"', b"x" * 1000)
+    store.put_encoded(sha, "gzip", b"GZ")
+    assert store.get_encoded('"e1"', "gzip") == b"GZ"
+    assert store.get_encoded('"e1"', "br") is None
+    assert store.prune({"k": {"sha256": sha, "etag": '"e1"'}}) == 0
+    assert store.prune({}) == 3
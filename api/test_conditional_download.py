@@ -0,0 +1,60 @@
+from datetime import datetime, timedelta
+
+import pytest
+from django.test import Client
+from django.utils.http import http_date
+
+import api.views as views
+from core.models import DeviceProfile, DeviceConfig
+
+UA = "Yealink T46 66.1 aabbcc000001"
+
+
+@pytest.fixture
+def mongo_template(monkeypatch):
+    doc = {"_id": "t46", "template": "<cfg>{{ sipserver }}</cfg>", "uploaded_at": datetime(2024, 1, 1)}
+    monkeypatch.setattr(views, "get_template_from_mongo", lambda model, ext: doc)
+    return doc
+
+
+@pytest.mark.django_db
+def test_if_none_match_returns_304_until_device_changes(mongo_template):
+    profile = DeviceProfile.objects.create(name="ETAG", sip_server="sip.example.com")
+    DeviceConfig.objects.create(profile=profile, identifier="etag-1", mac_address="aabbcc000001")
+    client = Client()
+
+    first = client.get("/api/download-xml/", HTTP_USER_AGENT=UA)
+    assert first.status_code == 200
+    etag = first["ETag"]
+    assert etag.startswith('"') and etag.endswith('"')
+    assert "Last-Modified" in first
+
+    again = client.get("/api/download-xml/", HTTP_USER_AGENT=UA, HTTP_IF_NONE_MATCH=etag)
+    assert again.status_code == 304
+    assert again.content == b""
+
+    # mesmo aparelho com outro firmware -> entrada do render mudou -> novo ETag
+    other_fw = client.get("/api/download-xml/", HTTP_USER_AGENT="Yealink T46 66.2 aabbcc000001", HTTP_IF_NONE_MATCH=etag)
+    assert other_fw.status_code == 200
+
+    profile.sip_server = "sip2.example.com"
+    profile.save()
+    changed = client.get("/api/download-xml/", HTTP_USER_AGENT=UA, HTTP_IF_NONE_MATCH=etag)
+    assert changed.status_code == 200
+    assert changed["ETag"] != etag
+    assert b"sip2.example.com" in changed.content
+
+
+@pytest.mark.django_db
+def test_if_modified_since(mongo_template):
+    profile = DeviceProfile.objects.create(name="IMS")
+    DeviceConfig.objects.create(profile=profile, identifier="ims-1", mac_address="aabbcc000001")
+    client = Client()
+
+    future = http_date((datetime.now() + timedelta(days=1)).timestamp())
+    resp = client.get("/api/download-xml/", HTTP_USER_AGENT=UA, HTTP_IF_MODIFIED_SINCE=future)
+    assert resp.status_code == 304
+
+    past = http_date(datetime(2000, 1, 1).timestamp())
+    resp = client.get("/api/download-xml/", HTTP_USER_AGENT=UA, HTTP_IF_MODIFIED_SINCE=past)
+    assert resp.status_code == 200
@@ -0,0 +1,67 @@
+import pytest
+from django.db import connection
+from django.test import Client
+from django.test.utils import CaptureQueriesContext
+
+import api.views as views
+from api.utils import device_cache, known_devices
+from core.models import DeviceProfile, DeviceConfig
+
+
+@pytest.fixture
+def device(db):
+    profile = DeviceProfile.objects.create(name="CACHE", template_ref="tpl")
+    return DeviceConfig.objects.create(profile=profile, identifier="c-1", mac_address="aabbcc0000c1")
+
+
+@pytest.mark.django_db
+def test_single_query_with_profile_then_cache_hit(device):
+    known_devices.get_index().rebuild()
+    with CaptureQueriesContext(connection) as ctx:
+        found = views.get_device_config("aa:bb:cc:00:00:c1")
+        assert found.pk == device.pk
+        assert found.profile.template_ref == "tpl"
+    assert len(ctx.captured_queries) == 1
+
+    with CaptureQueriesContext(connection) as ctx:
+        again = views.get_device_config("aa:bb:cc:00:00:c1")
+    assert again is found
+    assert len(ctx.captured_queries) == 0
+
+
+@pytest.mark.django_db
+def test_mac_match_wins_over_identifier_match(device):
+    # identifier de outro device é igual ao MAC de `device`
+    DeviceConfig.objects.create(profile=device.profile, identifier="aabbcc0000c1", mac_address="aabbcc0000c2")
+    assert views.get_device_config("aabbcc0000c1").pk == device.pk
+    assert views.get_device_config("c-1").pk == device.pk
+
+
+@pytest.mark.django_db
+def test_signals_invalidate_device_and_profile(device):
+    views.get_device_config("aabbcc0000c1")
+    assert device_cache.stats()["size"] == 1
+
+    device.display_name = "Recepção"
+    device.save()
+    assert device_cache.stats()["size"] == 0
+    assert views.get_device_config("aabbcc0000c1").display_name == "Recepção"
+
+    profile = device.profile
+    profile.template_ref = "tpl-2"
+    profile.save()
+    assert views.get_device_config("aabbcc0000c1").profile.template_ref == "tpl-2"
+
+    device.delete()
+    assert views.get_device_config("aabbcc0000c1") is None
+
+
+@pytest.mark.django_db
+def test_download_config_known_device_needs_no_sql(device, monkeypatch):
+    monkeypatch.setattr(views, "get_template_from_mongo", lambda model, ext, ref=None: {"_id": "tpl", "template": "ok"})
+    client = Client()
+    ua = "Yealink T46 66.1 aabbcc0000c1"
+    assert client.get("/api/download-xml/cfg.xml/", HTTP_USER_AGENT=ua).status_code == 200
+    with CaptureQueriesContext(connection) as ctx:
+        assert client.get("/api/download-xml/cfg.xml/", HTTP_USER_AGENT=ua).status_code == 200
+    assert len(ctx.captured_queries) == 0
@@ -0,0 +1,72 @@
+from datetime import timedelta
+
+import pytest
+from django.test import Client
+from django.utils import timezone
+
+import api.views as views
+from api.utils import device_touch
+from api.utils.device_touch import DeviceTouchCoalescer
+from core.models import DeviceProfile, DeviceConfig
+
+
+def test_touches_are_aggregated_per_device():
+    coalescer = DeviceTouchCoalescer(background=False)
+    t0 = timezone.now()
+    coalescer.touch(1, t0)
+    coalescer.touch(2, t0)
+    coalescer.touch(1, t0 + timedelta(seconds=5))
+    coalescer.touch(1, t0 - timedelta(seconds=5))
+    assert coalescer.touch(None) is False
+
+    assert coalescer.pending() == 2
+    with coalescer._lock:
+        batch = coalescer._take(10)
+    assert batch == [(1, 3, t0 + timedelta(seconds=5)), (2, 1, t0)]
+
+
+@pytest.mark.django_db
+def test_flush_applies_f_increments_without_touching_updated_at():
+    profile = DeviceProfile.objects.create(name="TOUCH")
+    a = DeviceConfig.objects.create(profile=profile, identifier="t-1", mac_address="aa:bb:cc:00:00:0b",
+                                  attempts_provisioning=4)
+    b = DeviceConfig.objects.create(profile=profile, identifier="t-2", mac_address="aa:bb:cc:00:00:0c")
+    updated_at = a.updated_at
+
+    coalescer = DeviceTouchCoalescer(background=False, max_batch=10)
+    t0 = timezone.now()
+    for i in range(3):
+        coalescer.touch(a.pk, t0 + timedelta(seconds=i))
+    coalescer.touch(b.pk, t0)
+    assert coalescer.flush() == 2
+
+    a.refresh_from_db()
+    b.refresh_from_db()
+    assert (a.attempts_provisioning, a.provisioned_at) == (7, t0 + timedelta(seconds=2))
+    assert (b.attempts_provisioning, b.provisioned_at) == (1, t0)
+    assert a.updated_at == updated_at
+
+
+@pytest.mark.django_db
+def test_download_config_touches_device_only_on_success(monkeypatch):
+    coalescer = DeviceTouchCoalescer(background=False)
+    device_touch.set_coalescer(coalescer)
+    monkeypatch.setattr(views, "get_template_from_mongo", lambda model, ext: {"_id": "tpl", "template": "ok"})
+
+    profile = DeviceProfile.objects.create(name="TOUCH")
+    device = DeviceConfig.objects.create(profile=profile, identifier="t-3", mac_address="aa:bb:cc:00:00:0a")
+    client = Client()
+    ua = "Yealink T46 66.1 aabbcc00000a"
+    first = client.get("/api/download-xml/cfg.xml/", HTTP_USER_AGENT=ua)
+    assert first.status_code == 200
+    assert client.get("/api/download-xml/cfg.xml/", HTTP_USER_AGENT=ua,
+                      HTTP_IF_NONE_MATCH=first["ETag"]).status_code == 304
+    client.get("/api/download-xml/cfg.xml/", HTTP_USER_AGENT="Yealink T46 66.1 ffffffffffff")
+
+    # nada é gravado durante o request
+    device.refresh_from_db()
+    assert device.attempts_provisioning == 0
+    assert coalescer.flush() == 1
+    device.refresh_from_db()
+    assert device.attempts_provisioning == 2
+    assert device.provisioned_at is not None
@@ -0,0 +1,181 @@
+import asyncio
+
+import pytest
+from asgiref.sync import async_to_sync
+from django.core.cache.backends.locmem import LocMemCache
+from django.test import RequestFactory
+
+import api.views as views
+from api.utils import artifacts, compression, generations, mongo, ratelimit
+from api.utils.generations import Generations
+from api.utils.ratelimit import RateLimiter
+from core.models import DeviceProfile, DeviceConfig
+
+TEMPLATE = {"_id": "tpl-async", "template": "<cfg><sip>{{ sipserver }}</sip><acc>%%account%%</acc></cfg>"}
+
+
+class AsyncCursor:
+    def __init__(self, docs):
+        self.docs = list(docs)
+
+    def __aiter__(self):
+        return self
+
+    async def __anext__(self):
+        if not self.docs:
+            raise StopAsyncIteration
+        return self.docs.pop(0)
+
+
+class AsyncColl:
+    def __init__(self, docs):
+        self.docs = docs
+        self.pipelines = []
+
+    async def aggregate(self, pipeline):
+        self.pipelines.append(pipeline)
+        return AsyncCursor(self.docs[:1])
+
+
+@pytest.fixture
+def device(db):
+    profile = DeviceProfile.objects.create(name="ASYNC", sip_server="sip.example.com", template_ref="tpl-async")
+    return DeviceConfig.objects.create(profile=profile, identifier="as-1", mac_address="aabbcc0000e1")
+
+
+def _get(**headers):
+    return RequestFactory().get("/api/download-xml/cfg.xml/", **headers)
+
+
+@pytest.mark.django_db
+def test_async_view_matches_sync_view(device, monkeypatch):
+    monkeypatch.setattr(views, "get_template_from_mongo", lambda model, ext, ref=None: TEMPLATE)
+
+    async def _aget(model, ext, ref=None):
+        return TEMPLATE
+
+    monkeypatch.setattr(views, "aget_template_from_mongo", _aget)
+    ua = {"HTTP_USER_AGENT": "Yealink T46 66.1 aabbcc0000e1"}
+
+    sync_resp = views.download_config(_get(**ua), filename="cfg.xml")
+    views.template_cache.clear()
+    views.device_cache.clear()
+    async_resp = async_to_sync(views.download_config_async)(_get(**ua), filename="cfg.xml")
+
+    assert async_resp.status_code == sync_resp.status_code == 200
+    assert async_resp.content == sync_resp.content == b"<cfg><sip>sip.example.com</sip><acc>as-1</acc></cfg>"
+    assert async_resp["ETag"] == sync_resp["ETag"]
+
+    not_modified = async_to_sync(views.download_config_async)(
+        _get(HTTP_IF_NONE_MATCH=async_resp["ETag"], **ua), filename="cfg.xml")
+    assert not_modified.status_code == 304
+
+
+def _in_event_loop() -> bool:
+    try:
+        asyncio.get_running_loop()
+    except RuntimeError:
+        return False
+    return True
+
+
+@pytest.mark.django_db
+def test_async_view_reads_artifacts_and_compresses_off_the_event_loop(device, monkeypatch):
+    async def _aget(model, ext, ref=None):
+        return TEMPLATE
+
+    monkeypatch.setattr(views, "aget_template_from_mongo", _aget)
+    calls = []
+
+    class Store:
+        def get(self, etag):
+            calls.append(("get", _in_event_loop()))
+            return b"<cfg>" + b"x" * 4096 + b"</cfg>"
+
+        def get_encoded(self, etag, coding):
+            calls.append(("get_encoded", _in_event_loop()))
+            return None
+
+    real_compress = compression.compress
+
+    def _compress(data, coding):
+        calls.append(("compress", _in_event_loop()))
+        return real_compress(data, coding)
+
+    monkeypatch.setattr(artifacts, "serving_store", lambda: Store())
+    monkeypatch.setattr(compression, "compress", _compress)
+    resp = async_to_sync(views.download_config_async)(
+        _get(HTTP_USER_AGENT="Yealink T46 66.1 aabbcc0000e1", HTTP_ACCEPT_ENCODING="gzip"), filename="cfg.xml")
+
+    assert resp.status_code == 200 and resp["Content-Encoding"] == "gzip"
+    assert calls == [("get", False), ("get_encoded", False), ("compress", False)]
+
+
+class _LoopRecordingCache:
+    """Cache compartilhado de mentira: registra se cada chamada foi feita dentro do event loop."""
+
+    def __init__(self, name):
+        self._cache = LocMemCache(name, {})
+        self.calls = []
+
+    def __getattr__(self, name):
+        attr = getattr(self._cache, name)
+        if not callable(attr):
+            return attr
+
+        def _call(*args, **kwargs):
+            self.calls.append((name, _in_event_loop()))
+            return attr(*args, **kwargs)
+
+        return _call
+
+
+@pytest.mark.django_db
+def test_async_view_keeps_shared_cache_calls_off_the_event_loop(device, monkeypatch):
+    async def _aget(model, ext, ref=None):
+        return TEMPLATE
+
+    monkeypatch.setattr(views, "aget_template_from_mongo", _aget)
+    gen_cache, rl_cache = _LoopRecordingCache("gen-async"), _LoopRecordingCache("rl-async")
+    generations.set_generations(Generations(gen_cache, local_ttl=0, shared=True))
+    ratelimit.set_limiter(RateLimiter({"mac": (10.0, 10), "ip": (10.0, 10)}, cache=rl_cache))
+    ua = {"HTTP_USER_AGENT": "Yealink T46 66.1 aabbcc0000e1"}
+
+    for _ in range(2):  # miss (grava no cache) e hit
+        resp = async_to_sync(views.download_config_async)(_get(**ua), filename="cfg.xml")
+        assert resp.status_code == 200
+
+    assert rl_cache.calls and gen_cache.calls
+    assert not [call for call in rl_cache.calls + gen_cache.calls if call[1]]
+
+
+@pytest.mark.django_db
+def test_async_view_rejects_invalid_user_agent():
+    resp = async_to_sync(views.download_config_async)(_get(HTTP_USER_AGENT="short"), filename="cfg.xml")
+    assert resp.status_code == 403
+
+
+def test_aget_template_from_mongo_uses_async_driver(monkeypatch):
+    coll = AsyncColl([TEMPLATE])
+
+    class DB:
+        device_templates = coll
+
+        def get_collection(self, name):
+            return coll
+
+    monkeypatch.setattr(views, "get_async_mongo_client", lambda: DB())
+    doc = async_to_sync(views.aget_template_from_mongo)("T46", "xml", "tpl-async")
+    assert doc is TEMPLATE
+    assert coll.pipelines and coll.pipelines[0][0] == {"$match": {"_id": "tpl-async"}}
+
+
+def test_async_mongo_client_is_cached_per_event_loop(settings):
+    settings.MONGODB_URL = "mongodb://localhost:27017/provision_test"
+
+    async def _twice():
+        return mongo.get_async_mongo_client(), mongo.get_async_mongo_client()
+
+    first, second = async_to_sync(_twice)()
+    assert first is second
+    assert first.name == "provision_test"
@@ -0,0 +1,81 @@
+import pytest
+from django.test import Client
+
+import api.views as views
+from api.utils import events
+from api.utils.buffered import OVERFLOW_DROP_NEW, OVERFLOW_DROP_OLDEST
+from api.utils.events import ProvisioningRecorder
+from core.models import DeviceProfile, DeviceConfig, Provisioning
+
+
+class ListRecorder(ProvisioningRecorder):
+    """Recorder que guarda os lotes em memória em vez de gravar no banco."""
+
+    def __init__(self, **kwargs):
+        super().__init__(background=False, **kwargs)
+        self.batches = []
+
+    def _write(self, batch):
+        self.batches.append(batch)
+
+
+def test_flush_writes_in_batches_of_max_batch():
+    rec = ListRecorder(max_batch=2, max_pending=10)
+    for i in range(5):
+        rec.add({"identifier": f"d{i}"})
+    assert rec.pending() == 5
+    assert rec.flush() == 5
+    assert [len(b) for b in rec.batches] == [2, 2, 1]
+    assert rec.stats()["written"] == 5
+
+
+@pytest.mark.parametrize(
+    "policy,kept",
+    [(OVERFLOW_DROP_OLDEST, ["d1", "d2"]), (OVERFLOW_DROP_NEW, ["d0", "d1"])],
+)
+def test_overflow_policies(policy, kept):
+    rec = ListRecorder(max_batch=1, max_pending=2, overflow=policy)
+    results = [rec.add({"identifier": f"d{i}"}) for i in range(3)]
+    assert rec.dropped == 1
+    assert results[-1] is (policy != OVERFLOW_DROP_NEW)
+    rec.flush()
+    assert [e["identifier"] for b in rec.batches for e in b] == kept
+
+
+def test_sync_overflow_flushes_in_caller():
+    rec = ListRecorder(max_batch=5, max_pending=5, overflow="sync")
+    for i in range(6):
+        rec.add({"identifier": f"d{i}"})
+    assert rec.dropped == 0
+    assert len(rec.batches) == 1 and rec.pending() == 1
+
+
+@pytest.mark.django_db
+def test_download_config_records_events_in_bulk(monkeypatch):
+    recorder = ProvisioningRecorder(background=False, max_batch=100)
+    events.set_recorder(recorder)
+    monkeypatch.setattr(views, "get_template_from_mongo", lambda model, ext: {"_id": "tpl", "template": "ok"})
+
+    profile = DeviceProfile.objects.create(name="EV")
+    device = DeviceConfig.objects.create(profile=profile, identifier="ev-1", mac_address="aa:bb:cc:00:00:09")
+    client = Client()
+    client.get("/api/download-xml/cfg.xml/", HTTP_USER_AGENT="Yealink T46 66.1 aabbcc000009",
+               HTTP_X_FORWARDED_FOR="192.168.1.20, 200.1.2.3")
+    client.get("/api/download-xml/", HTTP_USER_AGENT="bad")
+
+    # nada é gravado durante o request
+    assert Provisioning.objects.count() == 0
+    assert recorder.flush() == 2
+
+    ok = Provisioning.objects.get(status=Provisioning.STATUS_OK)
+    assert ok.device_id == device.pk
+    assert (ok.vendor, ok.model, ok.version) == ("Yealink", "T46", "66.1")
+    assert ok.mac_address == "aabbcc000009"
+    assert ok.template_ref == "tpl"
+    assert ok.filename == "cfg.xml"
+    assert ok.public_ip == "200.1.2.3"
+    assert ok.private_ip == "192.168.1.20"
+
+    bad = Provisioning.objects.get(status=Provisioning.STATUS_FORBIDDEN)
+    assert bad.user_agent == "bad"
+    assert bad.notes == "invalid user-agent"
@@ -0,0 +1,118 @@
+import pytest
+from django.core.cache.backends.locmem import LocMemCache
+
+import api.views as views
+from api.utils import device_cache, generations, template_cache
+from api.utils.generations import Generations
+from core.models import DeviceProfile, DeviceConfig
+
+
+@pytest.fixture
+def shared(settings):
+    """
+    Counters of this worker plus a second 'worker', both without local memo, on one cache
+    object standing in for Redis/Memcached (shared=True).
+    """
+    cache = LocMemCache("gen-test", {})
+    cache.clear()
+    generations.set_generations(Generations(cache, local_ttl=0, shared=True))
+    return Generations(cache, local_ttl=0, shared=True)
+
+
+def test_counters_are_shared_through_the_cache():
+    cache = LocMemCache("gen-shared", {})
+    cache.clear()
+    first, second = Generations(cache, local_ttl=0), Generations(cache, local_ttl=0)
+    start = first.get("profile", 1)
+    assert second.get("profile", 1) == start
+    assert second.bump("profile", 1) == start + 1
+    assert first.get("profile", 1) == start + 1
+    assert first.get("profile", 2) >= start  # contador novo não volta a valores antigos
+
+
+def test_process_local_caches_do_not_propagate():
+    # dois workers, cada um com o seu LocMemCache: o bump de um nunca chega ao outro
+    first = Generations(LocMemCache("gen-worker-1", {}), local_ttl=0)
+    second = Generations(LocMemCache("gen-worker-2", {}), local_ttl=0)
+    seen = second.get("profile", 7)
+    first.bump("profile", 7)
+    assert second.get("profile", 7) == seen
+    assert not first.shared and not second.shared
+
+
+def test_locmem_default_disables_generations(settings, caplog):
+    settings.PROVISION_GENERATIONS = {"ENABLED": True, "CACHE_ALIAS": "default"}
+    generations.set_generations(None)
+    assert generations.get_generations() is None
+    assert generations.get_generations() is None
+    assert not generations.is_shared()
+    warnings = [r for r in caplog.records if "PROVISION_GENERATIONS disabled" in r.getMessage()]
+    assert len(warnings) == 1
+
+
+@pytest.mark.django_db
+def test_profile_save_scans_locally_without_a_shared_store(monkeypatch):
+    generations.set_generations(Generations(LocMemCache("gen-local", {}), local_ttl=0))
+    profile = DeviceProfile.objects.create(name="GEN3")
+    DeviceConfig.objects.create(profile=profile, identifier="g-3", mac_address="aabbcc0000d3")
+    views.get_device_config("aabbcc0000d3")
+    assert device_cache.stats()["size"] == 1
+
+    profile.sip_server = "sip3.example.com"
+    profile.save()
+    assert device_cache.stats()["size"] == 0
+
+
+def test_local_memo_bounds_reads_until_it_expires(monkeypatch):
+    now = [100.0]
+    monkeypatch.setattr("api.utils.lru.time.monotonic", lambda: now[0])
+    cache = LocMemCache("gen-memo", {})
+    cache.clear()
+    local, other = Generations(cache, local_ttl=1.0), Generations(cache, local_ttl=0)
+    start = local.get("template", "t")
+    other.bump("template", "t")
+    assert local.get("template", "t") == start
+    now[0] += 1.5
+    assert local.get("template", "t") == start + 1
+
+
+@pytest.mark.django_db
+def test_profile_bump_in_another_worker_invalidates_devices(shared):
+    profile = DeviceProfile.objects.create(name="GEN", template_ref="tpl")
+    device = DeviceConfig.objects.create(profile=profile, identifier="g-1", mac_address="aabbcc0000d1")
+    assert views.get_device_config("aabbcc0000d1").pk == device.pk
+    key = device_cache.lookup_key("aabbcc0000d1", "aabbcc0000d1")
+    assert device_cache.get(key) is not None
+
+    DeviceProfile.objects.filter(pk=profile.pk).update(template_ref="tpl-2")  # sem signal neste worker
+    shared.bump(generations.PROFILE, profile.pk)
+    assert device_cache.get(key) is None
+    assert views.get_device_config("aabbcc0000d1").profile.template_ref == "tpl-2"
+
+
+@pytest.mark.django_db
+def test_profile_save_bumps_instead_of_scanning(shared, monkeypatch):
+    profile = DeviceProfile.objects.create(name="GEN2")
+    DeviceConfig.objects.create(profile=profile, identifier="g-2", mac_address="aabbcc0000d2")
+    views.get_device_config("aabbcc0000d2")
+    monkeypatch.setattr(device_cache, "invalidate_profile", lambda pk: pytest.fail("scanned the cache"))
+    before = shared.get(generations.PROFILE, profile.pk)
+
+    profile.sip_server = "sip2.example.com"
+    profile.save()
+    assert shared.get(generations.PROFILE, profile.pk) == before + 1
+    assert views.get_device_config("aabbcc0000d2").profile.sip_server == "sip2.example.com"
+
+
+def test_template_set_change_invalidates_resolved_lookups_everywhere(shared):
+    doc = {"_id": "h2p", "template": "x"}
+    entry = template_cache.build_entry(doc, doc["template"])
+    by_model = template_cache.lookup_key("", "h2p", "xml")
+    fallback = template_cache.lookup_key("", "t46", "xml")
+    template_cache.put_resolved(by_model, entry)
+    template_cache.put_resolved(fallback, entry)
+
+    # outro worker importou um template novo: o conjunto mudou, toda resolução é refeita
+    shared.bump(generations.TEMPLATE, generations.TEMPLATE_SET)
+    assert template_cache.get_resolved(by_model) is None
+    assert template_cache.get_resolved(fallback) is None
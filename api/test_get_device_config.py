@@ -6,34 +6,21 @@ from importlib import import_module
 views = import_module("api.views")
 
 
-class DoesNotExist(Exception):
-    pass
-
-
 class FakeObjects:
     def __init__(self, items):
         self.items = items
 
-    def get(self, **kwargs):
-        # aceita mac_address=norm and identifier=...
-        if "mac_address" in kwargs:
-            mac = kwargs["mac_address"]
-            for it in self.items:
-                if it.get("mac_address") == mac:
-                    return SimpleNamespace(**it)
-            raise DoesNotExist
-        if "identifier" in kwargs:
-            identifier = kwargs["identifier"]
-            for it in self.items:
-                if it.get("identifier") == identifier:
-                    return SimpleNamespace(**it)
-            raise DoesNotExist
-        raise DoesNotExist
+    def select_related(self, *fields):
+        return self
+
+    def filter(self, q):
+        # aceita Q(mac_address=norm) | Q(identifier=...) (filhos simples combinados com OR)
+        wanted = list(q.children)
+        return [SimpleNamespace(**it) for it in self.items
+                if any(it.get(field) == value for field, value in wanted)]
 
 
 class FakeDeviceConfig:
-    # adicionar atributo DoesNotExist para simular API do ORM
-    DoesNotExist = DoesNotExist
     objects = FakeObjects(
         [
             {"identifier": "dev-1", "mac_address": "aabbcc112233"},
@@ -0,0 +1,151 @@
+import threading
+
+import pytest
+from django.db import connection
+from django.test import Client
+from django.test.utils import CaptureQueriesContext
+
+import api.views as views
+from api.utils import known_devices
+from api.utils.bloom import BloomFilter
+from core.models import DeviceProfile, DeviceConfig
+
+
+def test_bloom_filter_has_no_false_negatives_and_few_false_positives():
+    bloom = BloomFilter(capacity=2000, error_rate=0.01)
+    present = [f"m:{i:012x}" for i in range(2000)]
+    for key in present:
+        bloom.add(key)
+    assert all(key in bloom for key in present)
+    false_positives = sum(f"m:{i:012x}" in bloom for i in range(10**6, 10**6 + 5000))
+    assert false_positives < 5000 * 0.03
+    assert not bloom.saturated()
+
+
+@pytest.fixture
+def device(db):
+    profile = DeviceProfile.objects.create(name="KNOWN")
+    return DeviceConfig.objects.create(profile=profile, identifier="k-1", mac_address="aabbcc0000d1")
+
+
+@pytest.mark.django_db
+def test_unknown_mac_is_answered_without_sql(device):
+    known_devices.get_index().rebuild()
+    with CaptureQueriesContext(connection) as ctx:
+        assert views.get_device_config("ff:ff:ff:00:00:01") is None
+    assert len(ctx.captured_queries) == 0
+    assert views.get_device_config("aabbcc0000d1").pk == device.pk
+
+
+@pytest.mark.django_db
+def test_negative_cache_then_new_device_is_found(device, settings):
+    settings.PROVISION_UNKNOWN_DEVICES = dict(settings.PROVISION_UNKNOWN_DEVICES, BLOOM_ENABLED=False)
+    assert views.get_device_config("aabbcc0000d2") is None
+    with CaptureQueriesContext(connection) as ctx:
+        assert views.get_device_config("aabbcc0000d2") is None
+    assert len(ctx.captured_queries) == 0
+
+    created = DeviceConfig.objects.create(profile=device.profile, identifier="k-2", mac_address="aabbcc0000d2")
+    assert views.get_device_config("aabbcc0000d2").pk == created.pk
+
+
+@pytest.mark.django_db
+def test_index_picks_up_devices_saved_elsewhere(device):
+    index = known_devices.get_index()
+    index.rebuild()
+    # bulk_create não dispara signals: só o refresh incremental (watermark) enxerga o device
+    DeviceConfig.objects.bulk_create([DeviceConfig(profile=device.profile, identifier="k-3",
+                                                   mac_address="aabbcc0000d3")])
+    assert not index.might_exist("aabbcc0000d3", "aabbcc0000d3")
+    index._next_refresh = 0
+    assert index.might_exist("aabbcc0000d3", "aabbcc0000d3")
+
+
+@pytest.mark.django_db
+def test_miss_is_not_trusted_after_rows_changed_elsewhere(device):
+    index = known_devices.KnownDevices(background=True, change_check_interval=60)
+    index.rebuild()
+    index._next_refresh = float("inf")  # sem refresh periódico durante o teste
+    DeviceConfig.objects.bulk_create([DeviceConfig(profile=device.profile, identifier="k-4",
+                                                   mac_address="aabbcc0000d4")])
+    index._next_change_check = 0
+    refreshes = []
+    index._maybe_refresh = lambda: refreshes.append(1)
+    with CaptureQueriesContext(connection) as ctx:
+        assert index.might_exist("aabbcc0000d4", "aabbcc0000d4")
+        assert index.might_exist("ffffff0000d5", "ffffff0000d5")  # ainda "talvez" até o refresh
+    # uma única verificação (EXISTS) por intervalo, e o refresh é disparado
+    assert len(ctx.captured_queries) == 1 and refreshes
+
+    index._refresh()
+    assert index.contains("aabbcc0000d4", None)
+    assert not index.might_exist("ffffff0000d5", "ffffff0000d5")
+
+
+@pytest.mark.django_db
+def test_keys_noted_during_rebuild_survive_the_swap(device):
+    index = known_devices.KnownDevices(background=False)
+    index.rebuild()
+    estimated = index._estimated_keys
+
+    def note_while_building():
+        assert not index.trusts_misses()
+        index.add("aabbcc0000d6", "k-6")
+        return estimated()
+
+    index._estimated_keys = note_while_building
+    index.rebuild()
+    assert index.contains("aabbcc0000d6", None) and index.contains(None, "k-6")
+
+
+@pytest.mark.django_db
+def test_import_expires_the_index(device):
+    from core.device_import import import_devices
+
+    index = known_devices.get_index()
+    index.rebuild()
+    assert not index.refresh_due()
+    stats = import_devices([(1, {"mac_address": "aabbcc0000d7", "identifier": "k-7"})])
+    assert stats.imported == 1
+    assert index.refresh_due() and index.contains("aabbcc0000d7", None)
+
+
+@pytest.mark.django_db
+def test_reject_policy_skips_mongo(device, settings, monkeypatch):
+    settings.PROVISION_UNKNOWN_DEVICES = dict(settings.PROVISION_UNKNOWN_DEVICES, POLICY="reject")
+
+    def _no_mongo(*args):
+        raise AssertionError("Mongo não deveria ser consultado")
+
+    monkeypatch.setattr(views, "get_template_from_mongo", _no_mongo)
+    resp = Client().get("/api/download-xml/cfg.xml/", HTTP_USER_AGENT="Yealink T46 66.1 ffffff0000d9")
+    assert resp.status_code == 403
+    assert b"unknown device" in resp.content
+
+
+def test_might_exist_never_builds_inline(monkeypatch):
+    index = known_devices.KnownDevices(background=True)
+    release = threading.Event()
+    builders = []
+
+    def slow_rebuild():
+        builders.append(threading.current_thread())
+        release.wait(5)
+        return 0
+
+    monkeypatch.setattr(index, "rebuild", slow_rebuild)
+    # sem filtro ainda: "talvez" imediato, o build segue em outro thread
+    assert index.might_exist("ffffff000001", "x")
+    assert index.might_exist("ffffff000002", "y")
+    release.set()
+    index.join(5)
+    assert len(builders) == 1 and builders[0] is not threading.current_thread()
+
+
+@pytest.mark.django_db
+def test_rebuild_is_sized_without_count(device):
+    index = known_devices.KnownDevices(background=False)
+    with CaptureQueriesContext(connection) as ctx:
+        index.rebuild()
+    assert not any("COUNT(" in q["sql"].upper() for q in ctx.captured_queries)
+    assert index.contains("aabbcc0000d1", None)
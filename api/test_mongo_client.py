@@ -0,0 +1,94 @@
+import os
+
+import pytest
+
+from api.utils import mongo
+
+
+class FakeClient:
+    created = []
+
+    def __init__(self, *args, **kwargs):
+        self.args = args
+        self.kwargs = kwargs
+        FakeClient.created.append(self)
+
+    def __getitem__(self, name):
+        return FakeDB(self, name)
+
+
+class FakeDB:
+    def __init__(self, client, name):
+        self.client = client
+        self.name = name
+        self.commands = []
+
+    def command(self, name):
+        self.commands.append(name)
+        if self.client.kwargs.get("appname") == "down":
+            raise RuntimeError("no servers")
+        return {"ok": 1}
+
+
+@pytest.fixture
+def fake_client(monkeypatch):
+    FakeClient.created = []
+    monkeypatch.setattr(mongo, "MongoClient", FakeClient)
+    monkeypatch.setattr(mongo, "_db_instance", None)
+    yield FakeClient
+    mongo._db_instance = None
+
+
+def test_client_options_from_settings(fake_client, settings, capsys):
+    settings.MONGODB_URI = None
+    settings.MONGODB = {"HOST": "mongo", "PORT": 27017, "DB_NAME": "prov", "MAX_POOL_SIZE": "8",
+                        "SERVER_SELECTION_TIMEOUT_MS": 1500, "READ_PREFERENCE": "secondaryPreferred",
+                        "COMPRESSORS": "zlib", "APPNAME": "provision", "MIN_POOL_SIZE": ""}
+    db = mongo.get_mongo_client()
+    assert db.name == "prov"
+    (client,) = fake_client.created
+    assert client.args == ("mongo", 27017)
+    assert client.kwargs == {"maxPoolSize": 8, "serverSelectionTimeoutMS": 1500,
+                             "readPreference": "secondaryPreferred", "compressors": "zlib", "appname": "provision"}
+    assert mongo.get_mongo_client() is db
+    # a URI (com credenciais) não vai mais para o stdout
+    assert capsys.readouterr().out == ""
+
+
+def test_uri_options_take_precedence(settings):
+    settings.MONGODB = {"MAX_POOL_SIZE": 8, "APPNAME": "provision", "READ_PREFERENCE": "primary"}
+    options = mongo._client_options("mongodb://h/db?maxPoolSize=50&readpreference=nearest")
+    assert options == {"appname": "provision"}
+
+
+def test_client_reset_after_fork(fake_client, settings):
+    settings.MONGODB = {"HOST": "mongo", "DB_NAME": "prov"}
+    parent = mongo.get_mongo_client()
+    mongo._reset_after_fork()
+    child = mongo.get_mongo_client()
+    assert child is not parent
+    assert len(fake_client.created) == 2
+
+
+@pytest.mark.skipif(not hasattr(os, "fork"), reason="requires os.fork")
+def test_forked_child_does_not_inherit_client(fake_client, settings):
+    settings.MONGODB = {"HOST": "mongo", "DB_NAME": "prov"}
+    mongo.get_mongo_client()
+    read_fd, write_fd = os.pipe()
+    pid = os.fork()
+    if pid == 0:  # pragma: no cover - processo filho
+        os.write(write_fd, b"1" if mongo._db_instance is None else b"0")
+        os._exit(0)
+    os.waitpid(pid, 0)
+    assert os.read(read_fd, 1) == b"1"
+    assert mongo._db_instance is not None
+
+
+def test_warm_up_pings_and_never_raises(fake_client, settings):
+    settings.MONGODB = {"HOST": "mongo", "DB_NAME": "prov", "APPNAME": "provision"}
+    assert mongo.warm_up() is True
+    assert mongo._db_instance.commands == ["ping"]
+
+    mongo._db_instance = None
+    settings.MONGODB = {"HOST": "mongo", "DB_NAME": "prov", "APPNAME": "down"}
+    assert mongo.warm_up() is False
@@ -8,28 +8,32 @@ def test_get_template_from_mongo_success(monkeypatch):
     # prepara documentos simulados na 'collection'
     docs = {
         "h2p": {"_id": "h2p", "model": "H2P", "extension": "xml", "template": "<t>h2p</t>"},
+        "t46": {"_id": "Yealink-T46", "model": "T46", "model_lc": "t46", "extension": "xml", "template": "<t>t46</t>"},
         "byext": {"_id": "any", "extension": "cfg", "template": "fallback-cfg"},
     }
 
     class MockColl:
-        def find_one(self, query):
-            # 1) buscar por model regex + extension
-            if isinstance(query, dict) and "model" in query and "extension" in query:
-                regex = query["model"].get("$regex", "")
-                # tirar ^$
-                pattern = regex.strip("^$")
-                for d in docs.values():
-                    if d.get("model") and d.get("model").lower() == pattern.lower() and d.get("extension") == query["extension"]:
-                        return d
-            # 2) buscar por _id
-            if isinstance(query, dict) and "_id" in query:
-                return docs.get(query["_id"])
-            # 3) fallback por extension
-            if isinstance(query, dict) and "extension" in query and len(query) == 1:
+        """Avalia o pipeline de _template_lookup_pipeline: ramos $match/$limit 1/_rank + $sort."""
+        calls = 0
+
+        def aggregate(self, pipeline):
+            MockColl.calls += 1
+            found = []
+
+            def run_branch(stages):
+                match = stages[0]["$match"]
+                rank = stages[2]["$addFields"]["_rank"]
                 for d in docs.values():
-                    if d.get("extension") == query["extension"]:
-                        return d
-            return None
+                    if all(d.get(k) == v for k, v in match.items()):
+                        found.append((rank, d))
+                        break
+
+            run_branch(pipeline[:3])
+            for stage in pipeline[3:]:
+                if "$unionWith" in stage:
+                    run_branch(stage["$unionWith"]["pipeline"])
+            found.sort(key=lambda item: item[0])
+            return iter([d for _, d in found[:1]])
 
     class MockDB:
         def __init__(self):
@@ -39,10 +43,28 @@ def test_get_template_from_mongo_success(monkeypatch):
 
     monkeypatch.setattr("api.views.get_mongo_client", lambda: MockDB())
 
-    # busca por model (case-insensitive) com ext xml -> encontra via model regex
+    # busca por model (case-insensitive) com ext xml -> encontra via _id == model lower-case
     doc = views.get_template_from_mongo("H2P", "xml")
     assert doc and doc.get("template") == "<t>h2p</t>"
 
     # busca por model inexistente e ext cfg -> fallback por extensão
     doc2 = views.get_template_from_mongo("NoModel", "cfg")
-    assert doc2 and doc2.get("template") == "fallback-cfg"
\ No newline at end of file
+    assert doc2 and doc2.get("template") == "fallback-cfg"
+
+    # chave normalizada model_lc + extension
+    doc3 = views.get_template_from_mongo("T46", "xml")
+    assert doc3 and doc3.get("_id") == "Yealink-T46"
+
+    # template_ref tem prioridade sobre o model do User-Agent (inclusive em lower-case)
+    doc4 = views.get_template_from_mongo("T46", "xml", template_ref="H2P")
+    assert doc4 and doc4.get("_id") == "h2p"
+
+    # cada busca é uma única ida ao Mongo
+    assert MockColl.calls == 4
+
+
+def test_template_keys_normalizes_model_and_extension():
+    from api.utils.templates import template_keys
+
+    assert template_keys({"_id": "X", "model": " T46S ", "file_type": "XML"}) == {"model_lc": "t46s", "extension": "xml"}
+    assert template_keys({"_id": "H2P", "filename": "h2p.cfg"}) == {"model_lc": "h2p", "extension": "cfg"}
\ No newline at end of file
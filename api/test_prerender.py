@@ -0,0 +1,82 @@
+import pytest
+from django.test import Client
+
+import api.views as views
+from api.prerender import prerender
+from api.utils.artifacts import ArtifactStore
+from core.models import DeviceProfile, DeviceConfig, Provisioning
+
+TEMPLATE = {"_id": "tpl-pre", "template": "<cfg><acc>%%account%%</acc><sip>{{ sipserver }}</sip></cfg>"}
+UA = "Yealink T46 66.1 aabbcc0000f1"
+
+
+@pytest.fixture
+def device(db, monkeypatch):
+    monkeypatch.setattr(views, "get_template_from_mongo", lambda model, ext, ref=None: TEMPLATE)
+    profile = DeviceProfile.objects.create(name="PRE", sip_server="sip.example.com", template_ref="tpl-pre")
+    device = DeviceConfig.objects.create(profile=profile, identifier="pre-1", mac_address="aabbcc0000f1")
+    Provisioning.objects.create(device=device, status=Provisioning.STATUS_OK, user_agent=UA, filename="cfg.xml")
+    return device
+
+
+@pytest.mark.django_db
+def test_prerender_matches_view_and_is_incremental(device, tmp_path):
+    store = ArtifactStore(tmp_path)
+    stats = prerender(store, workers=0)
+    assert (stats.devices, stats.rendered, stats.unchanged) == (1, 1, 0)
+
+    resp = Client().get("/api/download-xml/cfg.xml/", HTTP_USER_AGENT=UA)
+    assert store.get(resp["ETag"]) == resp.content
+    assert (tmp_path / "devices" / "xml" / "aabbcc0000f1").read_bytes() == resp.content
+
+    assert prerender(store, workers=0).unchanged == 1
+
+    device.display_name = "Sala"
+    device.save()
+    stats = prerender(store, workers=0, prune=True)
+    assert stats.rendered == 1
+    assert stats.pruned == 1  # só o link do ETag antigo: o conteúdo renderizado não mudou
+
+
+@pytest.mark.django_db
+def test_download_serves_artifact_without_rendering(device, tmp_path, settings, monkeypatch):
+    prerender(ArtifactStore(tmp_path), workers=0)
+    settings.PROVISION_ARTIFACTS = {"DIR": str(tmp_path), "SERVE": True}
+
+    def _no_render(*args):
+        raise AssertionError("não deveria renderizar")
+
+    monkeypatch.setattr(views, "render_compiled", _no_render)
+    resp = Client().get("/api/download-xml/cfg.xml/", HTTP_USER_AGENT=UA)
+    assert resp.status_code == 200
+    assert resp.content == b"<cfg><acc>pre-1</acc><sip>sip.example.com</sip></cfg>"
+
+
+@pytest.mark.django_db
+def test_download_renders_when_artifact_dir_is_missing(device, tmp_path, settings, caplog):
+    settings.PROVISION_ARTIFACTS = {"DIR": str(tmp_path / "not-mounted"), "SERVE": True}
+    client = Client()
+    for _ in range(2):
+        resp = client.get("/api/download-xml/cfg.xml/", HTTP_USER_AGENT=UA)
+        assert resp.status_code == 200
+        assert resp.content == b"<cfg><acc>pre-1</acc><sip>sip.example.com</sip></cfg>"
+    assert [r.getMessage() for r in caplog.records].count(
+        f"PROVISION_ARTIFACTS['DIR'] {str(tmp_path / 'not-mounted')!r} does not exist (volume not mounted?); "
+        "rendering every download."
+    ) == 1
+
+    settings.PROVISION_ARTIFACTS = {"DIR": None, "SERVE": True}
+    assert client.get("/api/download-xml/cfg.xml/", HTTP_USER_AGENT=UA).status_code == 200
+    assert any("DIR is not set" in r.getMessage() for r in caplog.records)
+
+
+@pytest.mark.django_db
+def test_prerender_process_pool(device, tmp_path):
+    other = DeviceConfig.objects.create(profile=device.profile, identifier="pre-2", mac_address="aabbcc0000f2")
+    Provisioning.objects.create(device=other, status=Provisioning.STATUS_OK,
+                                user_agent="Yealink T46 66.1 aabbcc0000f2", filename="cfg.xml")
+    store = ArtifactStore(tmp_path)
+    stats = prerender(store, workers=2, batch_size=1)
+    assert (stats.rendered, stats.failed) == (2, 0)
+    assert (tmp_path / "devices" / "xml" / "aabbcc0000f2").read_bytes() == (
+        b"<cfg><acc>pre-2</acc><sip>sip.example.com</sip></cfg>")
@@ -0,0 +1,95 @@
+import pytest
+from django.core.cache.backends.locmem import LocMemCache
+from django.db import connection
+from django.test import Client
+from django.test.utils import CaptureQueriesContext
+
+import api.views as views
+from api.utils import events, ratelimit
+from api.utils.ratelimit import RateLimiter, SharedWindow, TokenBucket
+
+UA = "Yealink T46 66.1 aabbcc0000a1"
+
+
+def test_token_bucket_allows_burst_then_refills():
+    bucket = TokenBucket(rate=1.0, burst=2)
+    assert bucket.take("k", now=0.0) == 0
+    assert bucket.take("k", now=0.0) == 0
+    assert bucket.take("k", now=0.0) == pytest.approx(1.0)
+    assert bucket.take("k", now=0.5) == pytest.approx(0.5)
+    assert bucket.take("k", now=1.5) == 0
+    assert bucket.take("other", now=1.5) == 0
+
+
+def test_token_bucket_forgets_least_recent_keys():
+    bucket = TokenBucket(rate=1.0, burst=1, max_keys=2)
+    for key in ("a", "b", "c"):
+        bucket.take(key, now=0.0)
+    assert list(bucket._buckets) == ["b", "c"]
+
+
+def test_shared_window_counts_across_limiters():
+    cache = LocMemCache("rl-test", {})
+    first, second = SharedWindow(cache, "mac", rate=1.0, burst=2), SharedWindow(cache, "mac", rate=1.0, burst=2)
+    assert first.take("m", now=10.0) == 0
+    assert second.take("m", now=10.5) == 0
+    assert first.take("m", now=11.0) == pytest.approx(1.0)  # janela [10, 12) esgotada
+    assert second.take("m", now=12.0) == 0
+
+
+def test_limiter_reports_first_exceeded_kind():
+    limiter = RateLimiter({"mac": (1.0, 1), "ip": (0, 1)})
+    assert limiter.check({"mac": "m", "ip": "1.2.3.4"}) is None
+    kind, wait = limiter.check({"mac": "m", "ip": "1.2.3.4"})
+    assert kind == "mac" and wait > 0
+    assert limiter.check({"mac": None, "ip": "1.2.3.4"}) is None  # sem limite por IP (rate 0)
+    assert limiter.stats()["rejected"] == {"mac": 1}
+
+
+def test_rejection_by_ip_does_not_spend_the_mac_token():
+    cache = LocMemCache("rl-both", {})
+    limiter = RateLimiter({"mac": (0.01, 2), "ip": (0.01, 1)}, cache=cache)
+    assert limiter.check({"mac": "m", "ip": "1.2.3.4"}) is None
+    # IP esgotado: os requests rejeitados não consomem o limite por MAC
+    for _ in range(3):
+        kind, wait = limiter.check({"mac": "m", "ip": "1.2.3.4"})
+        assert kind == "ip" and wait > 0
+    assert limiter.local["mac"]._buckets["m"][0] == pytest.approx(1.0, abs=0.01)
+    assert limiter.check({"mac": "m", "ip": "5.6.7.8"}) is None
+    kind, _ = limiter.check({"mac": "m", "ip": "9.9.9.9"})
+    assert kind == "mac"
+    assert limiter.stats()["rejected"] == {"mac": 1, "ip": 3}
+
+
+@pytest.mark.django_db
+def test_download_returns_429_before_any_sql_or_mongo(settings, monkeypatch):
+    settings.PROVISION_RATE_LIMIT = {"ENABLED": True, "MAC_RATE": 0.01, "MAC_BURST": 1, "IP_RATE": 0}
+    ratelimit.set_limiter(None)
+    mongo_calls = []
+    monkeypatch.setattr(views, "get_template_from_mongo", lambda *a: mongo_calls.append(a))
+    recorder = events.ProvisioningRecorder(background=False, max_batch=100)
+    events.set_recorder(recorder)
+    client = Client()
+
+    client.get("/api/download-xml/", HTTP_USER_AGENT=UA)
+    calls = len(mongo_calls)
+    with CaptureQueriesContext(connection) as queries:
+        limited = client.get("/api/download-xml/", HTTP_USER_AGENT=UA)
+    assert limited.status_code == 429
+    assert int(limited["Retry-After"]) >= 1
+    assert len(queries) == 0 and len(mongo_calls) == calls
+    assert recorder.pending() == 1  # só o primeiro request vira evento
+
+    # outro aparelho atrás do mesmo IP não é afetado pelo limite por MAC
+    other = client.get("/api/download-xml/", HTTP_USER_AGENT="Yealink T46 66.1 aabbcc0000a2")
+    assert other.status_code != 429
+
+
+@pytest.mark.django_db
+def test_ip_limit_applies_to_invalid_user_agents(settings):
+    settings.PROVISION_RATE_LIMIT = {"ENABLED": True, "MAC_RATE": 0, "IP_RATE": 0.01, "IP_BURST": 2}
+    ratelimit.set_limiter(None)
+    client = Client()
+    codes = [client.get("/api/download-xml/", HTTP_USER_AGENT="scanner", REMOTE_ADDR="203.0.113.9").status_code
+             for _ in range(3)]
+    assert codes == [403, 403, 429]
@@ -0,0 +1,65 @@
+import pytest
+from django.template import Context, Template
+
+from api.utils.render_plan import compile_plan, substitute_percent_placeholders
+
+CONTEXT = {
+    "identifier": "1001",
+    "displayname": "Ana & Bia <recepção>",
+    "sipserver": "sip.example.com",
+    "port": 5060,
+    "vlanactive": True,
+    "srtp": False,
+    "vlanid": None,
+    "codecs": ["PCMU", "PCMA"],
+    "metadata": {"a": 1},
+    "pct": "vlanid%%",
+    "name": "vlanactive",
+}
+
+
+def _legacy(template_str, context):
+    # pipeline anterior: Template do Django + passada de regex %%nome%%
+    return substitute_percent_placeholders(Template(template_str).render(Context(context)), context)
+
+
+@pytest.mark.parametrize(
+    "template_str",
+    [
+        "<account>{{ identifier }}</account><name>{{ displayname }}</name>",
+        "server=%%SIPSERVER%%:%%port%% vlan=%%vlanactive%% srtp=%%srtp%% id=%%vlanid%%",
+        "codecs=%%codecs%% meta=%%metadata%% missing=%%nope%% {{ missing }}",
+        "{{ vlanactive }} {{ vlanid }} {{ port }} {{ codecs }}",
+        "{# comentário #}%%identifier%%{# x #}",
+        "%%{{ name }}%%",
+        "%%vlan{{ missing }}active%%",
+        "x %%{{ pct }}",
+        "{{ displayname }} %% literal %% 100%",
+        "{% if vlanactive %}on{% endif %} %%vlanid%%",
+        "{{ displayname|upper }} %%port%%",
+        "",
+    ],
+)
+def test_plan_matches_legacy_two_pass_output(template_str):
+    plan = compile_plan(template_str)
+    assert plan.render(CONTEXT) == _legacy(template_str, CONTEXT)
+
+
+def test_plain_variables_compile_to_single_pass_plan():
+    plan = compile_plan("<a>{{ identifier }}</a><b>%%sipserver%%</b>")
+    assert plan.single_pass
+    assert plan.names == {"identifier"}
+    assert plan.render(CONTEXT) == "<a>1001</a><b>sip.example.com</b>"
+
+
+def test_tags_fall_back_to_django_engine():
+    plan = compile_plan("{% for c in codecs %}{{ c }},{% endfor %}")
+    assert not plan.single_pass
+    assert plan.render(CONTEXT) == "PCMU,PCMA,"
+
+
+def test_invalid_template_raises_syntax_error():
+    from django.template import TemplateSyntaxError
+
+    with pytest.raises(TemplateSyntaxError):
+        compile_plan("{% if %}")
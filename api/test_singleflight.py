@@ -0,0 +1,111 @@
+import asyncio
+import threading
+import time
+
+from asgiref.sync import async_to_sync
+
+import api.views as views
+from api.utils import template_cache
+from api.utils.singleflight import AsyncGroup, Group
+
+
+def _run_concurrently(n, target):
+    results, errors = [], []
+
+    def worker():
+        try:
+            results.append(target())
+        except Exception as exc:
+            errors.append(exc)
+
+    threads = [threading.Thread(target=worker) for _ in range(n)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join(timeout=5)
+    return results, errors
+
+
+def test_group_runs_once_and_shares_result():
+    group = Group()
+    calls = []
+
+    def slow():
+        calls.append(1)
+        time.sleep(0.2)
+        return "value"
+
+    results, errors = _run_concurrently(8, lambda: group.do("k", slow))
+    assert not errors
+    assert results == ["value"] * 8
+    assert len(calls) == 1
+    assert group.stats() == {"leaders": 1, "shared": 7, "in_flight": 0}
+
+    # sem voo em andamento, o próximo miss executa de novo
+    assert group.do("k", lambda: "again") == "again"
+
+
+def test_group_propagates_exception_to_waiters():
+    group = Group()
+
+    def failing():
+        time.sleep(0.2)
+        raise ValueError("boom")
+
+    results, errors = _run_concurrently(4, lambda: group.do("k", failing))
+    assert not results
+    assert len(errors) == 4 and all(isinstance(e, ValueError) for e in errors)
+    assert group.in_flight() == 0
+
+
+def test_async_group_coalesces_coroutines():
+    group = AsyncGroup()
+    calls = []
+
+    async def fetch():
+        calls.append(1)
+        await asyncio.sleep(0.05)
+        return 42
+
+    async def main():
+        return await asyncio.gather(*(group.do("k", fetch) for _ in range(5)))
+
+    assert async_to_sync(main)() == [42] * 5
+    assert len(calls) == 1
+    assert group.stats() == {"leaders": 1, "shared": 4}
+
+
+def test_concurrent_resolve_template_fetches_and_compiles_once(monkeypatch):
+    calls = []
+    compiles = []
+    real_compile = template_cache._compile
+
+    def slow_mongo(model, ext, ref=None):
+        calls.append((model, ext))
+        time.sleep(0.2)
+        return {"_id": "sf", "template": "<a>{{ identifier }}</a>"}
+
+    monkeypatch.setattr(views, "get_template_from_mongo", slow_mongo)
+    monkeypatch.setattr(template_cache, "_compile", lambda s: compiles.append(s) or real_compile(s))
+
+    results, errors = _run_concurrently(6, lambda: views.resolve_template(None, "T46", "xml"))
+    assert not errors
+    assert len(calls) == 1 and len(compiles) == 1
+    assert len({id(entry) for entry in results}) == 1
+
+
+def test_build_entry_compiles_once_under_contention(monkeypatch):
+    compiles = []
+    real_compile = template_cache._compile
+
+    def slow_compile(s):
+        compiles.append(s)
+        time.sleep(0.1)
+        return real_compile(s)
+
+    monkeypatch.setattr(template_cache, "_compile", slow_compile)
+    doc = {"_id": "c1", "template": "<b>{{ identifier }}</b>"}
+    results, errors = _run_concurrently(5, lambda: template_cache.build_entry(doc, doc["template"]))
+    assert not errors
+    assert len(compiles) == 1
+    assert len({id(entry.compiled) for entry in results}) == 1
@@ -0,0 +1,81 @@
+import pytest
+from django.test import Client
+
+import api.views as views
+from api.utils import template_cache
+from api.utils.lru import LRUCache
+from core.models import DeviceProfile, DeviceConfig
+
+
+def test_lru_cache_counts_hits_misses_and_evictions():
+    cache = LRUCache(maxsize=2)
+    cache.set("a", 1)
+    cache.set("b", 2)
+    assert cache.get("a") == 1
+    cache.set("c", 3)  # "b" é o menos usado -> removido
+    assert cache.get("b") is None
+    stats = cache.stats()
+    assert stats["hits"] == 1
+    assert stats["misses"] == 1
+    assert stats["evictions"] == 1
+    assert stats["size"] == 2
+
+
+def test_lru_cache_ttl_expires(monkeypatch):
+    now = [100.0]
+    monkeypatch.setattr("api.utils.lru.time.monotonic", lambda: now[0])
+    cache = LRUCache(maxsize=4, ttl=10)
+    cache.set("k", "v")
+    assert cache.get("k") == "v"
+    now[0] += 11
+    assert cache.get("k") is None
+
+
+def test_build_entry_reuses_compiled_template_per_version():
+    doc = {"_id": "t46s", "template": "<a>{{ identifier }}</a>"}
+    first = template_cache.build_entry(doc, doc["template"])
+    second = template_cache.build_entry(dict(doc), doc["template"])
+    assert first.compiled is second.compiled
+    assert first.version == second.version
+
+    changed = template_cache.build_entry({"_id": "t46s"}, "<b>{{ identifier }}</b>")
+    assert changed.version != first.version
+    assert changed.compiled is not first.compiled
+
+
+def test_invalidate_template_drops_resolved_and_compiled_entries():
+    doc = {"_id": "h2p", "template": "x"}
+    entry = template_cache.build_entry(doc, doc["template"])
+    template_cache.put_resolved(template_cache.lookup_key("", "h2p", "xml"), entry)
+    template_cache.put_resolved(template_cache.lookup_key("other", "t46", "xml"), entry)
+
+    removed = template_cache.invalidate_template("h2p")
+    assert removed == 3
+    assert template_cache.get_resolved(template_cache.lookup_key("", "h2p", "xml")) is None
+    assert template_cache.stats()["compiled"]["size"] == 0
+
+
+@pytest.mark.django_db
+def test_download_config_steady_state_skips_mongo(monkeypatch):
+    calls = []
+
+    def fake_lookup(model, ext):
+        calls.append((model, ext))
+        return {"_id": "model-tpl", "template": "cfg {{ identifier }}"}
+
+    monkeypatch.setattr(views, "get_template_from_mongo", fake_lookup)
+    profile = DeviceProfile.objects.create(name="TC")
+    DeviceConfig.objects.create(profile=profile, identifier="dev-tc", mac_address="aabbccddee01")
+
+    client = Client()
+    for _ in range(3):
+        resp = client.get("/api/download-xml/", HTTP_USER_AGENT="Vendor Model 1.0 dev-tc")
+        assert resp.status_code == 200
+        assert resp.content == b"cfg dev-tc"
+    assert len(calls) == 1
+    assert template_cache.stats()["resolved"]["hits"] == 2
+
+    # após invalidação (import/remoção do template) o próximo request volta ao Mongo
+    template_cache.invalidate_template("model-tpl")
+    client.get("/api/download-xml/", HTTP_USER_AGENT="Vendor Model 1.0 dev-tc")
+    assert len(calls) == 2
@@ -0,0 +1,95 @@
+import zlib
+
+import pytest
+from django.core.management import call_command
+
+import api.views as views
+from api.bench.fakemongo import FakeMongoDB
+from api.bench.provisioning import fake_mongo
+from api.utils import template_cache
+from api.utils.templates import (
+    TEMPLATE_INDEXES, TEMPLATES_COLLECTION, encode_template_body, ensure_template_indexes, template_text,
+)
+
+TEXT = "<cfg><acc>{{ identifier }}</acc></cfg>"
+
+
+def test_encoded_body_round_trips_and_legacy_fields_still_read():
+    fields = encode_template_body(TEXT)
+    assert fields["body_codec"] == "zlib" and fields["size"] == len(TEXT)
+    assert fields["content_hash"] == template_cache.template_version({}, TEXT)
+    assert template_text({"_id": "t", **fields}) == TEXT
+
+    assert template_text({"template": "new", "content": "old"}) == "new"
+    assert template_text({"content": "old"}) == "old"
+    assert template_text({"_id": "t", "content_hash": "abc"}) is None
+    with pytest.raises(ValueError):
+        template_text({"_id": "t", "body": zlib.compress(b"x"), "body_codec": "lz4"})
+
+
+def test_ensure_indexes_drops_the_unused_collated_index():
+    class _Indexes:
+        def __init__(self):
+            self.names = {"_id_", "model_extension_ci"}
+
+        def index_information(self):
+            return {name: {} for name in self.names}
+
+        def drop_index(self, name):
+            self.names.remove(name)
+
+        def create_index(self, keys, **options):
+            assert "collation" not in options
+            self.names.add(options["name"])
+            return options["name"]
+
+    coll = _Indexes()
+    assert ensure_template_indexes(coll) == [options["name"] for _, options in TEMPLATE_INDEXES]
+    assert "model_extension_ci" not in coll.names
+
+
+def test_resolve_fetches_body_only_when_the_version_is_not_compiled():
+    db = FakeMongoDB()
+    db.get_collection(TEMPLATES_COLLECTION).insert_many([
+        {"_id": "t46", "model_lc": "t46", "extension": "xml", **encode_template_body(TEXT)},
+    ])
+    with fake_mongo(db):
+        first = views.resolve_template(None, "T46", "xml")
+        assert db.queries == 2  # aggregate sem corpo + find_one do corpo
+
+        # TTL do resolved expirado: o aggregate traz só o hash e o plano compilado é reaproveitado
+        template_cache._caches()[0].clear()
+        second = views.resolve_template(None, "T46", "xml")
+        assert db.queries == 3
+    assert second.compiled is first.compiled
+    assert views.render_compiled(second.compiled, {"identifier": "dev-1"}) == "<cfg><acc>dev-1</acc></cfg>"
+
+
+class MockColl:
+    def __init__(self, docs):
+        self.docs = docs
+        self.writes = []
+
+    def find(self, query, projection=None):
+        return [dict(d) for d in self.docs if "body" not in d]
+
+    def bulk_write(self, ops, ordered=True):
+        self.writes.extend(ops)
+
+
+def test_compress_templates_command_rewrites_legacy_docs(monkeypatch, capsys):
+    coll = MockColl([
+        {"_id": "a", "template": TEXT, "content": TEXT},
+        {"_id": "b", "content": "only content"},
+        {"_id": "c", "template": None},
+    ])
+    monkeypatch.setattr("core.management.commands.compress_templates.get_mongo_client", lambda: object())
+    monkeypatch.setattr("core.management.commands.compress_templates.get_templates_collection", lambda db: coll)
+
+    call_command("compress_templates", "--batch-size", "1")
+
+    assert [op._filter["_id"] for op in coll.writes] == ["a", "b"]
+    update = coll.writes[0]._doc
+    assert template_text(update["$set"]) == TEXT
+    assert set(update["$unset"]) == {"template", "content"}
+    assert "2 templates convertidos" in capsys.readouterr().out
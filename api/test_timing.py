@@ -0,0 +1,69 @@
+import logging
+
+import pytest
+from django.test import Client
+
+import api.views as views
+from api.bench.fakemongo import FakeMongoDB
+from api.utils import timing
+from api.utils.templates import TEMPLATES_COLLECTION
+from core.models import DeviceProfile, DeviceConfig
+
+UA = "Yealink T46 66.1 aabbcc0000e1"
+
+
+@pytest.fixture
+def device(db, monkeypatch):
+    mongo = FakeMongoDB()
+    mongo.get_collection(TEMPLATES_COLLECTION).insert_many([
+        {"_id": "t46", "model_lc": "t46", "extension": "xml", "template": "<cfg>%%account%%</cfg>"},
+    ])
+    monkeypatch.setattr(views, "get_mongo_client", lambda: mongo)
+    profile = DeviceProfile.objects.create(name="TIMING")
+    return DeviceConfig.objects.create(profile=profile, identifier="t-1", mac_address="aabbcc0000e1")
+
+
+def _phases(header):
+    return [part.split(";")[0] for part in header.split(", ")]
+
+
+@pytest.mark.django_db
+def test_server_timing_header_and_structured_log(device, caplog):
+    with caplog.at_level(logging.INFO, logger="api.utils.timing"):
+        resp = Client().get("/api/download-xml/", HTTP_USER_AGENT=UA)
+    assert resp.status_code == 200
+    assert _phases(resp["Server-Timing"]) == ["ua", "device", "mongo", "compile", "template", "validate", "render", "total"]
+
+    (record,) = [r for r in caplog.records if hasattr(r, "provision_timing")]
+    fields = record.provision_timing
+    assert fields["status"] == 200
+    assert fields["device_id"] == device.pk
+    assert set(fields["phases_ms"]) >= {"device", "template", "render", "total"}
+
+    # segundo request: template em cache, sem Mongo nem compilação
+    resp = Client().get("/api/download-xml/", HTTP_USER_AGENT=UA, HTTP_IF_NONE_MATCH=resp["ETag"])
+    assert resp.status_code == 304
+    assert _phases(resp["Server-Timing"]) == ["ua", "device", "template", "validate", "total"]
+
+
+@pytest.mark.django_db
+@pytest.mark.parametrize("conf", [{"ENABLED": False}, {"SAMPLE_RATE": 0.0}, {"HEADER": False, "LOG": False}])
+def test_timing_can_be_disabled_or_sampled_out(device, settings, caplog, conf):
+    settings.PROVISION_TIMING = conf
+    with caplog.at_level(logging.INFO, logger="api.utils.timing"):
+        resp = Client().get("/api/download-xml/", HTTP_USER_AGENT=UA)
+    assert resp.status_code == 200
+    assert "Server-Timing" not in resp
+    assert not [r for r in caplog.records if hasattr(r, "provision_timing")]
+
+
+def test_phase_outside_request_is_noop():
+    assert timing.current() is None
+    with timing.phase("device"):
+        pass
+    with timing.request_timer() as timer:
+        with timing.phase("device"):
+            pass
+        assert timing.current() is timer
+    assert timing.current() is None
+    assert list(timer.phases) == ["device"]
@@ -0,0 +1,56 @@
+import pytest
+
+import api.views as views
+from api.bench import user_agents as ua_bench
+from api.utils import user_agents
+from api.utils.user_agents import UserAgentRegistry, VendorParser
+
+
+@pytest.mark.parametrize("ua,expected", [
+    ("Yealink SIP-T46S 66.86.0.15 80:5e:c0:12:34:56", ("Yealink", "SIP-T46S", "66.86.0.15", "80:5e:c0:12:34:56")),
+    ("Fanvil X4 2.4.5.1 0c383e112233", ("Fanvil", "X4", "2.4.5.1", "0c383e112233")),
+    ("Grandstream Model HW GRP2614 V1.0A SW 1.0.5.15 DevId c074ad112233",
+     ("Grandstream", "GRP2614", "1.0.5.15", "c074ad112233")),
+    ("Grandstream GXP2000 (HW 1.0, SW 1.0.9.69, DevId 000b82a1b2c3)",
+     ("Grandstream", "GXP2000", "1.0.9.69", "000b82a1b2c3")),
+    ("FileTransport PolycomVVX-VVX_411-UA/5.9.5.0614 (SN:0004f2aabbcc) Type/Application",
+     ("Polycom", "VVX_411", "5.9.5.0614", "0004f2aabbcc")),
+    ("Cisco/SPA504G-7.5.5 (0018B9AABBCC)(CCQ162306EA)", ("Cisco", "SPA504G", "7.5.5", "0018B9AABBCC")),
+    ("Cisco-CP-7841-3PCC/11.3.1 (00562b043615)", ("Cisco", "CP-7841-3PCC", "11.3.1", "00562b043615")),
+    # layout genérico (e identificadores que não são MAC) continuam como antes
+    ("Ale H2P 2.10 3c28a60357a0", ("Ale", "H2P", "2.10", "3c28a60357a0")),
+    ("Yealink T46 66.1 ramal 1001", ("Yealink", "T46", "66.1", "ramal 1001")),
+])
+def test_vendor_formats(ua, expected):
+    assert views.parse_user_agent_string(ua) == expected
+
+
+def test_unparseable_user_agents_are_rejected():
+    assert views.parse_user_agent_string("Cisco/SPA504G") is None
+    assert views.parse_user_agent_string("") is None
+
+
+def test_results_are_memoized_by_raw_user_agent():
+    registry = UserAgentRegistry()
+    ua = "Cisco/SPA504G-7.5.5 (0018B9AABBCC)(CCQ162306EA)"
+    assert registry.parse(ua) == registry.parse(ua)
+    assert registry.parse("scanner") is None and registry.parse("scanner") is None
+    stats = registry.stats()
+    assert stats["hits"] == 2 and stats["misses"] == 2
+    registry.parse("x" * (user_agents.MAX_MEMO_LENGTH + 1))
+    assert registry.stats()["size"] == 2
+
+
+def test_registered_parser_is_dispatched_by_first_token():
+    registry = UserAgentRegistry()
+    ua = "snom320/8.7.3.25 mac=000413aabbcc"
+    assert registry.parse(ua) is None
+    registry.register(VendorParser("Snom", ("snom320",), r"snom(?P<model>\d+)/(?P<version>\S+) mac=(?P<identifier>\w+)"))
+    assert registry.parse(ua) == ("Snom", "320", "8.7.3.25", "000413aabbcc")
+
+
+def test_benchmark_parses_whole_corpus():
+    rows = {row["variant"]: row for row in ua_bench.run(devices=30, rounds=1)}
+    total = len(ua_bench.CORPUS)
+    assert rows["registry, memoized"]["accepted"] == f"{total}/{total}"
+    assert rows["legacy split"]["accepted"] != f"{total}/{total}"
@@ -1,10 +1,15 @@
+from django.conf import settings
 from django.urls import path, re_path
-from .views import download_config
-from . import oauth_views
+from .views import download_config, download_config_async
+from . import oauth_views, report_views
 
 app_name = "api"
 
+# ASGI (uvicorn): settings.PROVISION_ASYNC_DOWNLOAD seleciona a view assíncrona
+download_view = download_config_async if getattr(settings, "PROVISION_ASYNC_DOWNLOAD", False) else download_config
+
 urlpatterns = [
-    re_path(r'^download-xml(?:/(?P<filename>[^/]+))?/$', download_config, name='download-xml'),
+    re_path(r'^download-xml(?:/(?P<filename>[^/]+))?/$', download_view, name='download-xml'),
     path('whoami/', oauth_views.whoami, name='whoami'),
-]
\ No newline at end of file
+    path('provisioning-stats/', report_views.provisioning_stats, name='provisioning-stats'),
+]
@@ -0,0 +1,199 @@
+"""
+Content-addressed store of pre-rendered device configurations (see api.prerender).
+
+Layout under settings.PROVISION_ARTIFACTS['DIR']:
+
+    objects/ab/<sha256>        rendered bytes, named by the sha256 of their content
+    objects/ab/<sha256>.gz     encoded variants (.gz, .br; api.utils.compression), when enabled
+    etags/ab/<etag>            symlink -> object; <etag> is the download-xml ETag (without quotes)
+    devices/<ext>/<mac>        symlink -> latest object for a device (for nginx try_files)
+    manifest.json              {"<device pk>.<ext>": {"etag", "sha256", "mac"}} of the last run
+
+The ETag (api.views.config_validators) already hashes everything that goes into a render:
+template version, DeviceConfig/DeviceProfile updated_at and the User-Agent. So an artifact found
+by ETag is always the exact bytes the view would render, and the view can serve it instead.
+Writes go to a temporary file followed by os.replace(), so readers never see partial files.
+
+DIR has no default: it must be a volume shared by the prerender job and the web instances and
+surviving restarts (on Cloud Run, a Cloud Storage FUSE or NFS mount), never the container's own
+disk. With SERVE on and DIR unset or not mounted, download-xml logs a warning once per worker
+and renders as usual.
+"""
+
+from django.conf import settings
+import hashlib
+import json
+import logging
+import os
+import tempfile
+import threading
+
+logger = logging.getLogger(__name__)
+
+MANIFEST = "manifest.json"
+# sufixo dos arquivos com as variantes codificadas (o .gz segue a convenção do gzip_static do nginx)
+ENCODED_SUFFIXES = {"gzip": ".gz", "br": ".br"}
+
+# (SERVE, DIR) -> ArtifactStore ou None, resolvido uma vez por worker
+_serving = {}
+_serving_lock = threading.Lock()
+
+
+def _etag_name(etag: str) -> str:
+    return etag.strip().strip('"')
+
+
+class ArtifactStore:
+    def __init__(self, root):
+        self.root = os.fspath(root)
+
+    # --- paths ---
+    def object_path(self, sha: str) -> str:
+        return os.path.join(self.root, "objects", sha[:2], sha)
+
+    def etag_path(self, etag: str) -> str:
+        name = _etag_name(etag)
+        return os.path.join(self.root, "etags", name[:2], name)
+
+    def device_path(self, ext: str, mac: str) -> str:
+        return os.path.join(self.root, "devices", ext, mac)
+
+    # --- writes ---
+    def _atomic_write(self, path: str, data: bytes) -> None:
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        fd, tmp = tempfile.mkstemp(dir=os.path.dirname(path), prefix=".tmp-")
+        try:
+            with os.fdopen(fd, "wb") as fh:
+                fh.write(data)
+            os.replace(tmp, path)
+        except BaseException:
+            if os.path.exists(tmp):
+                os.unlink(tmp)
+            raise
+
+    def _atomic_symlink(self, target: str, path: str) -> None:
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        rel = os.path.relpath(target, os.path.dirname(path))
+        tmp = f"{path}.tmp-{os.getpid()}"
+        if os.path.lexists(tmp):
+            os.unlink(tmp)
+        os.symlink(rel, tmp)
+        os.replace(tmp, path)
+
+    def put(self, etag: str, content: bytes) -> str:
+        """Store content under its sha256 and link the ETag to it. Returns the sha256."""
+        sha = hashlib.sha256(content).hexdigest()
+        obj = self.object_path(sha)
+        if not os.path.exists(obj):
+            self._atomic_write(obj, content)
+        self._atomic_symlink(obj, self.etag_path(etag))
+        return sha
+
+    def put_encoded(self, sha: str, coding: str, data: bytes) -> None:
+        """Store the coding's variant of object sha next to it."""
+        path = self.object_path(sha) + ENCODED_SUFFIXES[coding]
+        if not os.path.exists(path):
+            self._atomic_write(path, data)
+
+    def link_device(self, ext: str, mac: str, sha: str) -> None:
+        if mac:
+            self._atomic_symlink(self.object_path(sha), self.device_path(ext, mac))
+
+    # --- reads ---
+    def has(self, etag: str) -> bool:
+        return os.path.exists(self.etag_path(etag))
+
+    def get(self, etag: str):
+        """Bytes rendered for etag, or None."""
+        try:
+            with open(self.etag_path(etag), "rb") as fh:
+                return fh.read()
+        except OSError:
+            return None
+
+    def get_encoded(self, etag: str, coding: str):
+        """Encoded variant of the bytes rendered for etag, or None if it was not stored."""
+        suffix = ENCODED_SUFFIXES.get(coding)
+        if suffix is None:
+            return None
+        try:
+            with open(os.path.realpath(self.etag_path(etag)) + suffix, "rb") as fh:
+                return fh.read()
+        except OSError:
+            return None
+
+    # --- manifest ---
+    def load_manifest(self) -> dict:
+        try:
+            with open(os.path.join(self.root, MANIFEST), "r", encoding="utf-8") as fh:
+                return json.load(fh)
+        except FileNotFoundError:
+            return {}
+        except (OSError, ValueError):
+            logger.warning("Artifact manifest unreadable; starting from scratch", exc_info=True)
+            return {}
+
+    def save_manifest(self, manifest: dict) -> None:
+        data = json.dumps(manifest, separators=(",", ":"), sort_keys=True).encode("utf-8")
+        self._atomic_write(os.path.join(self.root, MANIFEST), data)
+
+    def prune(self, manifest: dict) -> int:
+        """Remove objects and ETag links not referenced by manifest. Returns files removed."""
+        keep_shas = {entry["sha256"] for entry in manifest.values()}
+        keep_etags = {_etag_name(entry["etag"]) for entry in manifest.values()}
+        removed = 0
+        for sub, keep in (("etags", keep_etags), ("objects", keep_shas)):
+            base = os.path.join(self.root, sub)
+            for dirpath, _, files in os.walk(base):
+                for name in files:
+                    # variantes codificadas acompanham o objeto (<sha>.gz, <sha>.br)
+                    if name.split(".", 1)[0] not in keep:
+                        os.unlink(os.path.join(dirpath, name))
+                        removed += 1
+        return removed
+
+
+def _artifact_settings() -> dict:
+    return getattr(settings, "PROVISION_ARTIFACTS", None) or {}
+
+
+def get_store():
+    root = _artifact_settings().get("DIR")
+    return ArtifactStore(root) if root else None
+
+
+def _resolve_serving_store(serve: bool, root):
+    if not serve:
+        return None
+    if not root:
+        logger.warning(
+            "PROVISION_ARTIFACTS['SERVE'] is on but DIR is not set; rendering every download. "
+            "Point PROVISION_ARTIFACTS_DIR at the mounted volume the prerender job writes to."
+        )
+        return None
+    if not os.path.isdir(root):
+        logger.warning(
+            "PROVISION_ARTIFACTS['DIR'] %r does not exist (volume not mounted?); rendering every download.", root,
+        )
+        return None
+    return ArtifactStore(root)
+
+
+def serving_store():
+    """The store download-xml should serve from, or None when serving is disabled or unavailable."""
+    conf = _artifact_settings()
+    key = (bool(conf.get("SERVE")), conf.get("DIR"))
+    try:
+        return _serving[key]
+    except KeyError:
+        pass
+    with _serving_lock:
+        if key not in _serving:
+            _serving[key] = _resolve_serving_store(*key)
+        return _serving[key]
+
+
+def clear() -> None:
+    """Forget the resolved serving store (tests; settings or mounts changed)."""
+    with _serving_lock:
+        _serving.clear()
@@ -0,0 +1,167 @@
+"""
+Write-behind buffer shared by the provisioning hot-path writers.
+
+Request threads only append to an in-memory buffer; a daemon thread per writer flushes it
+in batches when `max_batch` items are pending or every `flush_interval` seconds, whichever
+comes first. Pending items are also flushed at interpreter exit (gunicorn worker shutdown).
+Subclasses decide how items are stored (_put/_take) and written (_write).
+"""
+
+import atexit
+import logging
+import threading
+import weakref
+
+logger = logging.getLogger(__name__)
+
+OVERFLOW_DROP_OLDEST = "drop_oldest"
+OVERFLOW_DROP_NEW = "drop_new"
+OVERFLOW_SYNC = "sync"
+OVERFLOW_POLICIES = (OVERFLOW_DROP_OLDEST, OVERFLOW_DROP_NEW, OVERFLOW_SYNC)
+
+_live_writers = weakref.WeakSet()
+
+
+class BufferedWriter:
+    """
+    Base class for bounded write-behind buffers.
+
+    overflow policy when `max_pending` items are already buffered:
+      - drop_oldest: discard the oldest pending item (default; newest data wins);
+      - drop_new:    discard the incoming item;
+      - sync:        flush synchronously in the calling thread, then buffer the item.
+    """
+
+    name = "buffered-writer"
+
+    def __init__(self, max_batch: int = 500, flush_interval: float = 2.0, max_pending: int = 10000,
+                 overflow: str = OVERFLOW_DROP_OLDEST, background: bool = True):
+        if overflow not in OVERFLOW_POLICIES:
+            raise ValueError(f"unknown overflow policy {overflow!r}; expected one of {OVERFLOW_POLICIES}")
+        self.max_batch = max(1, int(max_batch))
+        self.flush_interval = max(0.05, float(flush_interval))
+        self.max_pending = max(self.max_batch, int(max_pending))
+        self.overflow = overflow
+        self.background = background
+        self.dropped = 0
+        self.written = 0
+        self.failed = 0
+        self._lock = threading.Lock()
+        self._flush_lock = threading.Lock()
+        self._wakeup = threading.Event()
+        self._stopping = False
+        self._thread = None
+        _live_writers.add(self)
+
+    # --- storage hooks (called with self._lock held) ---
+    def _put(self, item) -> None:
+        raise NotImplementedError
+
+    def _pop_oldest(self) -> None:
+        raise NotImplementedError
+
+    def _take(self, limit: int) -> list:
+        raise NotImplementedError
+
+    def _pending(self) -> int:
+        raise NotImplementedError
+
+    # --- output hook (called from the flushing thread, without self._lock) ---
+    def _write(self, batch: list) -> None:
+        raise NotImplementedError
+
+    def add(self, item) -> bool:
+        """Buffer item. Returns False if it was dropped by the overflow policy."""
+        flush_now = False
+        with self._lock:
+            if self._pending() >= self.max_pending:
+                if self.overflow == OVERFLOW_DROP_NEW:
+                    self.dropped += 1
+                    return False
+                if self.overflow == OVERFLOW_DROP_OLDEST:
+                    self._pop_oldest()
+                    self.dropped += 1
+                else:
+                    flush_now = True
+            if not flush_now:
+                self._put(item)
+                pending = self._pending()
+        if flush_now:
+            self.flush()
+            with self._lock:
+                self._put(item)
+                pending = self._pending()
+        if self.background:
+            self._ensure_thread()
+            if pending >= self.max_batch:
+                self._wakeup.set()
+        return True
+
+    def pending(self) -> int:
+        with self._lock:
+            return self._pending()
+
+    def flush(self) -> int:
+        """Write everything pending in batches of max_batch. Returns the number of items written."""
+        total = 0
+        with self._flush_lock:
+            while True:
+                with self._lock:
+                    batch = self._take(self.max_batch)
+                if not batch:
+                    break
+                try:
+                    self._write(batch)
+                    self.written += len(batch)
+                    total += len(batch)
+                except Exception:
+                    self.failed += len(batch)
+                    logger.exception("%s: failed to write batch of %s items", self.name, len(batch))
+        return total
+
+    def stats(self) -> dict:
+        return {
+            "pending": self.pending(),
+            "written": self.written,
+            "dropped": self.dropped,
+            "failed": self.failed,
+        }
+
+    def close(self) -> None:
+        """Stop the flusher thread and write whatever is still pending."""
+        self._stopping = True
+        self._wakeup.set()
+        thread = self._thread
+        if thread is not None and thread.is_alive() and thread is not threading.current_thread():
+            thread.join(timeout=self.flush_interval + 5)
+        self.flush()
+
+    def _ensure_thread(self) -> None:
+        thread = self._thread
+        if thread is not None and thread.is_alive():
+            return
+        with self._lock:
+            if self._thread is not None and self._thread.is_alive():
+                return
+            self._stopping = False
+            self._thread = threading.Thread(target=self._run, name=self.name, daemon=True)
+            self._thread.start()
+
+    def _run(self) -> None:
+        from django.db import close_old_connections
+
+        while not self._stopping:
+            self._wakeup.wait(self.flush_interval)
+            self._wakeup.clear()
+            close_old_connections()
+            self.flush()
+            close_old_connections()
+
+
+@atexit.register
+def _flush_all_writers():
+    for writer in list(_live_writers):
+        try:
+            writer.close()
+        except Exception:
+            logger.exception("%s: flush on shutdown failed", writer.name)
@@ -0,0 +1,182 @@
+"""
+Client IP extraction behind trusted reverse proxies (download-xml events and rate limits).
+
+X-Forwarded-For is a list every proxy appends to, so only the hops added by proxies we trust
+mean anything: everything left of the first untrusted hop can be written by the client. The
+client address is found by walking from REMOTE_ADDR leftwards through X-Forwarded-For while
+the address is a trusted proxy; the first untrusted address is the client. When REMOTE_ADDR
+itself is not trusted the header is ignored. A malformed hop stops the walk (the last trusted
+address is used), and a chain made only of trusted addresses resolves to its leftmost one
+(a phone on the same LAN as the proxy).
+
+Only the operator's own proxies may be trusted: by default just loopback, and otherwise the
+load balancer ranges from settings. Trusting whole private ranges would let a phone behind a
+LAN proxy or NAT hop prepend any public address and choose its own rate-limit key.
+
+The private (LAN) address recorded with Provisioning events is the client itself when private,
+else the nearest private hop left of a public client, else the one the phone reports in
+X-Private-IP and similar headers. The header is self-reported, so it only fills the gap when
+the walk found no private address. Either way the value is informative: the rate limiter keys
+on the client address, which a client cannot choose.
+
+TrustedNetworks compiles the configured CIDRs once into {prefix length: set of network
+integers} per IP version, so a membership test is one shift and set lookup per distinct prefix
+length. Resolutions are memoized per (X-Forwarded-For, REMOTE_ADDR) in an LRU, and
+for_request() keeps the result on the request, so the rate limiter and the event recorder
+share one resolution per request.
+
+Configured by settings.PROVISION_CLIENT_IP (TRUSTED_PROXIES: CIDRs as a list or a
+comma-separated string, loopback only by default; CACHE_SIZE).
+"""
+
+from collections import namedtuple
+from django.conf import settings
+import ipaddress
+import threading
+
+from api.utils.lru import LRUCache
+
+# só o proxy local; as faixas do load balancer vêm de settings.PROVISION_CLIENT_IP['TRUSTED_PROXIES']
+DEFAULT_TRUSTED_PROXIES = ("127.0.0.0/8", "::1/128")
+
+# public_ip: endereço do cliente (chave do rate limit); private_ip: endereço na LAN, informativo
+ClientAddress = namedtuple("ClientAddress", ["public_ip", "private_ip"])
+
+PRIVATE_IP_HEADERS = ("HTTP_X_PRIVATE_IP", "HTTP_X_DEVICE_PRIVATE_IP", "HTTP_X_LOCAL_IP", "HTTP_X_CLIENT_IP")
+
+_REQUEST_ATTR = "_provision_client_address"
+_MISS = object()
+
+_resolver = None
+_resolver_lock = threading.Lock()
+
+
+def _parse_ip(value):
+    try:
+        return ipaddress.ip_address(value.strip())
+    except (ValueError, AttributeError):
+        return None
+
+
+class TrustedNetworks:
+    """Set of CIDRs compiled for membership tests by prefix length."""
+
+    def __init__(self, cidrs):
+        tables = {4: {}, 6: {}}
+        for cidr in cidrs:
+            net = ipaddress.ip_network(cidr.strip(), strict=False)
+            tables[net.version].setdefault(net.prefixlen, set()).add(int(net.network_address))
+        # por versão: [(bits a descartar, redes com esse prefixo)]
+        self._lookup = {
+            version: [(bits - plen, nets) for plen, nets in sorted(tables[version].items())]
+            for version, bits in ((4, 32), (6, 128))
+        }
+
+    def __contains__(self, ip) -> bool:
+        if ip.version == 6 and ip.ipv4_mapped is not None:
+            ip = ip.ipv4_mapped
+        value = int(ip)
+        for shift, nets in self._lookup[ip.version]:
+            if (value >> shift) << shift in nets:
+                return True
+        return False
+
+
+class ClientIPResolver:
+    """Trusted-proxy walk over X-Forwarded-For, memoized per (X-Forwarded-For, REMOTE_ADDR)."""
+
+    def __init__(self, trusted_proxies=DEFAULT_TRUSTED_PROXIES, cache_size: int = 10000):
+        self.trusted = TrustedNetworks(trusted_proxies)
+        self._memo = LRUCache(maxsize=cache_size)
+
+    def resolve(self, xff: str, remote_addr: str):
+        """(client ip or None, private ip or None) for this header pair; see _walk."""
+        key = (xff or "", remote_addr or "")
+        result = self._memo.get(key, _MISS)
+        if result is _MISS:
+            result = self._walk(*key)
+            self._memo.set(key, result)
+        return result
+
+    def _walk(self, xff: str, remote_addr: str):
+        current = _parse_ip(remote_addr)
+        if current is None:
+            return None, None
+        hops = [h for h in xff.split(",") if h.strip()] if xff else []
+        left = []
+        if hops and current in self.trusted:
+            while hops:
+                ip = _parse_ip(hops.pop())
+                if ip is None:
+                    break
+                current = ip
+                if ip not in self.trusted:
+                    left = hops
+                    break
+        if current.is_private:
+            return str(current), str(current)
+        # cliente público: o hop privado mais próximo à esquerda é o endereço na LAN informado
+        # pelo lado do cliente (NAT/proxy do site). Informativo; nunca usado como chave de limite.
+        for hop in reversed(left):
+            ip = _parse_ip(hop)
+            if ip is not None and ip.is_private:
+                return str(current), str(ip)
+        return str(current), None
+
+    def stats(self) -> dict:
+        return self._memo.stats()
+
+
+def _client_ip_settings() -> dict:
+    return getattr(settings, "PROVISION_CLIENT_IP", None) or {}
+
+
+def get_resolver() -> ClientIPResolver:
+    global _resolver
+    if _resolver is None:
+        with _resolver_lock:
+            if _resolver is None:
+                conf = _client_ip_settings()
+                proxies = conf.get("TRUSTED_PROXIES")
+                if proxies is None:
+                    proxies = DEFAULT_TRUSTED_PROXIES
+                elif isinstance(proxies, str):
+                    proxies = [p for p in proxies.split(",") if p.strip()]
+                _resolver = ClientIPResolver(proxies, cache_size=int(conf.get("CACHE_SIZE") or 10000))
+    return _resolver
+
+
+def set_resolver(resolver):
+    """Replace this worker's resolver (tests; None rebuilds it from settings). Returns the previous one."""
+    global _resolver
+    with _resolver_lock:
+        previous, _resolver = _resolver, resolver
+    return previous
+
+
+def _reported_private_ip(meta: dict):
+    """First private address in the headers the phone (or its local proxy) fills with its own IP."""
+    for header in PRIVATE_IP_HEADERS:
+        value = meta.get(header)
+        if not value:
+            continue
+        for candidate in value.split(","):
+            ip = _parse_ip(candidate)
+            if ip is not None and ip.is_private:
+                return str(ip)
+    return None
+
+
+def for_request(request) -> ClientAddress:
+    """ClientAddress of request (computed once per request)."""
+    address = getattr(request, _REQUEST_ATTR, None)
+    if address is None:
+        meta = request.META
+        public_ip, private_ip = get_resolver().resolve(meta.get("HTTP_X_FORWARDED_FOR"), meta.get("REMOTE_ADDR"))
+        # o endereço resolvido pelos proxies confiáveis prevalece sobre o cabeçalho informado pelo aparelho
+        address = ClientAddress(public_ip, private_ip or _reported_private_ip(meta))
+        try:
+            setattr(request, _REQUEST_ATTR, address)
+        except AttributeError:
+            pass
+    return address
@@ -0,0 +1,175 @@
+"""
+Content-Encoding negotiation and cached compressed bodies for config downloads.
+
+download_config picks a coding from Accept-Encoding (negotiate()) before its conditional
+check: each encoded representation gets its own strong ETag ("<etag>" -> "<etag>-gzip", see
+variant_etag), so caches and If-None-Match never mix gzip and identity bytes. The compressed
+bytes are cached per worker under (base ETag, coding); since the ETag already identifies the
+rendered bytes, a repeat fetch costs an LRU lookup instead of a compression. Pre-rendered
+artifacts (api.prerender) also get their encoded variants written next to the object, so
+they are read from disk without compressing at all (see ArtifactStore.get_encoded).
+
+brotli ('br') is used only when the optional `brotli` package is installed; gzip always is.
+Vendors whose firmware mishandles Content-Encoding are listed in EXCLUDE_VENDORS and always
+get identity responses. Configured by settings.PROVISION_COMPRESSION (ENABLED, CODINGS,
+MIN_SIZE, GZIP_LEVEL, BROTLI_QUALITY, CACHE_SIZE, EXCLUDE_VENDORS).
+"""
+
+from django.conf import settings
+from django.utils.cache import patch_vary_headers
+import functools
+import gzip
+import logging
+import threading
+
+from api.utils import timing
+from api.utils.lru import LRUCache
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+logger = logging.getLogger(__name__)
+
+GZIP = "gzip"
+BROTLI = "br"
+# preferência do servidor quando o cliente aceita as duas com o mesmo q
+SUPPORTED = (BROTLI, GZIP)
+
+_cache = None
+_cache_lock = threading.Lock()
+
+
+def _compression_settings() -> dict:
+    return getattr(settings, "PROVISION_COMPRESSION", None) or {}
+
+
+def available_codings(conf: dict = None) -> tuple:
+    """Codings enabled in settings and usable in this process, in server preference order."""
+    conf = _compression_settings() if conf is None else conf
+    if not conf.get("ENABLED", True):
+        return ()
+    wanted = conf.get("CODINGS") or SUPPORTED
+    if isinstance(wanted, str):
+        wanted = [c.strip() for c in wanted.split(",")]
+    return tuple(c for c in SUPPORTED if c in wanted and (c != BROTLI or brotli is not None))
+
+
+def _excluded_vendors(conf: dict) -> frozenset:
+    vendors = conf.get("EXCLUDE_VENDORS") or ()
+    if isinstance(vendors, str):
+        vendors = vendors.split(",")
+    return frozenset(v.strip().lower() for v in vendors if v and v.strip())
+
+
+@functools.lru_cache(maxsize=256)
+def _accepted(header: str) -> dict:
+    """{coding: q} from an Accept-Encoding value (lower-cased codings; '*' kept as is)."""
+    accepted = {}
+    for part in header.split(","):
+        coding, _, params = part.strip().partition(";")
+        coding = coding.strip().lower()
+        if not coding:
+            continue
+        q = 1.0
+        for param in params.split(";"):
+            name, _, value = param.strip().partition("=")
+            if name.strip().lower() == "q":
+                try:
+                    q = float(value)
+                except ValueError:
+                    q = 0.0
+        accepted[coding] = q
+    return accepted
+
+
+def negotiate(request, vendor: str = None):
+    """Coding to use for this request ('br', 'gzip') or None for identity."""
+    conf = _compression_settings()
+    codings = available_codings(conf)
+    if not codings:
+        return None
+    if vendor and vendor.strip().lower() in _excluded_vendors(conf):
+        return None
+    header = request.META.get("HTTP_ACCEPT_ENCODING") or ""
+    if not header:
+        return None
+    accepted = _accepted(header)
+    best, best_q = None, 0.0
+    for coding in codings:
+        q = accepted.get(coding, accepted.get("*", 0.0))
+        if q > best_q:
+            best, best_q = coding, q
+    return best
+
+
+def variant_etag(etag: str, coding) -> str:
+    """Strong ETag of the coding's representation: '"abc"' -> '"abc-gzip"' (identity unchanged)."""
+    if not coding or not etag:
+        return etag
+    return f'{etag[:-1]}-{coding}"' if etag.endswith('"') else f"{etag}-{coding}"
+
+
+def compress(data: bytes, coding: str, conf: dict = None) -> bytes:
+    conf = _compression_settings() if conf is None else conf
+    if coding == GZIP:
+        # mtime=0: mesma entrada -> mesmos bytes em qualquer worker
+        return gzip.compress(data, compresslevel=int(conf.get("GZIP_LEVEL") or 6), mtime=0)
+    if coding == BROTLI and brotli is not None:
+        return brotli.compress(data, quality=int(conf.get("BROTLI_QUALITY") or 5))
+    raise ValueError(f"unsupported coding {coding!r}")
+
+
+def _get_cache() -> LRUCache:
+    global _cache
+    if _cache is None:
+        with _cache_lock:
+            if _cache is None:
+                _cache = LRUCache(maxsize=int(_compression_settings().get("CACHE_SIZE") or 1024))
+    return _cache
+
+
+def encoded_body(key, data: bytes, coding: str, loader=None) -> bytes:
+    """
+    Compressed data for coding, cached under (key, coding). loader(coding) may supply
+    already encoded bytes (pre-rendered artifacts) before compressing in process.
+    """
+    cache = _get_cache()
+    ckey = (key, coding)
+    body = cache.get(ckey)
+    if body is None:
+        body = loader(coding) if loader is not None else None
+        if body is None:
+            body = compress(data, coding)
+        cache.set(ckey, body)
+    return body
+
+
+def should_compress(data: bytes, coding) -> bool:
+    return bool(coding) and len(data) >= int(_compression_settings().get("MIN_SIZE") or 0)
+
+
+def apply(response, key, coding, loader=None):
+    """
+    Encode response's body with coding (when worth it) using the cache, and set
+    Content-Encoding / Content-Length / Vary. Returns the response.
+    """
+    if available_codings():
+        patch_vary_headers(response, ("Accept-Encoding",))
+    data = response.content
+    if not should_compress(data, coding):
+        return response
+    with timing.phase("encode"):
+        response.content = encoded_body(key, data, coding, loader)
+    response["Content-Encoding"] = coding
+    response["Content-Length"] = str(len(response.content))
+    return response
+
+
+def clear() -> None:
+    _get_cache().clear(reset_stats=True)
+
+
+def stats() -> dict:
+    return _get_cache().stats()
@@ -0,0 +1,140 @@
+"""
+Per-worker cache of DeviceConfig lookups (device + profile) used by api.views.get_device_config.
+
+A phone identifies itself by MAC (or, less often, by identifier) in the User-Agent. The
+lookup key is (normalized MAC, identifier); the cached value is the DeviceConfig loaded with
+select_related('profile'), so a hit costs no SQL at all.
+
+api.signals drops entries on post_save/post_delete of DeviceConfig in the worker that handled
+the change; other workers pick it up when the TTL expires (settings.PROVISION_DEVICE_CACHE['TTL']).
+Entries are stamped with their profile's generation (api.utils.generations): saving or deleting
+a DeviceProfile bumps it, and every worker then treats the profile's devices as misses, without
+scanning the cache. With generations disabled the signal falls back to invalidate_profile().
+
+Keys that matched no device go to a separate short-TTL negative cache
+(settings.PROVISION_UNKNOWN_DEVICES['NEGATIVE_TTL']), so a scanner repeating the same MAC
+costs one query per TTL window; saving a device with that MAC/identifier drops the entry.
+"""
+
+from django.conf import settings
+import logging
+import threading
+
+from api.utils import generations
+from api.utils.lru import LRUCache
+
+logger = logging.getLogger(__name__)
+
+_init_lock = threading.Lock()
+_devices = None
+_unknown = None
+
+
+def _caches():
+    global _devices, _unknown
+    if _devices is None:
+        with _init_lock:
+            if _devices is None:
+                conf = getattr(settings, "PROVISION_DEVICE_CACHE", None) or {}
+                negative = getattr(settings, "PROVISION_UNKNOWN_DEVICES", None) or {}
+                _unknown = LRUCache(
+                    maxsize=int(negative.get("NEGATIVE_MAX_SIZE") or 50000),
+                    ttl=float(negative.get("NEGATIVE_TTL") or 30.0),
+                )
+                _devices = LRUCache(
+                    maxsize=int(conf.get("MAX_SIZE") or 10000),
+                    ttl=float(conf.get("TTL") or 0) or None,
+                )
+    return _devices, _unknown
+
+
+def enabled() -> bool:
+    conf = getattr(settings, "PROVISION_DEVICE_CACHE", None) or {}
+    return bool(conf.get("ENABLED", True))
+
+
+def lookup_key(norm_mac: str, identifier) -> tuple:
+    return (norm_mac or "", str(identifier or "").strip())
+
+
+def get(key: tuple):
+    devices, _ = _caches()
+    item = devices.get(key)
+    if item is None:
+        return None
+    device, stamp = item
+    if stamp is not None and stamp != generations.profile_stamp(device.profile_id):
+        # perfil alterado (em qualquer worker) depois que a entrada foi gravada
+        devices.pop(key)
+        return None
+    return device
+
+
+def put(key: tuple, device) -> None:
+    devices, _ = _caches()
+    devices.set(key, (device, generations.profile_stamp(getattr(device, "profile_id", None))))
+
+
+def is_unknown(key: tuple) -> bool:
+    _, unknown = _caches()
+    return unknown.get(key, False)
+
+
+def put_unknown(key: tuple) -> None:
+    _, unknown = _caches()
+    unknown.set(key, True)
+
+
+def invalidate_device(pk=None, mac_address=None, identifier=None) -> int:
+    """
+    Drop entries that resolved to device pk and entries whose key names its MAC/identifier
+    (a new or renamed device must win over whatever the key resolved to before).
+    """
+    return invalidate_devices(
+        pks=() if pk is None else (pk,),
+        mac_addresses=(mac_address,),
+        identifiers=(identifier,),
+    )
+
+
+def invalidate_devices(pks=(), mac_addresses=(), identifiers=()) -> int:
+    """Bulk form of invalidate_device (one pass over the cache), e.g. after bulk_create."""
+    pks = {pk for pk in pks if pk is not None}
+    macs = {m for m in mac_addresses if m}
+    idents = {i for i in identifiers if i} | macs
+
+    def _stale(key, item):
+        norm_mac, ident = key
+        device = item[0] if isinstance(item, tuple) else None
+        return (
+            (pks and getattr(device, "pk", None) in pks)
+            or (norm_mac and norm_mac in macs)
+            or (ident and ident in idents)
+        )
+
+    devices, unknown = _caches()
+    removed = devices.discard_where(_stale)
+    removed += unknown.discard_where(_stale)
+    if removed:
+        logger.debug("Device cache: invalidated %s entries", removed)
+    return removed
+
+
+def invalidate_profile(profile_id) -> int:
+    """Drop every device cached with profile_id (the profile is part of the cached object)."""
+    devices, _ = _caches()
+    removed = devices.discard_where(lambda _, item: getattr(item[0], "profile_id", None) == profile_id)
+    if removed:
+        logger.debug("Device cache: invalidated %s entries for profile %s", removed, profile_id)
+    return removed
+
+
+def clear() -> None:
+    devices, unknown = _caches()
+    devices.clear(reset_stats=True)
+    unknown.clear(reset_stats=True)
+
+
+def stats() -> dict:
+    devices, unknown = _caches()
+    return dict(devices.stats(), unknown=unknown.stats())
@@ -0,0 +1,131 @@
+"""
+Coalesced provisioned_at / attempts_provisioning updates for DeviceConfig.
+
+download_config calls touch_device(device_id) on every successful fetch. Increments and the
+last-seen time are aggregated per device in memory and applied periodically from a background
+thread as a handful of bulk UPDATEs:
+
+    UPDATE core_deviceconfig
+       SET attempts_provisioning = attempts_provisioning + n,
+           provisioned_at = CASE id WHEN ... THEN ... END
+     WHERE id IN (...)
+
+one statement per distinct increment n (usually just n=1 after a fleet-wide reboot).
+QuerySet.update() does not touch `updated_at` (auto_now) nor send signals, so these writes
+do not invalidate caches or ETags.
+
+Configured by settings.PROVISION_DEVICE_TOUCH (ENABLED, FLUSH_INTERVAL, MAX_BATCH, MAX_PENDING).
+"""
+
+import logging
+import threading
+from collections import OrderedDict, defaultdict
+
+from django.conf import settings
+from django.db import transaction
+from django.db.models import Case, DateTimeField, F, Value, When
+from django.utils import timezone
+
+from api.utils.buffered import BufferedWriter, OVERFLOW_DROP_OLDEST
+
+logger = logging.getLogger(__name__)
+
+
+class DeviceTouchCoalescer(BufferedWriter):
+    """Aggregates (device_id -> [count, last_seen]) and applies them with F() updates."""
+
+    name = "device-touch-coalescer"
+
+    def __init__(self, **kwargs):
+        super().__init__(**kwargs)
+        self._touches = OrderedDict()
+
+    def touch(self, device_id, when=None) -> bool:
+        if not device_id:
+            return False
+        return self.add((device_id, when or timezone.now()))
+
+    def _put(self, item):
+        device_id, when = item
+        current = self._touches.get(device_id)
+        if current is None:
+            self._touches[device_id] = [1, when]
+        else:
+            current[0] += 1
+            if when > current[1]:
+                current[1] = when
+
+    def _pop_oldest(self):
+        if self._touches:
+            self._touches.popitem(last=False)
+
+    def _take(self, limit):
+        batch = []
+        for _ in range(min(limit, len(self._touches))):
+            device_id, (count, last_seen) = self._touches.popitem(last=False)
+            batch.append((device_id, count, last_seen))
+        return batch
+
+    def _pending(self):
+        return len(self._touches)
+
+    def _write(self, batch):
+        from core.models import DeviceConfig
+
+        by_count = defaultdict(list)
+        for device_id, count, last_seen in batch:
+            by_count[count].append((device_id, last_seen))
+
+        with transaction.atomic():
+            for count, rows in by_count.items():
+                provisioned_at = Case(
+                    *[When(pk=device_id, then=Value(last_seen)) for device_id, last_seen in rows],
+                    output_field=DateTimeField(),
+                )
+                DeviceConfig.objects.filter(pk__in=[device_id for device_id, _ in rows]).update(
+                    attempts_provisioning=F("attempts_provisioning") + count,
+                    provisioned_at=provisioned_at,
+                )
+        logger.debug("Applied provisioning touches for %s devices in %s statements", len(batch), len(by_count))
+
+
+_coalescer = None
+_coalescer_lock = threading.Lock()
+
+
+def get_coalescer():
+    """Return this worker's coalescer, or None when disabled."""
+    global _coalescer
+    if _coalescer is None:
+        conf = getattr(settings, "PROVISION_DEVICE_TOUCH", None) or {}
+        if not conf.get("ENABLED", True):
+            return None
+        with _coalescer_lock:
+            if _coalescer is None:
+                _coalescer = DeviceTouchCoalescer(
+                    max_batch=int(conf.get("MAX_BATCH") or 1000),
+                    flush_interval=float(conf.get("FLUSH_INTERVAL") or 10.0),
+                    max_pending=int(conf.get("MAX_PENDING") or 100000),
+                    overflow=OVERFLOW_DROP_OLDEST,
+                )
+    return _coalescer
+
+
+def set_coalescer(coalescer):
+    """Replace this worker's coalescer (used by tests and benchmarks). Returns the previous one."""
+    global _coalescer
+    with _coalescer_lock:
+        previous, _coalescer = _coalescer, coalescer
+    return previous
+
+
+def touch_device(device_id, when=None) -> bool:
+    """Register a successful provisioning fetch for device_id. Never raises."""
+    try:
+        coalescer = get_coalescer()
+        if coalescer is None:
+            return False
+        return coalescer.touch(device_id, when)
+    except Exception:
+        logger.exception("Failed to register provisioning touch for device %s", device_id)
+        return False
@@ -0,0 +1,142 @@
+"""
+Write-behind recorder for core.models.Provisioning events.
+
+download_config enqueues one event per request (vendor/model/version, IPs, status,
+template_ref, ...); ProvisioningRecorder turns them into Provisioning rows with bulk_create
+from a background thread, so the request path never waits on an INSERT.
+
+Configured by settings.PROVISION_EVENTS (ENABLED, BATCH_SIZE, FLUSH_INTERVAL, MAX_QUEUE,
+OVERFLOW); see api.utils.buffered for the flush and overflow semantics. Each written batch
+also updates the hourly/daily rollups (core.rollups) unless PROVISION_ROLLUPS['INCREMENTAL']
+is off.
+"""
+
+import logging
+import threading
+from collections import deque
+
+from django.conf import settings
+from django.db import IntegrityError
+
+from api.utils.buffered import BufferedWriter, OVERFLOW_DROP_OLDEST
+
+logger = logging.getLogger(__name__)
+
+# Espelham core.models.Provisioning.STATUS_* (sem importar core.models no import do módulo)
+STATUS_OK = "ok"
+STATUS_FORBIDDEN = "forbidden"
+STATUS_ERROR = "error"
+
+# Campos aceitos em um evento (subconjunto de core.models.Provisioning)
+EVENT_FIELDS = (
+    "device_id", "mac_address", "identifier", "vendor", "model", "version",
+    "public_ip", "private_ip", "filename", "template_ref", "status", "user_agent", "notes",
+)
+
+# Limites dos CharFields de Provisioning, para não perder o lote inteiro por um valor longo
+_MAX_LENGTHS = {
+    "mac_address": 32, "identifier": 255, "vendor": 50, "model": 50, "version": 50,
+    "filename": 255, "template_ref": 255, "status": 20,
+}
+
+
+def _clean_event(fields: dict) -> dict:
+    event = {}
+    for name in EVENT_FIELDS:
+        value = fields.get(name)
+        if value is None:
+            continue
+        if name in _MAX_LENGTHS:
+            value = str(value)[:_MAX_LENGTHS[name]]
+        event[name] = value
+    return event
+
+
+class ProvisioningRecorder(BufferedWriter):
+    name = "provisioning-recorder"
+
+    def __init__(self, **kwargs):
+        super().__init__(**kwargs)
+        self._events = deque()
+
+    def _put(self, item):
+        self._events.append(item)
+
+    def _pop_oldest(self):
+        if self._events:
+            self._events.popleft()
+
+    def _take(self, limit):
+        take = min(limit, len(self._events))
+        return [self._events.popleft() for _ in range(take)]
+
+    def _pending(self):
+        return len(self._events)
+
+    def _write(self, batch):
+        from core.models import Provisioning
+
+        try:
+            rows = Provisioning.objects.bulk_create([Provisioning(**e) for e in batch])
+        except IntegrityError:
+            # device removido entre o request e o flush: gravar o lote sem a FK
+            logger.warning("Provisioning batch hit an integrity error; retrying without device FK")
+            rows = Provisioning.objects.bulk_create([Provisioning(**dict(e, device_id=None)) for e in batch])
+        self._rollup(rows)
+
+    def _rollup(self, rows):
+        from core import rollups
+
+        if not rollups.incremental():
+            return
+        try:
+            rollups.apply_events(rows)
+        except Exception:
+            # os eventos já estão gravados; `manage.py rollup_provisioning` recalcula o período
+            logger.exception("Failed to update provisioning rollups for a batch of %d events", len(rows))
+
+
+_recorder = None
+_recorder_lock = threading.Lock()
+
+
+def _events_settings() -> dict:
+    return getattr(settings, "PROVISION_EVENTS", None) or {}
+
+
+def get_recorder():
+    """Return this worker's recorder, or None when event recording is disabled."""
+    global _recorder
+    if _recorder is None:
+        conf = _events_settings()
+        if not conf.get("ENABLED", True):
+            return None
+        with _recorder_lock:
+            if _recorder is None:
+                _recorder = ProvisioningRecorder(
+                    max_batch=int(conf.get("BATCH_SIZE") or 500),
+                    flush_interval=float(conf.get("FLUSH_INTERVAL") or 2.0),
+                    max_pending=int(conf.get("MAX_QUEUE") or 10000),
+                    overflow=conf.get("OVERFLOW") or OVERFLOW_DROP_OLDEST,
+                )
+    return _recorder
+
+
+def set_recorder(recorder):
+    """Replace this worker's recorder (used by tests and benchmarks). Returns the previous one."""
+    global _recorder
+    with _recorder_lock:
+        previous, _recorder = _recorder, recorder
+    return previous
+
+
+def record_event(**fields) -> bool:
+    """Enqueue a Provisioning event. Never raises; returns False if not recorded."""
+    try:
+        recorder = get_recorder()
+        if recorder is None:
+            return False
+        return recorder.add(_clean_event(fields))
+    except Exception:
+        logger.exception("Failed to enqueue provisioning event")
+        return False
@@ -0,0 +1,210 @@
+"""
+Generation counters for profile-wide and template-wide invalidation of the per-worker caches.
+
+Saving a DeviceProfile changes the config of every device in it, and importing a template can
+change what every lookup key resolves to. Instead of scanning the caches for affected entries,
+each entry is stamped with the generation of what it was built from when it is stored:
+ - api.utils.device_cache: the generation of the device's profile;
+ - api.utils.template_cache (`resolved`): the generation of the template it resolved to and
+   of the template set (a new template can take over lookups that resolved elsewhere).
+A lookup whose stamp no longer matches is a miss, so stale entries age out without a scan.
+api.signals bumps the profile counter on save/delete, template_cache.invalidate_template the
+template counters on import/delete.
+
+Counters live in a Django cache (CACHE_ALIAS, 'default' unless configured), which must be
+shared (Redis/Memcached, see CACHES in provision/settings.py) for a bump to reach every worker
+and node. A process-local backend (LocMemCache, DummyCache, the Django default when CACHES is
+not set) cannot propagate anything: get_generations() then logs a warning and disables the
+stamps, and api.signals keeps scanning the caches of the worker that saved the profile. Each worker memoizes counters
+for LOCAL_TTL seconds, which bounds both the propagation delay and the reads of the shared
+store to one per key and window. A counter missing from the store (never bumped, or evicted)
+starts at the current time in milliseconds, so it never goes back to a value an entry may
+already carry. Cache errors fall back to the local value (entries then expire by their TTL).
+
+Configured by settings.PROVISION_GENERATIONS (ENABLED, CACHE_ALIAS, LOCAL_TTL, MAX_KEYS).
+"""
+
+from django.conf import settings
+import logging
+import threading
+import time
+
+from api.utils.lru import LRUCache
+
+logger = logging.getLogger(__name__)
+
+PROFILE = "profile"
+TEMPLATE = "template"
+# contador do conjunto de templates (qualquer import/remoção)
+TEMPLATE_SET = "*"
+
+_DISABLED = object()
+
+_generations = None
+_generations_lock = threading.Lock()
+
+
+def _initial() -> int:
+    return int(time.time() * 1000)
+
+
+class Generations:
+    """Counters in a Django cache, memoized in this worker for local_ttl seconds."""
+
+    def __init__(self, cache, local_ttl: float = 1.0, max_keys: int = 100000, shared: bool = None):
+        self.cache = cache
+        # shared=None: detectado pelo backend (LocMem/Dummy não propagam entre processos)
+        self.shared = is_shared_cache(cache) if shared is None else bool(shared)
+        # local_ttl 0: sem memo, toda leitura vai ao cache compartilhado
+        self._local = LRUCache(maxsize=max_keys, ttl=local_ttl) if local_ttl and local_ttl > 0 else None
+        self.bumps = 0
+
+    @staticmethod
+    def cache_key(kind: str, ident) -> str:
+        return f"provision:gen:{kind}:{ident}"
+
+    def get_many(self, pairs) -> tuple:
+        """Current generations of (kind, ident) pairs, in order (one store read for the unknown ones)."""
+        pairs = tuple(pairs)
+        values = {pair: self._local.get(pair) if self._local is not None else None for pair in pairs}
+        missing = [pair for pair, value in values.items() if value is None]
+        if missing:
+            keys = {self.cache_key(*pair): pair for pair in missing}
+            try:
+                found = self.cache.get_many(list(keys))
+                for ckey, pair in keys.items():
+                    value = found.get(ckey)
+                    if value is None:
+                        # add: se outro processo criou o contador antes, vale o dele
+                        self.cache.add(ckey, _initial(), timeout=None)
+                        value = self.cache.get(ckey)
+                    values[pair] = int(value)
+            except Exception:
+                logger.warning("Generation store unavailable; using local counters", exc_info=True)
+                for pair in missing:
+                    values[pair] = values[pair] or 0
+            if self._local is not None:
+                for pair in missing:
+                    self._local.set(pair, values[pair])
+        return tuple(values[pair] for pair in pairs)
+
+    def get(self, kind: str, ident) -> int:
+        return self.get_many(((kind, ident),))[0]
+
+    def bump(self, kind: str, ident) -> int:
+        """Advance the counter of (kind, ident) everywhere; returns the new generation."""
+        ckey = self.cache_key(kind, ident)
+        try:
+            if self.cache.add(ckey, _initial(), timeout=None):
+                value = self.cache.get(ckey)
+            else:
+                value = self.cache.incr(ckey)
+        except ValueError:
+            # expirou/foi removido entre o add e o incr
+            self.cache.set(ckey, _initial(), timeout=None)
+            value = self.cache.get(ckey)
+        except Exception:
+            logger.warning("Generation store unavailable; bump of %s is local only", ckey, exc_info=True)
+            value = None
+        if value is None:
+            value = (self._local.get((kind, ident)) or 0) + 1 if self._local is not None else 0
+        if self._local is not None:
+            self._local.set((kind, ident), int(value))
+        self.bumps += 1
+        return int(value)
+
+    def stats(self) -> dict:
+        return {"bumps": self.bumps, "local": self._local.stats() if self._local is not None else None}
+
+
+def is_shared_cache(cache) -> bool:
+    """False for backends that live in this process only (LocMemCache, DummyCache)."""
+    from django.core.cache.backends.dummy import DummyCache
+    from django.core.cache.backends.locmem import LocMemCache
+
+    return not isinstance(cache, (LocMemCache, DummyCache))
+
+
+def _generation_settings() -> dict:
+    return getattr(settings, "PROVISION_GENERATIONS", None) or {}
+
+
+def get_generations():
+    """This worker's counters, or None when disabled or when CACHE_ALIAS is not a shared cache."""
+    global _generations
+    if _generations is None:
+        conf = _generation_settings()
+        if not conf.get("ENABLED", True):
+            return None
+        with _generations_lock:
+            if _generations is None:
+                _generations = _build_generations(conf)
+    return None if _generations is _DISABLED else _generations
+
+
+def _build_generations(conf: dict):
+    from django.core.cache import caches
+
+    alias = conf.get("CACHE_ALIAS") or "default"
+    cache = caches[alias]
+    if not is_shared_cache(cache):
+        # lembrado até set_generations(None): o aviso sai uma vez por worker
+        logger.warning(
+            "PROVISION_GENERATIONS disabled: cache %r (%s) is not shared between processes; "
+            "configure a Redis/Memcached cache (CACHES) to propagate profile/template changes",
+            alias, type(cache).__name__,
+        )
+        return _DISABLED
+    return Generations(
+        cache,
+        local_ttl=float(conf.get("LOCAL_TTL", 1.0) or 0),
+        max_keys=int(conf.get("MAX_KEYS") or 100000),
+        shared=True,
+    )
+
+
+def set_generations(generations):
+    """Replace this worker's counters (tests; None rebuilds them from settings). Returns the previous ones."""
+    global _generations
+    with _generations_lock:
+        previous, _generations = _generations, generations
+    return None if previous is _DISABLED else previous
+
+
+def is_shared() -> bool:
+    """True when bumps reach other workers (counters enabled on a shared store)."""
+    generations = get_generations()
+    return generations is not None and generations.shared
+
+
+def profile_stamp(profile_id):
+    """Generation of profile_id, or None (disabled / no profile): store it with the cached entry."""
+    generations = get_generations()
+    if generations is None or profile_id is None:
+        return None
+    return generations.get(PROFILE, profile_id)
+
+
+def template_stamp(template_id):
+    """(generation of template_id, generation of the template set), or None when disabled."""
+    generations = get_generations()
+    if generations is None:
+        return None
+    return generations.get_many(((TEMPLATE, str(template_id)), (TEMPLATE, TEMPLATE_SET)))
+
+
+def bump_profile(profile_id):
+    """Invalidate every cached entry built from profile_id. None when disabled."""
+    generations = get_generations()
+    if generations is None or profile_id is None:
+        return None
+    return generations.bump(PROFILE, profile_id)
+
+
+def bump_template(template_id):
+    """Invalidate lookups resolved to template_id, and every lookup (the set changed). None when disabled."""
+    generations = get_generations()
+    if generations is None:
+        return None
+    generations.bump(TEMPLATE, TEMPLATE_SET)
+    return generations.bump(TEMPLATE, str(template_id))
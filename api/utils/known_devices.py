@@ -0,0 +1,336 @@
+"""
+In-memory membership index of provisioned devices (normalized MACs and identifiers).
+
+get_device_config consults it before going to SQL: a Bloom filter "no" is exact, so scanners
+and unregistered phones are answered without any query. The filter is built once per worker
+from DeviceConfig (started at boot by gunicorn's post_worker_init, see warm_up()), then kept
+current incrementally:
+  - api.signals adds devices saved in this worker right away;
+  - every REFRESH_INTERVAL seconds, rows with updated_at >= the last seen watermark are added
+    (devices created/changed by other workers);
+  - every REBUILD_INTERVAL seconds (or when the filter is over capacity) it is rebuilt from
+    scratch, which also forgets deleted devices.
+Builds and refreshes run in a background thread: might_exist() never scans the table, it
+only starts the maintenance when due and answers from the current filter. Until the first
+build finishes, or if the index cannot be built (database down, tests without DB access),
+every lookup is a "maybe". The filter is sized from the previous filter's key count, or from
+the highest DeviceConfig pk on the first build (an index lookup instead of COUNT(*)).
+
+Between refreshes the filter can miss rows created by other workers or instances, so a "no"
+is only trusted while the filter is known to be current:
+  - during a rebuild every miss is a "maybe"; keys noted meanwhile are replayed into the new
+    filter before it replaces the old one;
+  - otherwise a miss checks, at most once per CHANGE_CHECK_INTERVAL seconds, whether any row
+    was written after the watermark (one indexed EXISTS on updated_at). If so, misses are
+    "maybe" and a refresh starts right away; the bulk importer does the same via expire().
+
+Configured by settings.PROVISION_UNKNOWN_DEVICES (BLOOM_ENABLED, BACKGROUND, REFRESH_INTERVAL,
+REBUILD_INTERVAL, CHANGE_CHECK_INTERVAL, ERROR_RATE). BACKGROUND=False runs the maintenance
+inline (tests).
+"""
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+import logging
+import threading
+import time
+
+from api.utils.bloom import BloomFilter
+
+logger = logging.getLogger(__name__)
+
+_MIN_CAPACITY = 1000
+
+
+def _mac_key(norm_mac: str) -> str:
+    return "m:" + norm_mac
+
+
+def _identifier_key(identifier: str) -> str:
+    return "i:" + identifier
+
+
+class KnownDevices:
+    def __init__(self, refresh_interval: float = 30.0, rebuild_interval: float = 3600.0,
+                 error_rate: float = 0.001, headroom: float = 2.0, background: bool = True,
+                 change_check_interval: float = 1.0):
+        self.refresh_interval = float(refresh_interval)
+        self.rebuild_interval = float(rebuild_interval)
+        self.error_rate = float(error_rate)
+        self.headroom = max(1.0, float(headroom))
+        self.background = background
+        self.change_check_interval = float(change_check_interval)
+        self._filter = None
+        self._watermark = None
+        self._next_refresh = 0.0
+        self._next_rebuild = 0.0
+        self._lock = threading.Lock()
+        self._thread = None
+        # rebuild em andamento: chaves anotadas nesse meio tempo, reaplicadas no filtro novo
+        self._building = False
+        self._noted = []
+        self._noted_lock = threading.Lock()
+        # resultado da última verificação de linhas gravadas após o watermark
+        self._changed = False
+        self._next_change_check = 0.0
+
+    def might_exist(self, norm_mac: str, identifier: str) -> bool:
+        """False only when neither key can belong to a DeviceConfig row (see trusts_misses())."""
+        self._maybe_refresh()
+        return self.contains(norm_mac, identifier) or not self.trusts_misses()
+
+    def trusts_misses(self) -> bool:
+        """
+        Whether a filter miss is authoritative now: no rebuild is running and no row was
+        written after the watermark (checked in SQL at most every change_check_interval).
+        """
+        if self._filter is None or self._building:
+            return False
+        now = time.monotonic()
+        if now >= self._next_change_check:
+            self._next_change_check = now + self.change_check_interval
+            try:
+                self._changed = self._changed_since_watermark()
+            except Exception:
+                logger.warning("Known devices change check failed; treating misses as unknown", exc_info=True)
+                self._changed = True
+            if self._changed:
+                self._next_refresh = 0.0
+                self._maybe_refresh()
+        return not self._changed
+
+    def change_check_due(self) -> bool:
+        return time.monotonic() >= self._next_change_check
+
+    def _changed_since_watermark(self) -> bool:
+        from core.models import DeviceConfig
+
+        rows = DeviceConfig.objects.all()
+        if self._watermark is not None:
+            rows = rows.filter(updated_at__gt=self._watermark)
+        return rows.exists()
+
+    def expire(self) -> None:
+        """Make the next lookup start a refresh (rows were written elsewhere, e.g. a bulk import)."""
+        self._next_refresh = 0.0
+        self._next_change_check = 0.0
+
+    def refresh_due(self) -> bool:
+        return time.monotonic() >= self._next_refresh
+
+    def contains(self, norm_mac: str, identifier: str) -> bool:
+        """Filter check only (no refresh, no SQL)."""
+        bloom = self._filter
+        if bloom is None:
+            return True
+        if norm_mac and _mac_key(norm_mac) in bloom:
+            return True
+        return bool(identifier) and _identifier_key(identifier) in bloom
+
+    def add(self, mac_address: str, identifier: str) -> None:
+        with self._noted_lock:
+            if self._building:
+                self._noted.append((mac_address, identifier))
+            bloom = self._filter
+        if bloom is None:
+            return
+        if mac_address:
+            bloom.add(_mac_key(mac_address))
+        if identifier:
+            bloom.add(_identifier_key(identifier))
+
+    def _maybe_refresh(self) -> None:
+        """Start the due refresh/rebuild (in the background thread unless background=False)."""
+        now = time.monotonic()
+        if now < self._next_refresh:
+            return
+        # só um thread dispara a manutenção; os demais seguem com o filtro atual
+        if not self._lock.acquire(blocking=False):
+            return
+        try:
+            if now < self._next_refresh or (self._thread is not None and self._thread.is_alive()):
+                return
+            self._next_refresh = now + self.refresh_interval
+            if self.background:
+                self._thread = threading.Thread(target=self._maintain, name="known-devices", daemon=True)
+                self._thread.start()
+                return
+        finally:
+            self._lock.release()
+        self._maintain()
+
+    def _maintain(self) -> None:
+        try:
+            if self._filter is None or time.monotonic() >= self._next_rebuild or self._filter.saturated():
+                self.rebuild()
+            else:
+                self._refresh()
+        except Exception:
+            logger.exception("Known devices index refresh failed; unknown-device pre-check disabled until next refresh")
+        finally:
+            self._next_refresh = time.monotonic() + self.refresh_interval
+            if self.background:
+                from django.db import connection
+
+                # conexão aberta por este thread: não deixá-la pendurada até o próximo ciclo
+                connection.close()
+
+    def join(self, timeout: float = None) -> None:
+        """Wait for a running background build (tests, benchmarks)."""
+        thread = self._thread
+        if thread is not None:
+            thread.join(timeout)
+
+    def _estimated_keys(self) -> int:
+        """Keys the rebuilt filter will hold, without COUNT(*): the current filter's, or 2 per pk."""
+        from core.models import DeviceConfig
+        from django.db.models import Max
+
+        if self._filter is not None:
+            return len(self._filter)
+        top = DeviceConfig.objects.aggregate(top=Max("pk"))["top"] or 0
+        return 2 * int(top)
+
+    def rebuild(self) -> int:
+        from core.models import DeviceConfig
+
+        with self._noted_lock:
+            self._building, self._noted = True, []
+        try:
+            capacity = max(_MIN_CAPACITY, int(self._estimated_keys() * self.headroom))
+            bloom = BloomFilter(capacity=capacity, error_rate=self.error_rate)
+            watermark = None
+            rows = DeviceConfig.objects.values_list("mac_address", "identifier", "updated_at")
+            for mac_address, identifier, updated_at in rows.iterator(chunk_size=2000):
+                if mac_address:
+                    bloom.add(_mac_key(mac_address))
+                if identifier:
+                    bloom.add(_identifier_key(identifier))
+                if updated_at and (watermark is None or updated_at > watermark):
+                    watermark = updated_at
+        except BaseException:
+            with self._noted_lock:
+                self._building, self._noted = False, []
+            raise
+        with self._noted_lock:
+            # devices salvos neste worker durante a varredura
+            for mac_address, identifier in self._noted:
+                if mac_address:
+                    bloom.add(_mac_key(mac_address))
+                if identifier:
+                    bloom.add(_identifier_key(identifier))
+            self._filter, self._watermark = bloom, watermark
+            self._building, self._noted = False, []
+        # o filtro acaba de alcançar o watermark: próxima verificação em um intervalo
+        self._changed = False
+        self._next_change_check = time.monotonic() + self.change_check_interval
+        now = time.monotonic()
+        self._next_refresh = now + self.refresh_interval
+        self._next_rebuild = now + self.rebuild_interval
+        logger.info("Known devices index rebuilt: %s keys, %s bytes", len(bloom), bloom.size_bytes)
+        return len(bloom)
+
+    def _refresh(self) -> int:
+        from core.models import DeviceConfig
+
+        rows = DeviceConfig.objects.values_list("mac_address", "identifier", "updated_at")
+        if self._watermark is not None:
+            rows = rows.filter(updated_at__gte=self._watermark)
+        added = 0
+        watermark = self._watermark
+        for mac_address, identifier, updated_at in rows.iterator(chunk_size=2000):
+            self.add(mac_address, identifier)
+            added += 1
+            if updated_at and (watermark is None or updated_at > watermark):
+                watermark = updated_at
+        self._watermark = watermark
+        # o filtro acaba de alcançar o watermark: próxima verificação em um intervalo
+        self._changed = False
+        self._next_change_check = time.monotonic() + self.change_check_interval
+        return added
+
+    def stats(self) -> dict:
+        bloom = self._filter
+        return {
+            "ready": bloom is not None,
+            "keys": len(bloom) if bloom is not None else 0,
+            "capacity": bloom.capacity if bloom is not None else 0,
+            "bytes": bloom.size_bytes if bloom is not None else 0,
+        }
+
+
+_index = None
+_index_lock = threading.Lock()
+
+
+def _unknown_settings() -> dict:
+    return getattr(settings, "PROVISION_UNKNOWN_DEVICES", None) or {}
+
+
+def get_index():
+    """Return this worker's KnownDevices index, or None when the Bloom pre-check is disabled."""
+    global _index
+    if _index is None:
+        conf = _unknown_settings()
+        if not conf.get("BLOOM_ENABLED", True):
+            return None
+        with _index_lock:
+            if _index is None:
+                _index = KnownDevices(
+                    refresh_interval=float(conf.get("REFRESH_INTERVAL") or 30.0),
+                    rebuild_interval=float(conf.get("REBUILD_INTERVAL") or 3600.0),
+                    error_rate=float(conf.get("ERROR_RATE") or 0.001),
+                    background=bool(conf.get("BACKGROUND", True)),
+                    change_check_interval=float(conf.get("CHANGE_CHECK_INTERVAL") or 1.0),
+                )
+    return _index
+
+
+def set_index(index):
+    """Replace this worker's index (used by tests and benchmarks). Returns the previous one."""
+    global _index
+    with _index_lock:
+        previous, _index = _index, index
+    return previous
+
+
+def might_exist(norm_mac: str, identifier: str) -> bool:
+    index = get_index()
+    return True if index is None else index.might_exist(norm_mac, identifier)
+
+
+async def amight_exist(norm_mac: str, identifier: str) -> bool:
+    """might_exist() for async views: inline maintenance and the change check (SQL) run in a worker thread."""
+    index = get_index()
+    if index is None:
+        return True
+    if index.refresh_due():
+        if index.background:
+            index._maybe_refresh()
+        else:
+            await sync_to_async(index._maybe_refresh)()
+    if index.contains(norm_mac, identifier):
+        return True
+    if index.change_check_due():
+        return not await sync_to_async(index.trusts_misses)()
+    return not index.trusts_misses()
+
+
+def warm_up() -> None:
+    """Start building this worker's filter (gunicorn post_worker_init) so no request waits for it."""
+    index = get_index()
+    if index is not None:
+        index._maybe_refresh()
+
+
+def note_device(mac_address: str, identifier: str) -> None:
+    index = _index
+    if index is not None:
+        index.add(mac_address, identifier)
+
+
+def expire() -> None:
+    """Refresh this worker's filter on the next lookup (after writes that bypass the signals)."""
+    index = _index
+    if index is not None:
+        index.expire()
@@ -1,8 +1,23 @@
+"""
+MongoDB handles for the provisioning app: one MongoClient per worker process (sync views,
+management commands) and one AsyncMongoClient per event loop (api.views.download_config_async).
+
+Pool size, timeouts, read preference, compression and appname come from settings.MONGODB
+(see _CLIENT_OPTIONS); options given in the URI query string win. pymongo clients are not
+fork-safe, so the handles are dropped in the child after os.fork() (gunicorn --preload) and
+each worker creates its own; warm_up() opens the first connection at worker boot
+(gunicorn.conf.py) so the first phone served does not pay for it.
+"""
+
 from django.conf import settings
-from pymongo import MongoClient
-from urllib.parse import urlparse
+from pymongo import AsyncMongoClient, MongoClient
+from urllib.parse import parse_qs, urlparse
+import asyncio
+import os
 import threading
 import logging
+import time
+import weakref
 
 logger = logging.getLogger(__name__)
 
@@ -10,6 +25,23 @@ logger = logging.getLogger(__name__)
 _client_lock = threading.Lock()
 _db_instance = None
 
+# AsyncMongoClient DB handles, one per event loop
+_async_db_by_loop = weakref.WeakKeyDictionary()
+
+# settings.MONGODB key -> (MongoClient keyword, type)
+_CLIENT_OPTIONS = {
+    "MAX_POOL_SIZE": ("maxPoolSize", int),
+    "MIN_POOL_SIZE": ("minPoolSize", int),
+    "MAX_IDLE_TIME_MS": ("maxIdleTimeMS", int),
+    "SERVER_SELECTION_TIMEOUT_MS": ("serverSelectionTimeoutMS", int),
+    "CONNECT_TIMEOUT_MS": ("connectTimeoutMS", int),
+    "SOCKET_TIMEOUT_MS": ("socketTimeoutMS", int),
+    "WAIT_QUEUE_TIMEOUT_MS": ("waitQueueTimeoutMS", int),
+    "READ_PREFERENCE": ("readPreference", str),
+    "COMPRESSORS": ("compressors", str),
+    "APPNAME": ("appname", str),
+}
+
 
 def _choose_db_name_from_settings(parsed_uri_path: str | None) -> str:
     """
@@ -42,27 +74,19 @@ def _choose_db_name_from_settings(parsed_uri_path: str | None) -> str:
     return "provision_mongo"
 
 
-def get_mongo_client():
+def _client_args():
     """
-    Return a cached/persistent pymongo database handle.
+    Resolve how to connect from settings: returns (MongoClient positional args, db_name, label).
 
-    Behavior:
     - First preference: use settings.MONGODB_URL (per your request).
     - Backward compatibility: if MONGODB_URL not set, attempt settings.MONGODB_URI.
     - If a full URI is provided it is passed directly to MongoClient and the DB name is picked
       from the URI path (or from settings.MONGODB / settings.MONGODB_DB_NAME).
     - Otherwise fall back to host/port/user/password keys on settings.MONGODB (or individual
       settings like MONGODB_HOST) to construct a connection.
-
-    Returns the DB object (client[db_name]) and caches it in module global `_db_instance`.
     """
-    global _db_instance
-    if _db_instance is not None:
-        return _db_instance
-
     # Try to obtain a connection URI from settings (MONGODB_URL requested)
     mongo_uri = getattr(settings, "MONGODB_URL", None) or getattr(settings, "MONGODB_URI", None)
-    print(mongo_uri)
 
     # Also tolerate settings.MONGODB dict that may include 'URI'
     if not mongo_uri:
@@ -73,41 +97,130 @@ def get_mongo_client():
         except Exception:
             mongo_uri = None
 
+    if mongo_uri:
+        # Use the full URI. Determine DB name from the path portion if present.
+        parsed = urlparse(mongo_uri)
+        db_name = _choose_db_name_from_settings(parsed.path)
+        return (mongo_uri,), db_name, "URI"
+
+    # No URI: fallback to host/port/user/password style config
+    # Prefer settings.MONGODB dict, else individual settings
+    m = getattr(settings, "MONGODB", None) or {}
+    host = m.get("HOST") or getattr(settings, "MONGODB_HOST", "localhost")
+    port = int(m.get("PORT") or getattr(settings, "MONGODB_PORT", 27017) or 27017)
+    db_name = m.get("DB_NAME") or getattr(settings, "MONGODB_DB_NAME", "provision_mongo")
+    user = m.get("USER") or getattr(settings, "MONGODB_USER", None)
+    password = m.get("PASSWORD") or getattr(settings, "MONGODB_PASSWORD", None)
+
+    if user and password:
+        # Build a safe mongodb URI for auth
+        uri = f"mongodb://{user}:{password}@{host}:{port}/{db_name}"
+        return (uri,), db_name, f"{host}:{port} using user auth"
+    return (host, port), db_name, f"{host}:{port}"
+
+
+def _client_options(uri: str = None) -> dict:
+    """MongoClient keyword options from settings.MONGODB, skipping those already set in uri."""
+    m = getattr(settings, "MONGODB", None)
+    if not isinstance(m, dict):
+        return {}
+    in_uri = {k.lower() for k in parse_qs(urlparse(uri).query)} if uri else set()
+    options = {}
+    for key, (name, cast) in _CLIENT_OPTIONS.items():
+        value = m.get(key)
+        if value is None or value == "" or name.lower() in in_uri:
+            continue
+        options[name] = cast(value)
+    return options
+
+
+def _new_client(client_class):
+    """(client_class instance, db_name, label) from _client_args() and _client_options()."""
+    args, db_name, label = _client_args()
+    uri = args[0] if len(args) == 1 else None
+    return client_class(*args, **_client_options(uri)), db_name, label
+
+
+def get_mongo_client():
+    """
+    Return a cached/persistent pymongo database handle.
+
+    Connection parameters come from _client_args() and pool/timeout options from
+    _client_options(). Returns the DB object (client[db_name]) and caches it in module
+    global `_db_instance` (reset in forked children, see _reset_after_fork).
+    """
+    global _db_instance
+    if _db_instance is not None:
+        return _db_instance
+
     try:
         with _client_lock:
             if _db_instance is not None:
                 return _db_instance
 
-            if mongo_uri:
-                # Use the full URI. Determine DB name from the path portion if present.
-                parsed = urlparse(mongo_uri)
-                db_name = _choose_db_name_from_settings(parsed.path)
-                client = MongoClient(mongo_uri)
-                _db_instance = client[db_name]
-                logger.info("Connected to MongoDB (URI) database '%s'", db_name)
-                return _db_instance
-
-            # No URI: fallback to host/port/user/password style config
-            # Prefer settings.MONGODB dict, else individual settings
-            m = getattr(settings, "MONGODB", None) or {}
-            host = m.get("HOST") or getattr(settings, "MONGODB_HOST", "localhost")
-            port = int(m.get("PORT") or getattr(settings, "MONGODB_PORT", 27017) or 27017)
-            db_name = m.get("DB_NAME") or getattr(settings, "MONGODB_DB_NAME", "provision_mongo")
-            user = m.get("USER") or getattr(settings, "MONGODB_USER", None)
-            password = m.get("PASSWORD") or getattr(settings, "MONGODB_PASSWORD", None)
-
-            if user and password:
-                # Build a safe mongodb URI for auth
-                uri = f"mongodb://{user}:{password}@{host}:{port}/{db_name}"
-                client = MongoClient(uri)
-                _db_instance = client[db_name]
-                logger.info("Connected to MongoDB database '%s' at %s:%s using user auth", db_name, host, port)
-                return _db_instance
-            else:
-                client = MongoClient(host, port)
-                _db_instance = client[db_name]
-                logger.info("Connected to MongoDB database '%s' at %s:%s", db_name, host, port)
-                return _db_instance
+            client, db_name, label = _new_client(MongoClient)
+            _db_instance = client[db_name]
+            logger.info("Connected to MongoDB database '%s' (%s)", db_name, label)
+            return _db_instance
     except Exception as exc:
         logger.exception("Failed to create MongoDB client: %s", exc)
-        raise
\ No newline at end of file
+        raise
+
+
+def get_async_mongo_client():
+    """
+    Return a pymongo AsyncMongoClient database handle for the running event loop.
+
+    Used by the ASGI download view (api.views.download_config_async). An async client is bound
+    to the loop it first runs on, so one client is kept per loop (normally one per uvicorn
+    worker). Must be called from a coroutine.
+    """
+    loop = asyncio.get_running_loop()
+    db = _async_db_by_loop.get(loop)
+    if db is not None:
+        return db
+    try:
+        client, db_name, label = _new_client(AsyncMongoClient)
+        db = client[db_name]
+    except Exception as exc:
+        logger.exception("Failed to create async MongoDB client: %s", exc)
+        raise
+    _async_db_by_loop[loop] = db
+    logger.info("Connected to MongoDB database '%s' (%s, async)", db_name, label)
+    return db
+
+
+def warmup_enabled() -> bool:
+    m = getattr(settings, "MONGODB", None)
+    return bool(m.get("WARMUP", True)) if isinstance(m, dict) else True
+
+
+def warm_up() -> bool:
+    """
+    Create this worker's client and open its first pooled connection (server selection +
+    handshake + ping). Called at worker boot; never raises. Returns True on success.
+    """
+    started = time.monotonic()
+    try:
+        get_mongo_client().command("ping")
+    except Exception as exc:
+        logger.warning("MongoDB warm-up failed (first request will retry): %s", exc)
+        return False
+    logger.info("MongoDB warm-up done in %.0f ms (pid %s)", (time.monotonic() - started) * 1000.0, os.getpid())
+    return True
+
+
+def _reset_after_fork() -> None:
+    """
+    Drop the handles inherited from the parent: a MongoClient's sockets and monitor threads
+    are not usable after fork(). The parent's client is left alone (not closed) on purpose,
+    closing it here would act on the parent's sockets.
+    """
+    global _client_lock, _db_instance, _async_db_by_loop
+    _client_lock = threading.Lock()
+    _db_instance = None
+    _async_db_by_loop = weakref.WeakKeyDictionary()
+
+
+if hasattr(os, "register_at_fork"):
+    os.register_at_fork(after_in_child=_reset_after_fork)
@@ -0,0 +1,220 @@
+"""
+Token-bucket rate limiting for download-xml, keyed by normalized MAC and by client IP.
+
+download_config calls check() right after parsing the User-Agent, before any SQL or Mongo
+work; a rejected request gets a 429 with Retry-After and is not recorded as an event (a phone
+stuck in a loop would otherwise flood Provisioning too).
+
+Two layers, both optional:
+ - in process (always, when enabled): one bucket per key in this worker, refilled at RATE
+   tokens/s up to BURST. Cheap enough to absorb a flood without touching anything shared;
+ - shared (CACHE_ALIAS names a Django cache, e.g. Redis/Memcached): the same average rate and
+   burst enforced across gunicorn workers with an atomic counter per key and window of
+   BURST / RATE seconds (Django's cache API has no compare-and-set, so this is the
+   fixed-window approximation of the bucket). Cache errors fail open.
+
+A request rejected by one limit spends nothing from the others: tokens already taken for
+the other kinds or layers during the same check() are refunded before returning.
+
+Configured by settings.PROVISION_RATE_LIMIT (ENABLED, MAC_RATE, MAC_BURST, IP_RATE, IP_BURST,
+CACHE_ALIAS, MAX_KEYS); a rate of 0 disables that key.
+"""
+
+from collections import OrderedDict
+from django.conf import settings
+from functools import partial
+import logging
+import math
+import threading
+import time
+
+logger = logging.getLogger(__name__)
+
+KIND_MAC = "mac"
+KIND_IP = "ip"
+
+_limiter = None
+_limiter_lock = threading.Lock()
+
+
+class TokenBucket:
+    """In-process token buckets for many keys (LRU-bounded to max_keys, thread-safe)."""
+
+    def __init__(self, rate: float, burst: float, max_keys: int = 100000):
+        self.rate = float(rate)
+        self.burst = max(1.0, float(burst))
+        self.max_keys = max(1, int(max_keys))
+        self._buckets = OrderedDict()
+        self._lock = threading.Lock()
+
+    def take(self, key, now: float = None) -> float:
+        """Consume one token for key. Returns 0 when allowed, else seconds until one is available."""
+        now = time.monotonic() if now is None else now
+        with self._lock:
+            state = self._buckets.get(key)
+            if state is None:
+                tokens = self.burst
+            else:
+                tokens = min(self.burst, state[0] + (now - state[1]) * self.rate)
+                self._buckets.move_to_end(key)
+            if tokens >= 1.0:
+                self._buckets[key] = (tokens - 1.0, now)
+                wait = 0.0
+            else:
+                self._buckets[key] = (tokens, now)
+                wait = (1.0 - tokens) / self.rate
+            while len(self._buckets) > self.max_keys:
+                # chave esquecida volta com o balde cheio: só afrouxa o limite
+                self._buckets.popitem(last=False)
+        return wait
+
+    def refund(self, key) -> None:
+        """Give back the token a take() for key just consumed (the request was rejected elsewhere)."""
+        with self._lock:
+            state = self._buckets.get(key)
+            if state is not None:
+                self._buckets[key] = (min(self.burst, state[0] + 1.0), state[1])
+
+
+class SharedWindow:
+    """BURST requests per BURST/RATE-second window and key, counted in a Django cache."""
+
+    def __init__(self, cache, kind: str, rate: float, burst: float):
+        self.cache = cache
+        self.kind = kind
+        self.burst = max(1, int(burst))
+        self.window = self.burst / float(rate)
+
+    def _key(self, key, now: float) -> str:
+        return f"provision:rl:{self.kind}:{key}:{int(now // self.window)}"
+
+    def take(self, key, now: float = None) -> float:
+        now = time.time() if now is None else now
+        slot = int(now // self.window)
+        ckey = self._key(key, now)
+        timeout = int(math.ceil(self.window)) + 1
+        try:
+            if self.cache.add(ckey, 1, timeout=timeout):
+                count = 1
+            else:
+                try:
+                    count = self.cache.incr(ckey)
+                except ValueError:
+                    # expirou entre o add e o incr
+                    self.cache.add(ckey, 1, timeout=timeout)
+                    count = 1
+        except Exception:
+            logger.warning("Shared rate limit cache unavailable; allowing request", exc_info=True)
+            return 0.0
+        if count > self.burst:
+            return (slot + 1) * self.window - now
+        return 0.0
+
+    def refund(self, key, now: float) -> None:
+        """Undo a take() for key made at now (same window)."""
+        try:
+            self.cache.decr(self._key(key, now))
+        except ValueError:
+            pass  # a janela já expirou
+        except Exception:
+            logger.warning("Shared rate limit cache unavailable; token not refunded", exc_info=True)
+
+
+class RateLimiter:
+    """Per-kind (mac / ip) in-process buckets plus the optional shared windows."""
+
+    def __init__(self, rules: dict, cache=None, max_keys: int = 100000):
+        self.local = {}
+        self.shared = {}
+        for kind, (rate, burst) in rules.items():
+            if rate and rate > 0:
+                self.local[kind] = TokenBucket(rate, burst, max_keys)
+                if cache is not None:
+                    self.shared[kind] = SharedWindow(cache, kind, rate, burst)
+        self.rejected = {kind: 0 for kind in self.local}
+
+    def check(self, keys: dict):
+        """
+        keys: {kind: key or None}. Returns None when the request may proceed, else
+        (kind, seconds to wait) for the first limit exceeded. A rejected request spends no
+        token: the ones already taken for the other kinds (and layers) are refunded.
+        """
+        now = time.time()
+        taken = []
+        for kind, key in keys.items():
+            bucket = self.local.get(kind)
+            if bucket is None or not key:
+                continue
+            wait = bucket.take(key)
+            if not wait:
+                taken.append(partial(bucket.refund, key))
+                if kind in self.shared:
+                    wait = self.shared[kind].take(key, now)
+                    if not wait:
+                        taken.append(partial(self.shared[kind].refund, key, now))
+            if wait:
+                for refund in taken:
+                    refund()
+                self.rejected[kind] += 1
+                return kind, wait
+        return None
+
+    def stats(self) -> dict:
+        return {"rejected": dict(self.rejected), "keys": {k: len(b._buckets) for k, b in self.local.items()}}
+
+
+def _rate_limit_settings() -> dict:
+    return getattr(settings, "PROVISION_RATE_LIMIT", None) or {}
+
+
+def _build_limiter(conf: dict) -> RateLimiter:
+    cache = None
+    alias = conf.get("CACHE_ALIAS")
+    if alias:
+        from django.core.cache import caches
+
+        cache = caches[alias]
+    rules = {
+        KIND_MAC: (float(conf.get("MAC_RATE") or 0), float(conf.get("MAC_BURST") or 1)),
+        KIND_IP: (float(conf.get("IP_RATE") or 0), float(conf.get("IP_BURST") or 1)),
+    }
+    return RateLimiter(rules, cache=cache, max_keys=int(conf.get("MAX_KEYS") or 100000))
+
+
+def get_limiter():
+    """This worker's limiter, or None when rate limiting is disabled."""
+    global _limiter
+    if _limiter is None:
+        conf = _rate_limit_settings()
+        if not conf.get("ENABLED", True):
+            return None
+        with _limiter_lock:
+            if _limiter is None:
+                _limiter = _build_limiter(conf)
+    return _limiter
+
+
+def set_limiter(limiter):
+    """Replace this worker's limiter (tests; None rebuilds it from settings). Returns the previous one."""
+    global _limiter
+    with _limiter_lock:
+        previous, _limiter = _limiter, limiter
+    return previous
+
+
+def is_shared() -> bool:
+    """True when this worker's limiter also counts in a shared cache (check() then does network I/O)."""
+    limiter = get_limiter()
+    return limiter is not None and bool(limiter.shared)
+
+
+def check(mac: str = None, ip: str = None):
+    """None if allowed, else (kind, Retry-After seconds as int >= 1)."""
+    limiter = get_limiter()
+    if limiter is None:
+        return None
+    hit = limiter.check({KIND_MAC: mac, KIND_IP: ip})
+    if hit is None:
+        return None
+    kind, wait = hit
+    return kind, max(1, int(math.ceil(wait)))
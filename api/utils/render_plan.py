@@ -0,0 +1,193 @@
+"""
+Single-pass renderer for device templates.
+
+Historically download_config rendered a template through the Django engine and then ran a
+second regex pass over the output to replace %%name%% placeholders. compile_plan() turns a
+template into a RenderPlan once per template version: a flat list of literal segments,
+`{{ name }}` slots and `%%name%%` slots, so rendering is a single join.
+
+Output is identical to the two-pass pipeline:
+ - `{{ name }}` slots use Django's own value rendering (autoescape, localization, missing -> '').
+ - `%%name%%` slots use percent_value(): bool -> '1'/'0', None -> '', list/dict -> JSON.
+Templates using anything beyond plain `{{ name }}` variables (tags, filters, dotted lookups)
+keep the Django Template + regex pipeline, wrapped in the same RenderPlan interface.
+"""
+
+import html
+import json
+import re
+
+from django.template import Context, Engine, Template
+from django.template.base import Lexer, TokenType, render_value_in_context
+
+# %%nome%% — nome composto por letras, dígitos e underscore
+PERCENT_PLACEHOLDER_RE = re.compile(r"%%([A-Za-z0-9_]+)%%")
+
+# {{ name }} that can be resolved with a plain dict lookup (no filters / dots / literals)
+_SIMPLE_VAR_RE = re.compile(r"^[A-Za-z][A-Za-z0-9_]*$")
+_CONTEXT_BUILTINS = frozenset(("True", "False", "None"))
+
+_LITERAL = 0
+_VAR = 1
+_PERCENT = 2
+
+
+class _RenderSettings:
+    """Stand-in for django.template.Context with the attributes render_value_in_context reads."""
+
+    autoescape = True
+    use_l10n = None
+    use_tz = None
+
+
+_RENDER_SETTINGS = _RenderSettings()
+
+
+def percent_value(val) -> str:
+    """Converte um valor do contexto para texto de um placeholder %%nome%%."""
+    # converter booleanos para 1/0
+    if isinstance(val, bool):
+        return "1" if val else "0"
+    # None -> empty
+    if val is None:
+        return ""
+    # se for lista/dict, converter para string JSON
+    if isinstance(val, (list, dict)):
+        try:
+            return json.dumps(val, ensure_ascii=False)
+        except Exception:
+            return str(val)
+    return str(val)
+
+
+def lower_context(context: dict) -> dict:
+    """Chaves em lower-case para lookup case-insensitive; evita copiar se já estiverem."""
+    if not context:
+        return {}
+    if all(type(k) is str and k == k.lower() for k in context):
+        return context
+    return {str(k).lower(): v for k, v in context.items()}
+
+
+def substitute_percent_placeholders(template_text: str, context: dict) -> str:
+    """
+    Substitui placeholders no formato %%nome%% por valores vindos de context.
+    - Faz lookup case-insensitive da chave no context (usa chave lower()).
+    - Booleanos são convertidos em '1' / '0' (útil para flags como %%vlanactive%%).
+    - Valores None ou keys ausentes são substituídos por string vazia.
+    """
+    if not template_text:
+        return template_text
+    ctx = lower_context(context)
+    return PERCENT_PLACEHOLDER_RE.sub(lambda m: percent_value(ctx.get(m.group(1).lower(), "")), template_text)
+
+
+def _split_percent(text: str, segments: list) -> str:
+    """Append literal/percent segments for a TEXT token; return its literal residue."""
+    pos = 0
+    residue = []
+    for m in PERCENT_PLACEHOLDER_RE.finditer(text):
+        if m.start() > pos:
+            segments.append((_LITERAL, text[pos:m.start()]))
+            residue.append(text[pos:m.start()])
+        segments.append((_PERCENT, m.group(1).lower(), m.group(0)))
+        pos = m.end()
+    if pos < len(text):
+        segments.append((_LITERAL, text[pos:]))
+        residue.append(text[pos:])
+    return "\x00".join(residue)
+
+
+class RenderPlan:
+    """
+    Compiled form of a device template. Use compile_plan() to build one and
+    render(context) to produce the final configuration text.
+    """
+
+    __slots__ = ("segments", "names", "needs_percent_pass", "django_template", "string_if_invalid")
+
+    def __init__(self, segments=None, names=(), needs_percent_pass=False, django_template=None, string_if_invalid=""):
+        self.segments = segments or []
+        self.names = frozenset(names)
+        self.needs_percent_pass = needs_percent_pass
+        self.django_template = django_template
+        self.string_if_invalid = string_if_invalid
+
+    @property
+    def single_pass(self) -> bool:
+        return self.django_template is None
+
+    def render(self, context: dict) -> str:
+        if self.django_template is not None:
+            rendered = self.django_template.render(Context(context))
+            return substitute_percent_placeholders(rendered, context)
+
+        ctx = lower_context(context)
+        missing = self.string_if_invalid
+        out = []
+        append = out.append
+        legacy = self.needs_percent_pass
+        for seg in self.segments:
+            kind = seg[0]
+            if kind == _LITERAL:
+                append(seg[1])
+            elif kind == _VAR:
+                value = context.get(seg[1], missing) if context else missing
+                if type(value) is str:
+                    # atalho para str: mesmo resultado de render_value_in_context (autoescape)
+                    text = html.escape(value)
+                else:
+                    if callable(value):
+                        value = value()
+                    text = render_value_in_context(value, _RENDER_SETTINGS)
+                if "%" in text:
+                    # um valor pode formar %%nome%% junto com o texto vizinho; usar o caminho antigo
+                    legacy = True
+                append(text)
+            else:
+                value = ctx.get(seg[1], "")
+                append(value if type(value) is str else percent_value(value))
+        if legacy:
+            return substitute_percent_placeholders(self._raw(out), context)
+        return "".join(out)
+
+    def _raw(self, rendered: list) -> str:
+        """Saída do render do Django (antes da passada %%) a partir dos segmentos já renderizados."""
+        return "".join(seg[2] if seg[0] == _PERCENT else text for seg, text in zip(self.segments, rendered))
+
+
+def compile_plan(template_str: str) -> RenderPlan:
+    """
+    Compila template_str em um RenderPlan. Levanta TemplateSyntaxError (via Django) quando
+    o template não é um template Django válido.
+    """
+    tokens = Lexer(template_str).tokenize()
+    segments = []
+    names = set()
+    boundary_text = []
+    prev_boundary = False
+    for token in tokens:
+        if token.token_type == TokenType.TEXT:
+            residue = _split_percent(token.contents, segments)
+            boundary_text.append((residue, prev_boundary))
+            prev_boundary = False
+            continue
+        if token.token_type == TokenType.COMMENT:
+            prev_boundary = True
+        elif token.token_type == TokenType.VAR and _SIMPLE_VAR_RE.match(token.contents) and token.contents not in _CONTEXT_BUILTINS:
+            segments.append((_VAR, token.contents))
+            names.add(token.contents)
+            prev_boundary = True
+        else:
+            # tags, filtros, lookups com ponto etc.: manter o motor do Django
+            return RenderPlan(django_template=Template(template_str))
+        if boundary_text and not boundary_text[-1][1]:
+            boundary_text[-1] = (boundary_text[-1][0], True)
+
+    # %% sem par perto de um {{ }}/comentário pode formar placeholder com o vizinho após o render
+    needs_percent_pass = any(
+        touches_boundary and ("%%" in residue or residue.startswith("%") or residue.endswith("%"))
+        for residue, touches_boundary in boundary_text
+    )
+    string_if_invalid = Engine.get_default().string_if_invalid
+    return RenderPlan(segments, names, needs_percent_pass, string_if_invalid=string_if_invalid)
@@ -0,0 +1,113 @@
+"""
+Single-flight coalescing of concurrent cache misses.
+
+When a template is re-imported or a worker restarts, every phone of a model misses the
+per-worker caches at the same moment. Group.do(key, fn) runs fn once per key at a time:
+the first caller (the leader) runs it, concurrent callers with the same key wait for its
+result (or its exception) instead of repeating the Mongo fetch / compile / render.
+
+api.views uses it for template resolution (lookup key), body fetches (template _id) and
+renders (ETag); api.utils.template_cache for compiles ((_id, version)). AsyncGroup is the
+asyncio counterpart used by the ASGI view.
+
+Nothing is cached here: once the leader returns, the next miss starts a new flight, so the
+caches in front of it decide what is reused.
+"""
+
+import asyncio
+import threading
+import weakref
+
+
+class _Call:
+    __slots__ = ("done", "result", "error", "waiters")
+
+    def __init__(self):
+        self.done = threading.Event()
+        self.result = None
+        self.error = None
+        self.waiters = 0
+
+
+class Group:
+    """Thread-based single-flight (sync views under gunicorn threads)."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._calls = {}
+        self.leaders = 0
+        self.shared = 0
+
+    def do(self, key, fn):
+        with self._lock:
+            call = self._calls.get(key)
+            if call is None:
+                call = self._calls[key] = _Call()
+                self.leaders += 1
+                leader = True
+            else:
+                call.waiters += 1
+                self.shared += 1
+                leader = False
+
+        if not leader:
+            call.done.wait()
+            if call.error is not None:
+                raise call.error
+            return call.result
+
+        try:
+            call.result = fn()
+        except BaseException as exc:
+            call.error = exc
+            raise
+        finally:
+            with self._lock:
+                del self._calls[key]
+            call.done.set()
+        return call.result
+
+    def in_flight(self) -> int:
+        with self._lock:
+            return len(self._calls)
+
+    def stats(self) -> dict:
+        return {"leaders": self.leaders, "shared": self.shared, "in_flight": self.in_flight()}
+
+
+class AsyncGroup:
+    """asyncio single-flight: coalesces coroutines of the same key on the same event loop."""
+
+    def __init__(self):
+        self._calls = weakref.WeakKeyDictionary()
+        self.leaders = 0
+        self.shared = 0
+
+    async def do(self, key, coro_fn):
+        loop = asyncio.get_running_loop()
+        calls = self._calls.setdefault(loop, {})
+        future = calls.get(key)
+        if future is not None:
+            self.shared += 1
+            # shield: a cancelled waiter must not cancel the result for the others
+            return await asyncio.shield(future)
+
+        future = calls[key] = loop.create_future()
+        self.leaders += 1
+        try:
+            result = await coro_fn()
+        except asyncio.CancelledError:
+            future.cancel()
+            raise
+        except BaseException as exc:
+            future.set_exception(exc)
+            future.exception()  # mark retrieved: no warning when nobody was waiting
+            raise
+        else:
+            future.set_result(result)
+            return result
+        finally:
+            del calls[key]
+
+    def stats(self) -> dict:
+        return {"leaders": self.leaders, "shared": self.shared}
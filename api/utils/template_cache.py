@@ -0,0 +1,180 @@
+"""
+Per-worker cache of compiled device templates used by api.views.download_config.
+
+Two LRUs are kept:
+ - `compiled`: (template _id, content version) -> RenderPlan. A template is parsed
+   once per version, no matter how many lookup keys resolve to it.
+ - `resolved`: lookup key (template_ref, model, extension) -> CachedTemplate, with a TTL.
+   A hit here means the request needs no Mongo round trip at all.
+
+core.views.import_template/template_delete call invalidate_template() so the worker that
+handled the change drops its entries right away. It also bumps the template generation
+(api.utils.generations) that `resolved` entries are stamped with, so other workers and nodes
+treat them as misses on their next lookup; with generations disabled they pick the change up
+when the `resolved` TTL expires (settings.PROVISION_TEMPLATE_CACHE['TTL']).
+"""
+
+from django.conf import settings
+import hashlib
+import logging
+import threading
+
+from api.utils import generations
+from api.utils.lru import LRUCache
+from api.utils.singleflight import Group
+
+logger = logging.getLogger(__name__)
+
+_init_lock = threading.Lock()
+_resolved = None
+_compiled = None
+# one compile per (_id, version) at a time, however many threads miss together
+_compile_flights = Group()
+
+
+class CachedTemplate:
+    """Compiled template plus the identity/version it was built from."""
+
+    __slots__ = ("template_id", "version", "compiled", "uploaded_at")
+
+    def __init__(self, template_id, version, compiled, uploaded_at=None):
+        self.template_id = template_id
+        self.version = version
+        self.compiled = compiled
+        self.uploaded_at = uploaded_at
+
+    def __repr__(self):
+        return f"<CachedTemplate {self.template_id!r} v={self.version[:12]}>"
+
+
+def _cache_settings():
+    conf = getattr(settings, "PROVISION_TEMPLATE_CACHE", None) or {}
+    max_size = int(conf.get("MAX_SIZE") or 256)
+    ttl = float(conf.get("TTL") or 0) or None
+    return max_size, ttl
+
+
+def _caches():
+    global _resolved, _compiled
+    if _resolved is None:
+        with _init_lock:
+            if _resolved is None:
+                max_size, ttl = _cache_settings()
+                _compiled = LRUCache(maxsize=max_size)
+                _resolved = LRUCache(maxsize=max_size * 4, ttl=ttl)
+    return _resolved, _compiled
+
+
+def template_version(doc: dict, template_str: str) -> str:
+    """Content version of a template document: stored 'content_hash' or sha256 of the text."""
+    stored = doc.get("content_hash") if isinstance(doc, dict) else None
+    if stored:
+        return str(stored)
+    return hashlib.sha256(template_str.encode("utf-8")).hexdigest()
+
+
+def lookup_key(template_ref: str | None, model: str | None, ext: str | None) -> tuple:
+    return ((template_ref or "").strip(), (model or "").strip().lower(), ext or "")
+
+
+def _compile(template_str: str):
+    from api.utils.render_plan import compile_plan
+    return compile_plan(template_str)
+
+
+def get_resolved(key: tuple):
+    resolved, _ = _caches()
+    item = resolved.get(key)
+    if item is None:
+        return None
+    entry, stamp = item
+    if stamp is not None and stamp != generations.template_stamp(entry.template_id):
+        # template (or the template set) changed in some worker since this lookup was resolved
+        resolved.pop(key)
+        return None
+    return entry
+
+
+def put_resolved(key: tuple, entry: CachedTemplate) -> None:
+    resolved, _ = _caches()
+    resolved.set(key, (entry, generations.template_stamp(entry.template_id)))
+
+
+def build_entry(doc: dict, template_str: str) -> CachedTemplate:
+    """
+    Return a CachedTemplate for doc, reusing an already compiled template with the same
+    (_id, version). Raises django.template.TemplateSyntaxError for invalid templates.
+    """
+    _, compiled_cache = _caches()
+    template_id = doc.get("_id")
+    version = template_version(doc, template_str)
+    ckey = (template_id, version)
+    compiled = compiled_cache.get(ckey)
+    if compiled is None:
+        compiled = _compile_flights.do(ckey, lambda: _compile_once(compiled_cache, ckey, template_str))
+    return CachedTemplate(template_id, version, compiled, doc.get("uploaded_at"))
+
+
+def _compile_once(compiled_cache, ckey, template_str: str):
+    # a previous leader may have finished between our miss and joining the flight
+    compiled = compiled_cache.get(ckey)
+    if compiled is None:
+        compiled = _compile(template_str)
+        compiled_cache.set(ckey, compiled)
+    return compiled
+
+
+def entry_from_compiled(doc: dict):
+    """
+    CachedTemplate for doc from an already compiled (_id, content_hash), without its body
+    (doc read with api.utils.templates.HOT_PATH_PROJECTION). None when not compiled here.
+    """
+    version = doc.get("content_hash")
+    if not version:
+        return None
+    _, compiled_cache = _caches()
+    compiled = compiled_cache.get((doc.get("_id"), str(version)))
+    if compiled is None:
+        return None
+    return CachedTemplate(doc.get("_id"), str(version), compiled, doc.get("uploaded_at"))
+
+
+def invalidate_template(template_id) -> int:
+    """
+    Drop every cached entry for template_id in this worker: compiled versions, lookups that
+    resolved to it and lookups whose template_ref/model name it (so a newly imported template
+    replaces a fallback match), and bump its generation for the other workers. Returns the
+    number of entries removed here.
+    """
+    if template_id is None:
+        return 0
+    generations.bump_template(str(template_id))
+    resolved, compiled_cache = _caches()
+    tid = str(template_id)
+    tid_lower = tid.strip().lower()
+
+    def _stale(key, item):
+        ref, model, _ = key
+        entry = item[0]
+        return (
+            str(entry.template_id) == tid
+            or (ref and (ref == tid or ref.lower() == tid_lower))
+            or (model and model == tid_lower)
+        )
+
+    removed = resolved.discard_where(_stale)
+    removed += compiled_cache.discard_where(lambda key, _: str(key[0]) == tid)
+    if removed:
+        logger.debug("Template cache: invalidated %s entries for %s", removed, tid)
+    return removed
+
+
+def clear() -> None:
+    resolved, compiled_cache = _caches()
+    resolved.clear(reset_stats=True)
+    compiled_cache.clear(reset_stats=True)
+
+
+def stats() -> dict:
+    resolved, compiled_cache = _caches()
+    return {"resolved": resolved.stats(), "compiled": compiled_cache.stats()}
@@ -0,0 +1,174 @@
+"""
+Schema helpers for the `device_templates` Mongo collection.
+
+Normalized lookup keys stored on every template document:
+ - model_lc:  lower-cased model (falls back to the lower-cased _id, matching the
+              historical convention of naming templates after the model);
+ - extension: 'xml' or 'cfg' (from 'extension', 'file_type' or the filename).
+
+They let api.views.get_template_from_mongo resolve a template with a single indexed
+query instead of a case-insensitive $regex on 'model'.
+
+TemplateListing pages the management list (core.views.template_list) inside Mongo:
+prefix-anchored search on _id / model_lc, sort on the uploaded_at_id index, skip/limit.
+
+Template body storage: one zlib-compressed copy of the text in 'body' (body_codec 'zlib')
+plus 'content_hash' (sha256 of the text, the version used by api.utils.template_cache) and
+'size'. Older documents keep the text uncompressed in 'template' and/or 'content'; readers
+go through template_text(), which handles both, and `manage.py compress_templates`
+converts them. download_config reads with HOT_PATH_PROJECTION (no compressed body) and only
+fetches the body when this worker has no compiled plan for the document's content_hash.
+"""
+
+import hashlib
+import logging
+import os
+import re
+import zlib
+
+from pymongo import ASCENDING, DESCENDING
+
+logger = logging.getLogger(__name__)
+
+TEMPLATES_COLLECTION = "device_templates"
+
+# (keys, options) for every index download_config / the management pages rely on
+TEMPLATE_INDEXES = [
+    ([("model_lc", ASCENDING), ("extension", ASCENDING)], {"name": "model_lc_extension"}),
+    ([("extension", ASCENDING)], {"name": "extension"}),
+    ([("uploaded_at", DESCENDING), ("_id", DESCENDING)], {"name": "uploaded_at_id"}),
+]
+# índices criados por versões anteriores e que nenhuma consulta usa (só custam escrita)
+OBSOLETE_TEMPLATE_INDEXES = ("model_extension_ci",)
+
+# ordem da listagem (coberta pelo índice uploaded_at_id) e campos que ela exibe
+LIST_SORT = [("uploaded_at", DESCENDING), ("_id", DESCENDING)]
+LIST_PROJECTION = {"filename": 1, "file_type": 1, "uploaded_by": 1, "uploaded_at": 1}
+
+BODY_CODEC = "zlib"
+# campos com o texto do template: o atual (comprimido) e os legados (texto puro, às vezes em dobro)
+BODY_FIELDS = ("body", "template", "content")
+LEGACY_BODY_FIELDS = ("template", "content")
+# leitura do download-xml: sem o corpo comprimido nem a cópia legada 'content'; documentos
+# legados ainda trazem 'template' (uma ida ao Mongo), os novos trazem só o content_hash
+HOT_PATH_PROJECTION = {"body": 0, "content": 0}
+
+
+def get_templates_collection(db):
+    return getattr(db, TEMPLATES_COLLECTION, db.get_collection(TEMPLATES_COLLECTION))
+
+
+def template_keys(doc: dict) -> dict:
+    """Return the normalized lookup fields (model_lc, extension) for a template document."""
+    model = doc.get("model") or doc.get("_id") or ""
+    ext = doc.get("extension") or doc.get("file_type") or ""
+    if not ext and doc.get("filename"):
+        ext = os.path.splitext(str(doc["filename"]))[1].lstrip(".")
+    return {
+        "model_lc": str(model).strip().lower(),
+        "extension": str(ext).strip().lower(),
+    }
+
+
+def content_hash(text: str) -> str:
+    return hashlib.sha256(text.encode("utf-8")).hexdigest()
+
+
+def encode_template_body(text: str) -> dict:
+    """Storage fields for a template text: compressed 'body', 'body_codec', 'content_hash', 'size'."""
+    raw = text.encode("utf-8")
+    return {
+        "body": zlib.compress(raw, 6),
+        "body_codec": BODY_CODEC,
+        "content_hash": hashlib.sha256(raw).hexdigest(),
+        "size": len(raw),
+    }
+
+
+def template_text(doc: dict):
+    """
+    The template text of doc: decompressed 'body', else the legacy 'template' / 'content'.
+    None when doc carries no body (e.g. read with HOT_PATH_PROJECTION). Raises ValueError for
+    a body with an unknown codec or that does not decompress.
+    """
+    if not doc:
+        return None
+    body = doc.get("body")
+    if body is not None:
+        codec = doc.get("body_codec") or BODY_CODEC
+        if codec != BODY_CODEC:
+            raise ValueError(f"template {doc.get('_id')!r}: unsupported body codec {codec!r}")
+        try:
+            return zlib.decompress(bytes(body)).decode("utf-8")
+        except (zlib.error, UnicodeDecodeError) as exc:
+            raise ValueError(f"template {doc.get('_id')!r}: corrupt body ({exc})") from exc
+    text = doc.get("template") or doc.get("content")
+    return text if isinstance(text, str) else None
+
+
+def ensure_template_indexes(coll) -> list:
+    """Create (idempotently) TEMPLATE_INDEXES, drop OBSOLETE_TEMPLATE_INDEXES. Returns the index names."""
+    existing = coll.index_information()
+    for name in OBSOLETE_TEMPLATE_INDEXES:
+        if name in existing:
+            coll.drop_index(name)
+            logger.info("device_templates index %s dropped (unused)", name)
+    names = []
+    for keys, options in TEMPLATE_INDEXES:
+        names.append(coll.create_index(keys, **options))
+    logger.info("device_templates indexes ensured: %s", ", ".join(names))
+    return names
+
+
+def search_query(q: str) -> dict:
+    """
+    Filter for the template list search: names starting with q. Anchored regexes without
+    the 'i' flag are index range scans: _id as typed (case-sensitive) or model_lc in lower case.
+    """
+    q = (q or "").strip()
+    if not q:
+        return {}
+    return {"$or": [
+        {"_id": {"$regex": "^" + re.escape(q)}},
+        {"model_lc": {"$regex": "^" + re.escape(q.lower())}},
+    ]}
+
+
+class TemplateListing:
+    """
+    Lazy sequence over device_templates for django.core.paginator.Paginator: count() and
+    slicing run in Mongo (count_documents / estimated_document_count and skip/limit), so a
+    page view reads one page of metadata instead of the whole collection.
+    """
+
+    def __init__(self, coll, q: str = ""):
+        self.coll = coll
+        self.query = search_query(q)
+        self._count = None
+
+    def count(self) -> int:
+        if self._count is None:
+            # sem filtro: contagem pelos metadados da coleção, sem varrer documentos
+            if self.query:
+                self._count = self.coll.count_documents(self.query)
+            else:
+                self._count = self.coll.estimated_document_count()
+        return self._count
+
+    def __len__(self):
+        return self.count()
+
+    def __getitem__(self, index):
+        if not isinstance(index, slice):
+            raise TypeError("TemplateListing supports slicing only")
+        start = index.start or 0
+        if index.stop is not None and index.stop <= start:
+            return []
+        cursor = self.coll.find(self.query, projection=LIST_PROJECTION).sort(LIST_SORT).skip(start)
+        if index.stop is not None:
+            cursor = cursor.limit(index.stop - start)
+        docs = []
+        for doc in cursor:
+            doc["id"] = str(doc.get("_id"))
+            docs.append(doc)
+        return docs
@@ -0,0 +1,145 @@
+"""
+Per-phase timers for download-xml.
+
+A request that is sampled gets a PhaseTimer for its duration (request_timer()); code on the
+hot path marks its phases with `with timing.phase("device"): ...` without passing the timer
+around (it lives in a ContextVar, so it follows the request in sync and async views).
+At the end, report() adds a Server-Timing header and logs one line whose `provision_timing`
+extra holds the phases as structured fields.
+
+Phases recorded by api.views:
+  ua        User-Agent parsing
+  device    DeviceConfig lookup (caches, Bloom filter, SQL)
+  template  template resolution; includes mongo (the aggregate) and compile on a cache miss
+  validate  ETag / Last-Modified and the conditional (304) check
+  artifact  pre-rendered artifact read (api.utils.artifacts)
+  render    RenderPlan render ({{ }} and %%name%% in a single pass)
+  encode    Content-Encoding, when the response is compressed (api.utils.compression)
+  total     whole view, as seen by the timer
+
+Unsampled requests only pay a ContextVar lookup per phase. Configured by
+settings.PROVISION_TIMING (ENABLED, SAMPLE_RATE, HEADER, LOG, LOG_MIN_MS).
+"""
+
+from contextlib import contextmanager
+from contextvars import ContextVar
+from django.conf import settings
+import logging
+import random
+import time
+
+logger = logging.getLogger(__name__)
+
+_current = ContextVar("provision_phase_timer", default=None)
+
+
+class PhaseTimer:
+    __slots__ = ("started", "phases")
+
+    def __init__(self):
+        self.started = time.perf_counter()
+        self.phases = {}
+
+    def phase(self, name: str):
+        return _Phase(self, name)
+
+    def add(self, name: str, seconds: float) -> None:
+        self.phases[name] = self.phases.get(name, 0.0) + seconds
+
+    def total(self) -> float:
+        return time.perf_counter() - self.started
+
+    def milliseconds(self) -> dict:
+        """{phase: ms} in the order phases were first entered, plus total."""
+        out = {name: round(seconds * 1000.0, 3) for name, seconds in self.phases.items()}
+        out["total"] = round(self.total() * 1000.0, 3)
+        return out
+
+    def header_value(self, ms: dict = None) -> str:
+        ms = self.milliseconds() if ms is None else ms
+        return ", ".join(f"{name};dur={value:.3f}" for name, value in ms.items())
+
+
+class _Phase:
+    __slots__ = ("timer", "name", "started")
+
+    def __init__(self, timer, name):
+        self.timer = timer
+        self.name = name
+
+    def __enter__(self):
+        self.started = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        self.timer.add(self.name, time.perf_counter() - self.started)
+        return False
+
+
+class _NoPhase:
+    __slots__ = ()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+
+_NO_PHASE = _NoPhase()
+
+
+def _timing_settings() -> dict:
+    return getattr(settings, "PROVISION_TIMING", None) or {}
+
+
+def _sampled(conf: dict) -> bool:
+    if not conf.get("ENABLED", True):
+        return False
+    rate = float(conf.get("SAMPLE_RATE", 1.0))
+    return rate >= 1.0 or (rate > 0.0 and random.random() < rate)
+
+
+@contextmanager
+def request_timer():
+    """Yield a PhaseTimer for this request, or None when it is not sampled."""
+    timer = PhaseTimer() if _sampled(_timing_settings()) else None
+    token = _current.set(timer)
+    try:
+        yield timer
+    finally:
+        _current.reset(token)
+
+
+def current():
+    return _current.get()
+
+
+def phase(name: str):
+    """Context manager timing `name` on the current request's timer (no-op when unsampled)."""
+    timer = _current.get()
+    return _NO_PHASE if timer is None else _Phase(timer, name)
+
+
+def report(timer, response, event: dict) -> None:
+    """Add the Server-Timing header to response and log the phases (see PROVISION_TIMING)."""
+    if timer is None:
+        return
+    conf = _timing_settings()
+    ms = timer.milliseconds()
+    if response is not None and conf.get("HEADER", True):
+        response["Server-Timing"] = timer.header_value(ms)
+    if conf.get("LOG", True) and ms["total"] >= float(conf.get("LOG_MIN_MS") or 0):
+        fields = {
+            "phases_ms": ms,
+            "status": getattr(response, "status_code", None),
+            "model": event.get("model"),
+            "mac_address": event.get("mac_address"),
+            "device_id": event.get("device_id"),
+            "notes": event.get("notes", ""),
+        }
+        logger.info(
+            "download-xml %s in %.1f ms (%s)",
+            fields["status"], ms["total"], " ".join(f"{k}={v:.1f}" for k, v in ms.items() if k != "total"),
+            extra={"provision_timing": fields},
+        )
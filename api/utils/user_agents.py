@@ -0,0 +1,169 @@
+"""
+Registry of per-vendor User-Agent parsers used by api.views.parse_user_agent_string.
+
+download_config needs (vendor, model, version, identifier) from the phone's User-Agent. The
+historical layout is 'vendor model version <mac|identifier>' (Yealink, Fanvil and most
+rebranded firmwares follow it), but Grandstream, Polycom and Cisco phones send their own
+formats, e.g.:
+    Grandstream Model HW GXP2170 SW 1.0.11.3 DevId 000b82aabbcc
+    FileTransport PolycomVVX-VVX_411-UA/5.9.5.0614 (SN:0004f2aabbcc) Type/Application
+    Cisco/SPA504G-7.5.5 (0018B9AABBCC)(CCQ162306EA)
+
+Each VendorParser holds one precompiled regex. parse() dispatches on the first token of the
+UA (lower-cased, cut at the first '/', '-' or '_': 'Cisco/SPA504G-7.5.5' -> 'cisco'), tries
+the parsers registered for that prefix and then the generic layout, so a UA costs one dict
+lookup and usually one regex match. Results are memoized in an LRU keyed by the raw UA
+string: a fleet sends only a few hundred distinct UAs, so steady state is a cache hit.
+UAs longer than MAX_MEMO_LENGTH are parsed but not memoized.
+
+Other vendors are added with register(VendorParser(...)); see DEFAULT_PARSERS.
+"""
+
+import re
+import threading
+
+from api.utils.lru import LRUCache
+
+CACHE_SIZE = 4096
+MAX_MEMO_LENGTH = 256
+
+_FIRST_TOKEN = re.compile(r"[^/\-_\s(]+")
+_MAC = r"(?:[0-9A-Fa-f]{2}[:\-]?){5}[0-9A-Fa-f]{2}"
+_MISS = object()
+
+
+class VendorParser:
+    """
+    One vendor's format: a regex with the named groups model, version and identifier
+    (missing groups become ''), and the first-token prefixes it is tried for.
+    """
+
+    __slots__ = ("vendor", "prefixes", "pattern")
+
+    def __init__(self, vendor: str, prefixes, pattern: str):
+        self.vendor = vendor
+        self.prefixes = tuple(p.lower() for p in prefixes)
+        self.pattern = re.compile(pattern, re.IGNORECASE)
+
+    def parse(self, user_agent: str):
+        match = self.pattern.match(user_agent)
+        if match is None:
+            return None
+        groups = match.groupdict()
+        model = groups.get("model") or ""
+        identifier = groups.get("identifier") or ""
+        if not model or not identifier:
+            return None
+        return self.vendor, model, groups.get("version") or "", identifier
+
+    def __repr__(self):
+        return f"VendorParser({self.vendor!r}, {self.prefixes!r})"
+
+
+DEFAULT_PARSERS = (
+    # Yealink SIP-T46S 66.86.0.15 80:5e:c0:12:34:56
+    VendorParser("Yealink", ("yealink",), rf"yealink\s+(?P<model>\S+)\s+(?P<version>\S+)\s+(?P<identifier>{_MAC})\b"),
+    # Fanvil X4 2.4.5.1 0c383e112233
+    VendorParser("Fanvil", ("fanvil",), rf"fanvil\s+(?P<model>\S+)\s+(?P<version>\S+)\s+(?P<identifier>{_MAC})\b"),
+    # Grandstream Model HW GXP2170 [V1.0A] SW 1.0.11.3 DevId 000b82aabbcc
+    VendorParser(
+        "Grandstream", ("grandstream",),
+        rf"grandstream\s+model\s+hw\s+(?P<model>\S+)(?:\s+\S+)*?\s+sw\s+(?P<version>\S+)\s+devid\s+(?P<identifier>{_MAC})",
+    ),
+    # Grandstream GXP2000 (HW 1.0, SW 1.0.9.69, DevId 000b82aabbcc)
+    VendorParser(
+        "Grandstream", ("grandstream",),
+        rf"grandstream\s+(?P<model>[^\s(]+)\s*\(hw\s[^,]*,\s*sw\s+(?P<version>[^,\s]+),\s*devid\s+(?P<identifier>{_MAC})",
+    ),
+    # FileTransport PolycomVVX-VVX_411-UA/5.9.5.0614 (SN:0004f2aabbcc) Type/Application
+    # PolycomSoundPointIP-SPIP_450-UA/4.0.3.7562 (SN:0004f2aabbcc)
+    VendorParser(
+        "Polycom", (
+            "filetransport", "polycom", "polycomvvx", "polycomsoundpointip", "polycomsoundstationip",
+            "polycomrealpresencetrio",
+        ),
+        rf"(?:filetransport\s+)?polycom\w*-(?P<model>[^\s/]+?)-UA/(?P<version>\S+)\s+\(SN:(?P<identifier>{_MAC})\)",
+    ),
+    # Cisco/SPA504G-7.5.5 (0018B9AABBCC)(CCQ162306EA)
+    # Linksys/SPA942-6.1.5(a) (4FFF00000000)
+    VendorParser(
+        "Cisco", ("cisco", "linksys"),
+        rf"(?:cisco|linksys)/(?P<model>[^\s/]+?)-(?P<version>\d[^\s/]*)\s*\((?P<identifier>{_MAC})\)",
+    ),
+    # Cisco-CP-7841-3PCC/11.3.1 (00562b043615)
+    VendorParser(
+        "Cisco", ("cisco",),
+        rf"cisco-(?P<model>[^\s/]+)/(?P<version>\S+)\s*\((?P<identifier>{_MAC})\)",
+    ),
+)
+
+
+class UserAgentRegistry:
+    """Parsers by first-token prefix, plus the generic 'vendor model version identifier' layout."""
+
+    def __init__(self, parsers=DEFAULT_PARSERS, cache_size: int = CACHE_SIZE):
+        self._by_prefix = {}
+        self._lock = threading.Lock()
+        self._memo = LRUCache(maxsize=cache_size)
+        for parser in parsers:
+            self.register(parser)
+
+    def register(self, parser: VendorParser) -> None:
+        """Add parser (tried after those already registered for its prefixes); drops memoized results."""
+        with self._lock:
+            for prefix in parser.prefixes:
+                self._by_prefix.setdefault(prefix, []).append(parser)
+        self._memo.clear()
+
+    def parsers_for(self, user_agent: str) -> list:
+        match = _FIRST_TOKEN.match(user_agent)
+        return self._by_prefix.get(match.group(0).lower(), []) if match else []
+
+    def parse_uncached(self, user_agent: str):
+        """(vendor, model, version, identifier) or None, without the memo."""
+        user_agent = (user_agent or "").strip()
+        for parser in self.parsers_for(user_agent):
+            result = parser.parse(user_agent)
+            if result is not None:
+                return result
+        return parse_generic(user_agent)
+
+    def parse(self, user_agent: str):
+        user_agent = user_agent or ""
+        if len(user_agent) > MAX_MEMO_LENGTH:
+            return self.parse_uncached(user_agent)
+        result = self._memo.get(user_agent, _MISS)
+        if result is _MISS:
+            result = self.parse_uncached(user_agent)
+            self._memo.set(user_agent, result)
+        return result
+
+    def clear(self) -> None:
+        self._memo.clear(reset_stats=True)
+
+    def stats(self) -> dict:
+        return dict(self._memo.stats(), prefixes=sorted(self._by_prefix))
+
+
+def parse_generic(user_agent: str):
+    """'vendor model version <identifier...>' split on whitespace; None with fewer than 4 parts."""
+    parts = user_agent.split()
+    if len(parts) < 4:
+        return None
+    return parts[0], parts[1], parts[2], " ".join(parts[3:])
+
+
+_registry = UserAgentRegistry()
+
+
+def get_registry() -> UserAgentRegistry:
+    return _registry
+
+
+def register(parser: VendorParser) -> None:
+    _registry.register(parser)
+
+
+def parse(user_agent: str):
+    """(vendor, model, version, identifier) for user_agent, or None if no parser matched (memoized)."""
+    return _registry.parse(user_agent)
@@ -1,15 +1,26 @@
+from asgiref.sync import sync_to_async
 from django.http import HttpResponse, HttpResponseForbidden, JsonResponse, Http404
 from django.views.decorators.http import require_GET
 import logging
 import os
 import re
-import ipaddress
+import hashlib
+import calendar
+from datetime import timezone as dt_timezone
 from drf_spectacular.utils import extend_schema
+from django.conf import settings
 from django.core.serializers.json import DjangoJSONEncoder
 from django.utils import timezone
-from django.db import transaction
-from django.db.models import F
-from api.utils.mongo import get_mongo_client
+from django.utils.cache import get_conditional_response, patch_vary_headers
+from django.db.models import Q
+from django.utils.http import http_date
+from api.utils.mongo import get_async_mongo_client, get_mongo_client
+from api.utils import (
+    artifacts, client_ip, compression, device_cache, events, generations, known_devices, ratelimit, singleflight,
+    template_cache, timing, user_agents,
+)
+from api.utils.device_touch import touch_device
+from api.utils.templates import HOT_PATH_PROJECTION, TEMPLATES_COLLECTION, get_templates_collection, template_text
 
 # OAuth2 auth helper (django-oauth-toolkit)
 try:
@@ -19,6 +30,10 @@ except Exception:
 
 logger = logging.getLogger(__name__)
 
+# coalescência de misses simultâneos (resolve / corpo / render) neste worker
+_flights = singleflight.Group()
+_aflights = singleflight.AsyncGroup()
+
 # Lazy import helpers to avoid circular import at module import time
 def _get_models():
     try:
@@ -41,16 +56,22 @@ def _require_api_key(request):
 
 
 def parse_user_agent(request):
-    user_agent = request.META.get('HTTP_USER_AGENT', '').strip()
-    parts = user_agent.split()
-    if len(parts) < 4:
-        logger.debug("User-Agent parsing failed: expected >=4 parts, got %s (UA=%s)", len(parts), user_agent)
-        return None
-    vendor = parts[0]
-    model = parts[1]
-    version = parts[2]
-    identifier = " ".join(parts[3:])
-    return vendor, model, version, identifier
+    return parse_user_agent_string(request.META.get('HTTP_USER_AGENT', ''))
+
+
+def parse_user_agent_string(user_agent: str):
+    """
+    (vendor, model, version, identifier) de um User-Agent, ou None.
+
+    Usa o registro de parsers por fabricante (api.utils.user_agents: Yealink, Grandstream,
+    Polycom, Fanvil, Cisco e o layout genérico 'vendor model version <mac|identifier>'),
+    memoizado pelo UA bruto.
+    """
+    user_agent = (user_agent or '').strip()
+    ua_data = user_agents.parse(user_agent)
+    if ua_data is None:
+        logger.debug("User-Agent parsing failed: no parser matched (%s parts, UA=%s)", len(user_agent.split()), user_agent)
+    return ua_data
 
 
 def _normalize_mac(value: str):
@@ -61,95 +82,168 @@ def _normalize_mac(value: str):
     return v
 
 
-def _is_private_ip(ip_str):
-    try:
-        ip = ipaddress.ip_address(ip_str)
-        return ip.is_private
-    except Exception:
-        return False
-
-
 def _extract_public_ip(request):
-    xff = request.META.get('HTTP_X_FORWARDED_FOR') or request.headers.get('X-Forwarded-For')
-    if xff:
-        parts = [p.strip() for p in xff.split(',') if p.strip()]
-        if parts:
-            for p in parts:
-                try:
-                    ipaddress.ip_address(p)
-                    if not _is_private_ip(p):
-                        return p
-                except ValueError:
-                    continue
-            for p in parts:
-                try:
-                    ipaddress.ip_address(p)
-                    return p
-                except ValueError:
-                    continue
-    remote = request.META.get('REMOTE_ADDR')
-    try:
-        if remote:
-            ipaddress.ip_address(remote)
-            return remote
-    except ValueError:
-        return None
-    return None
+    """
+    IP do cliente: X-Forwarded-For percorrido da direita para a esquerda a partir de REMOTE_ADDR,
+    pulando apenas proxies confiáveis (api.utils.client_ip); calculado uma vez por request.
+    """
+    return client_ip.for_request(request).public_ip
 
 
 def _extract_private_ip(request):
-    candidates = [
-        request.META.get('HTTP_X_PRIVATE_IP'),
-        request.META.get('HTTP_X_DEVICE_PRIVATE_IP'),
-        request.META.get('HTTP_X_LOCAL_IP'),
-        request.META.get('HTTP_X_CLIENT_IP'),
-        request.headers.get('X-Private-IP') if hasattr(request, 'headers') else None,
-        request.headers.get('X-Device-Private-IP') if hasattr(request, 'headers') else None,
-    ]
-    for c in candidates:
-        if c:
-            c = c.strip()
-            for maybe in [p.strip() for p in c.split(',') if p.strip()]:
-                if _is_private_ip(maybe):
-                    return maybe
-    xff = request.META.get('HTTP_X_FORWARDED_FOR') or request.headers.get('X-Forwarded-For')
-    if xff:
-        for p in [pp.strip() for pp in xff.split(',') if pp.strip()]:
-            if _is_private_ip(p):
-                return p
-    return None
+    """IP na LAN do aparelho (da cadeia de proxies confiáveis, senão X-Private-IP etc.); apenas informativo."""
+    return client_ip.for_request(request).private_ip
 
 
 def get_device_config(identifier):
+    """
+    DeviceConfig (com profile via select_related) para o MAC normalizado ou identifier do UA.
+    Uma única query resolve os dois critérios (MAC tem prioridade); o resultado fica no cache
+    por worker (api.utils.device_cache), invalidado pelos signals em api.signals.
+    MACs/identifiers desconhecidos são respondidos sem SQL pelo filtro de dispositivos
+    conhecidos (api.utils.known_devices) ou pelo cache negativo de curta duração.
+    """
     DeviceConfig, Provisioning, DeviceProfile = _get_models()
     if not DeviceConfig:
         return None
     norm_mac = _normalize_mac(identifier)
-    if norm_mac:
-        try:
-            return DeviceConfig.objects.get(mac_address=norm_mac)
-        except DeviceConfig.DoesNotExist:
-            pass
-        except Exception as exc:
-            logger.exception("Error fetching DeviceConfig by mac_address=%s: %s", norm_mac, exc)
+    use_cache = device_cache.enabled()
+    key = device_cache.lookup_key(norm_mac, identifier)
+    if use_cache:
+        cached, unknown = _cached_device(key)
+        if cached is not None:
+            return cached
+        if unknown:
             return None
+    if not known_devices.might_exist(norm_mac, identifier):
+        return None
+
     try:
-        return DeviceConfig.objects.get(identifier=identifier)
-    except DeviceConfig.DoesNotExist:
+        candidates = list(_device_queryset(DeviceConfig, norm_mac, identifier))
+    except Exception as exc:
+        logger.exception("Error fetching DeviceConfig for identifier=%s: %s", identifier, exc)
+        return None
+    return _remember_device(use_cache, key, _pick_device(candidates, norm_mac))
+
+
+async def aget_device_config(identifier):
+    """
+    Versão assíncrona de get_device_config (ORM assíncrono; mesmos caches). Com gerações em um
+    cache compartilhado, as consultas ao cache por worker fazem I/O de rede e rodam fora do loop.
+    """
+    DeviceConfig, Provisioning, DeviceProfile = _get_models()
+    if not DeviceConfig:
         return None
+    norm_mac = _normalize_mac(identifier)
+    use_cache = device_cache.enabled()
+    key = device_cache.lookup_key(norm_mac, identifier)
+    blocking = generations.is_shared()
+    if use_cache:
+        cached, unknown = await _off_loop(blocking, _cached_device, key)
+        if cached is not None:
+            return cached
+        if unknown:
+            return None
+    if not await known_devices.amight_exist(norm_mac, identifier):
+        return None
+
+    try:
+        candidates = [d async for d in _device_queryset(DeviceConfig, norm_mac, identifier)]
     except Exception as exc:
-        logger.exception("Error fetching DeviceConfig by identifier=%s: %s", identifier, exc)
+        logger.exception("Error fetching DeviceConfig for identifier=%s: %s", identifier, exc)
         return None
+    return await _off_loop(blocking, _remember_device, use_cache, key, _pick_device(candidates, norm_mac))
+
+
+async def _off_loop(blocking: bool, fn, *args):
+    """fn(*args) no pool de threads quando faz I/O bloqueante (cache compartilhado), senão no próprio loop."""
+    if blocking:
+        return await sync_to_async(fn, thread_sensitive=False)(*args)
+    return fn(*args)
+
+
+def _cached_device(key: tuple):
+    """(DeviceConfig em cache ou None, se a chave está no cache negativo)."""
+    cached = device_cache.get(key)
+    if cached is not None:
+        return cached, False
+    return None, device_cache.is_unknown(key)
 
 
-def get_template_from_mongo(model: str, ext: str):
+def _device_queryset(DeviceConfig, norm_mac, identifier):
+    # MAC e identifier em uma única query (no máximo 2 linhas: ambos são unique)
+    criteria = Q(identifier=identifier)
+    if norm_mac:
+        criteria = Q(mac_address=norm_mac) | criteria
+    return DeviceConfig.objects.select_related("profile").filter(criteria)[:2]
+
+
+def _pick_device(candidates, norm_mac):
+    device = None
+    for candidate in candidates:
+        if norm_mac and candidate.mac_address == norm_mac:
+            return candidate
+        device = device or candidate
+    return device
+
+
+def _remember_device(use_cache: bool, key: tuple, device):
+    if use_cache:
+        if device is not None:
+            device_cache.put(key, device)
+        else:
+            device_cache.put_unknown(key)
+    return device
+
+
+def _unknown_device_policy() -> str:
+    """'generic' (padrão): serve o template genérico do modelo; 'reject': 403 imediato."""
+    conf = getattr(settings, "PROVISION_UNKNOWN_DEVICES", None) or {}
+    return str(conf.get("POLICY") or "generic").lower()
+
+
+def _template_lookup_pipeline(template_ref, model_q: str, ext: str) -> list:
+    """
+    Pipeline de agregação que resolve todas as tentativas de busca em uma única ida ao Mongo.
+    Cada tentativa é um ramo ($unionWith) com $limit 1 sobre um índice; o documento do ramo
+    de menor prioridade (_rank) vence:
+      0) _id == template_ref
+      1) _id == template_ref em lower-case
+      2) model_lc == model e extension == ext
+      3) _id == model em lower-case
+      4) fallback: extension == ext
     """
-    Busca template no MongoDB a partir do campo 'model' (case-insensitive) e 'extension'.
-    Tentativas (em ordem):
-      1) buscar por documento com campo 'model' case-insensitive igual a model e extension == ext
-      2) buscar por _id igual a model.lower() (compatibilidade com chaves salvas em lower-case)
-      3) fallback: buscar qualquer template com extension == ext
-    Retorna o documento (dict) ou None.
+    branches = []
+    if template_ref:
+        tref = str(template_ref)
+        branches.append({"_id": tref})
+        t_lower = tref.strip().lower()
+        if t_lower and t_lower != tref:
+            branches.append({"_id": t_lower})
+    if model_q:
+        branches.append({"model_lc": model_q, "extension": ext})
+        branches.append({"_id": model_q})
+    branches.append({"extension": ext})
+
+    def branch(rank, match):
+        return [{"$match": match}, {"$limit": 1}, {"$addFields": {"_rank": rank}}]
+
+    pipeline = branch(0, branches[0])
+    for rank, match in enumerate(branches[1:], start=1):
+        pipeline.append({"$unionWith": {"coll": TEMPLATES_COLLECTION, "pipeline": branch(rank, match)}})
+    # sem o corpo comprimido: na maioria das vezes o plano compilado já está no cache do worker
+    pipeline += [{"$sort": {"_rank": 1}}, {"$limit": 1}, {"$project": dict(HOT_PATH_PROJECTION, _rank=0)}]
+    return pipeline
+
+
+def get_template_from_mongo(model: str, ext: str, template_ref: str = None):
+    """
+    Busca template no MongoDB a partir de template_ref (opcional), do 'model' e da 'extension'.
+    Todas as tentativas (ver _template_lookup_pipeline) são resolvidas em uma única consulta
+    sobre a chave normalizada model_lc + extension (ver api.utils.templates e o comando
+    `manage.py backfill_template_keys`).
+    Retorna o documento (dict) sem o corpo comprimido (HOT_PATH_PROJECTION; ver
+    get_template_body) ou None.
     """
     try:
         db = get_mongo_client()
@@ -158,65 +252,165 @@ def get_template_from_mongo(model: str, ext: str):
         return None
 
     try:
-        coll = getattr(db, "device_templates", db.get_collection("device_templates"))
+        coll = get_templates_collection(db)
         model_q = (model or "").strip().lower()
-        # 1) buscar por campo 'model' case-insensitive
-        if model_q:
-            # escapamos para evitar metacaracteres regex
-            regex = f"^{re.escape(model_q)}$"
-            doc = coll.find_one({"model": {"$regex": regex, "$options": "i"}, "extension": ext})
-            if doc:
+        pipeline = _template_lookup_pipeline(template_ref, model_q, ext)
+        with timing.phase("mongo"):
+            for doc in coll.aggregate(pipeline):
                 return doc
+        return None
+    except Exception as exc:
+        logger.exception("MongoDB query failed for model=%s ext=%s ref=%s: %s", model, ext, template_ref, exc)
+        return None
 
-            # 2) buscar por _id igual ao model em lower-case
-            doc = coll.find_one({"_id": model_q})
-            if doc:
-                return doc
 
-        # 3) fallback por extensão
-        doc = coll.find_one({"extension": ext})
-        if doc:
-            return doc
+async def aget_template_from_mongo(model: str, ext: str, template_ref: str = None):
+    """Versão assíncrona de get_template_from_mongo (pymongo AsyncMongoClient)."""
+    try:
+        db = get_async_mongo_client()
+    except Exception as exc:
+        logger.exception("Failed to get async mongo DB handle: %s", exc)
+        return None
 
+    try:
+        coll = get_templates_collection(db)
+        model_q = (model or "").strip().lower()
+        with timing.phase("mongo"):
+            cursor = await coll.aggregate(_template_lookup_pipeline(template_ref, model_q, ext))
+            async for doc in cursor:
+                return doc
+        return None
+    except Exception as exc:
+        logger.exception("MongoDB query failed for model=%s ext=%s ref=%s: %s", model, ext, template_ref, exc)
         return None
+
+
+def get_template_body(template_doc):
+    """
+    Documento completo (com o corpo) de um template lido sem ele; template_doc se já o tiver.
+    Leituras simultâneas do mesmo _id são coalescidas (uma só consulta ao Mongo).
+    """
+    if not template_doc or template_text(template_doc) is not None:
+        return template_doc
+    return _flights.do(("body", template_doc["_id"]), lambda: _fetch_template_body(template_doc))
+
+
+def _fetch_template_body(template_doc):
+    try:
+        coll = get_templates_collection(get_mongo_client())
+        with timing.phase("mongo"):
+            return coll.find_one({"_id": template_doc["_id"]}) or template_doc
     except Exception as exc:
-        logger.exception("MongoDB query failed for model=%s ext=%s: %s", model, ext, exc)
+        logger.exception("MongoDB body fetch failed for template %s: %s", template_doc.get("_id"), exc)
+        return template_doc
+
+
+async def aget_template_body(template_doc):
+    """Versão assíncrona de get_template_body."""
+    if not template_doc or template_text(template_doc) is not None:
+        return template_doc
+    return await _aflights.do(("body", template_doc["_id"]), lambda: _afetch_template_body(template_doc))
+
+
+async def _afetch_template_body(template_doc):
+    try:
+        coll = get_templates_collection(get_async_mongo_client())
+        with timing.phase("mongo"):
+            return await coll.find_one({"_id": template_doc["_id"]}) or template_doc
+    except Exception as exc:
+        logger.exception("MongoDB body fetch failed for template %s: %s", template_doc.get("_id"), exc)
+        return template_doc
+
+
+def _entry_without_body(key: tuple, template_doc):
+    """CachedTemplate do plano já compilado para (_id, content_hash), sem ler o corpo."""
+    if not template_doc or template_text(template_doc) is not None:
         return None
+    entry = template_cache.entry_from_compiled(template_doc)
+    if entry is not None:
+        template_cache.put_resolved(key, entry)
+    return entry
 
-def substitute_percent_placeholders(template_text: str, context: dict) -> str:
+
+def resolve_template(template_ref, model: str, ext: str):
     """
-    Substitui placeholders no formato %%nome%% por valores vindos de context.
-    - Faz lookup case-insensitive da chave no context (usa chave lower()).
-    - Booleanos são convertidos em '1' / '0' (útil para flags como %%vlanactive%%).
-    - Valores None ou keys ausentes são substituídos por string vazia.
+    Resolve o template compilado para (template_ref, model, ext).
+
+    Usa o cache por worker (api.utils.template_cache): em cache hit não há consulta ao Mongo
+    nem novo parse. Em cache miss faz uma única consulta (get_template_from_mongo, que já
+    inclui template_ref) que traz só o content_hash; o corpo só é lido (get_template_body) e
+    compilado se esta versão ainda não estiver compilada. Retorna CachedTemplate ou None se nenhum template existir.
+    Misses simultâneos da mesma chave são coalescidos (api.utils.singleflight): só uma thread
+    do worker consulta o Mongo e compila; as demais recebem o mesmo resultado (ou exceção).
+    Levanta ValueError se o documento não tiver corpo legível ('body' ou 'template'/'content') e
+    TemplateSyntaxError se o template for inválido.
     """
-    if not template_text:
-        return template_text
-
-    # preparar um dicionário com chaves lower-case para lookup rápido
-    ctx = {str(k).lower(): v for k, v in (context or {}).items()}
-
-    def repl(match: re.Match) -> str:
-        key = (match.group(1) or "").strip().lower()
-        val = ctx.get(key, "")
-        # converter booleanos para 1/0
-        if isinstance(val, bool):
-            return "1" if val else "0"
-        # None -> empty
-        if val is None:
-            return ""
-        # se for lista/dict, converter para string JSON/simple
-        if isinstance(val, (list, dict)):
-            try:
-                import json
-                return json.dumps(val, ensure_ascii=False)
-            except Exception:
-                return str(val)
-        return str(val)
-
-    # regex procura %%nome%% — nome composto por letras, dígitos e underscore
-    pattern = re.compile(r"%%([A-Za-z0-9_]+)%%")
-    return pattern.sub(repl, template_text)
+    key = template_cache.lookup_key(template_ref, model, ext)
+    entry = template_cache.get_resolved(key)
+    if entry is not None:
+        return entry
+    return _flights.do(("resolve",) + key, lambda: _resolve_uncached(key, template_ref, model, ext))
+
+
+def _resolve_uncached(key: tuple, template_ref, model: str, ext: str):
+    # outro voo pode ter preenchido o cache entre o miss e a entrada neste
+    entry = template_cache.get_resolved(key)
+    if entry is not None:
+        return entry
+    if template_ref:
+        template_doc = get_template_from_mongo(model, ext, template_ref)
+    else:
+        template_doc = get_template_from_mongo(model, ext)
+    entry = _entry_without_body(key, template_doc)
+    if entry is not None:
+        return entry
+    return _cache_template_doc(key, get_template_body(template_doc))
+
+
+async def aresolve_template(template_ref, model: str, ext: str):
+    """
+    Versão assíncrona de resolve_template (mesmo cache; Mongo via aget_template_from_mongo). Com
+    gerações em um cache compartilhado, as consultas e gravações no cache rodam fora do loop.
+    """
+    key = template_cache.lookup_key(template_ref, model, ext)
+    entry = await _off_loop(generations.is_shared(), template_cache.get_resolved, key)
+    if entry is not None:
+        return entry
+    return await _aflights.do(("resolve",) + key, lambda: _aresolve_uncached(key, template_ref, model, ext))
+
+
+async def _aresolve_uncached(key: tuple, template_ref, model: str, ext: str):
+    blocking = generations.is_shared()
+    entry = await _off_loop(blocking, template_cache.get_resolved, key)
+    if entry is not None:
+        return entry
+    template_doc = await aget_template_from_mongo(model, ext, template_ref)
+    entry = await _off_loop(blocking, _entry_without_body, key, template_doc)
+    if entry is not None:
+        return entry
+    template_doc = await aget_template_body(template_doc)
+    return await _off_loop(blocking, _cache_template_doc, key, template_doc)
+
+
+def _cache_template_doc(key: tuple, template_doc):
+    if not template_doc:
+        return None
+
+    # corpo comprimido ('body') ou, em documentos legados, 'template' -> 'content'
+    template_str = template_text(template_doc)
+    if not isinstance(template_str, str):
+        raise ValueError(f"template document {template_doc.get('_id')!r} has no text body")
+
+    with timing.phase("compile"):
+        entry = template_cache.build_entry(template_doc, template_str)
+    template_cache.put_resolved(key, entry)
+    return entry
+
+
+def render_compiled(compiled, context):
+    """Renderiza um RenderPlan (api.utils.render_plan): {{ }} e %%nome%% em uma única passada."""
+    return compiled.render(context)
+
 
 def render_template(template_str, context):
     from django.template import Template, Context, TemplateSyntaxError
@@ -228,6 +422,50 @@ def render_template(template_str, context):
         raise
 
 
+def _as_aware_utc(value):
+    """Datetimes vindos do Mongo (uploaded_at) são naive em UTC; os do ORM já são aware."""
+    if value is None or not hasattr(value, "utctimetuple"):
+        return None
+    if timezone.is_naive(value):
+        return value.replace(tzinfo=dt_timezone.utc)
+    return value
+
+
+def config_validators(device, template_entry, ua_data, ext: str):
+    """
+    Calcula (etag, last_modified) da configuração sem renderizá-la.
+
+    O ETag (forte) é um hash de tudo que entra no render: versão do template, updated_at de
+    DeviceConfig/DeviceProfile e os dados do User-Agent (vendor, model, version, identifier) + ext.
+    last_modified é o maior timestamp (epoch, segundos) entre device, profile e upload do template,
+    ou None se algum deles for desconhecido.
+    """
+    profile = device.profile if device else None
+    device_stamp = device.updated_at if device else None
+    profile_stamp = profile.updated_at if profile else None
+    parts = [
+        str(template_entry.template_id),
+        template_entry.version,
+        str(device.pk) if device else "",
+        device_stamp.isoformat() if device_stamp else "",
+        str(profile.pk) if profile else "",
+        profile_stamp.isoformat() if profile_stamp else "",
+        ext,
+    ]
+    parts.extend(str(p) for p in ua_data)
+    etag = '"%s"' % hashlib.sha256("\x1f".join(parts).encode("utf-8")).hexdigest()[:40]
+
+    stamps = [_as_aware_utc(template_entry.uploaded_at)]
+    if device:
+        stamps.append(device_stamp)
+    if profile:
+        stamps.append(profile_stamp)
+    if any(st is None for st in stamps):
+        return etag, None
+    last_modified = calendar.timegm(max(stamps).utctimetuple())
+    return etag, last_modified
+
+
 def _sanitize_filename(name):
     if not name:
         return name
@@ -246,86 +484,322 @@ def _sanitize_filename(name):
         "Download do arquivo de configuração do dispositivo.\n\n"
         "User-Agent esperado: 'vendor model version <mac|identifier>' (identifier pode conter separadores). "
     ),
-    responses={200: None, 403: None},
+    responses={200: None, 304: None, 403: None, 429: None},
 )
 @require_GET
 def download_config(request, filename: str = None):
+    """
+    Endpoint de download de configuração; delega para _download_config e registra o evento
+    de provisionamento (api.utils.events, gravação em lote fora do request).
+    Os tempos por etapa vão no cabeçalho Server-Timing e no log (api.utils.timing).
+    """
+    event = _new_event(request, filename)
+    with timing.request_timer() as timer:
+        try:
+            response = _download_config(request, filename, event)
+        except Exception:
+            event["status"] = events.STATUS_ERROR
+            _record_download(request, None, event)
+            timing.report(timer, None, event)
+            raise
+        _record_download(request, response, event)
+        timing.report(timer, response, event)
+    return response
+
+
+@extend_schema(
+    methods=['GET'],
+    description="Variante assíncrona (ASGI) de download-xml; mesma semântica de download_config.",
+    responses={200: None, 304: None, 403: None, 429: None},
+)
+@require_GET
+async def download_config_async(request, filename: str = None):
+    """
+    download_config para ASGI (uvicorn): ORM assíncrono e pymongo AsyncMongoClient, sem
+    bloquear o event loop, de modo que um worker atende milhares de aparelhos lentos ao
+    mesmo tempo. Usada na rota download-xml quando settings.PROVISION_ASYNC_DOWNLOAD é True.
+    """
+    event = _new_event(request, filename)
+    with timing.request_timer() as timer:
+        try:
+            response = await _adownload_config(request, filename, event)
+        except Exception:
+            event["status"] = events.STATUS_ERROR
+            _record_download(request, None, event)
+            timing.report(timer, None, event)
+            raise
+        _record_download(request, response, event)
+        timing.report(timer, response, event)
+    return response
+
+
+def _new_event(request, filename) -> dict:
+    return {
+        "filename": filename or "",
+        "user_agent": request.META.get("HTTP_USER_AGENT", ""),
+    }
+
+
+def _record_download(request, response, event: dict) -> None:
+    if getattr(response, "status_code", None) == 429:
+        # requisições limitadas não viram eventos: um aparelho em loop inundaria Provisioning
+        return
+    if "status" not in event:
+        code = getattr(response, "status_code", 500)
+        if code < 400:
+            event["status"] = events.STATUS_OK
+            # provisioned_at / attempts_provisioning: agregados e aplicados em lote
+            touch_device(event.get("device_id"))
+        elif code < 500:
+            event["status"] = events.STATUS_FORBIDDEN
+        else:
+            event["status"] = events.STATUS_ERROR
+    events.record_event(
+        public_ip=_extract_public_ip(request),
+        private_ip=_extract_private_ip(request),
+        **event,
+    )
+
+
+def _download_config(request, filename, event: dict):
     """
     Endpoint de download de configuração (ajustado para usar modelo extraído do User-Agent).
 
     - Extrai vendor, model, version, identifier (MAC ou account) do User-Agent via parse_user_agent().
       Exemplo de UA: "Ale H2P 2.10 aabbccddeeff" -> vendor='Ale', model='H2P', version='2.10', identifier='aabbccddeeff'
-    - Normaliza model para lower() e usa get_template_from_mongo(model_lower, ext).
+    - Normaliza model para lower() e usa get_template_from_mongo(model_lower, ext[, template_ref]).
     - Normaliza mac (identifier) com _normalize_mac e busca DeviceConfig via get_device_config(identifier).
     - Prefere profile.template_ref quando presente (tentando versão original e lower-case).
-    - Renderiza o template (campo 'template' do documento Mongo) com contexto combinado (device + profile + UA).
+    - Resolve o template via resolve_template(): cache por worker de templates compilados,
+      Mongo apenas em cache miss.
+    - Calcula ETag/Last-Modified antes do render (config_validators) e responde 304 quando
+      If-None-Match / If-Modified-Since indicam que o aparelho já tem a versão atual.
+    - Renderiza o template (corpo do documento Mongo, ver api.utils.templates) com contexto combinado (device + profile + UA),
+      resolvendo {{ nome }} e %%nome%% em uma única passada (api.utils.render_plan).
     - Retorna o conteúdo renderizado como application/xml (ext == 'xml') ou text/plain (cfg).
-    """
-    # parse User-Agent
-    ua_data = parse_user_agent(request)
-    if not ua_data:
-        logger.warning("Invalid User-Agent format for request from %s", request.META.get("REMOTE_ADDR"))
-        return HttpResponseForbidden("Forbidden: Invalid User-Agent format")
 
-    vendor, model, version, identifier = ua_data
-    model_for_query = (model or "").strip().lower()
-    # identifier normalmente é mac ou account; normalizar para busca
-    norm_identifier = _normalize_mac(identifier) or (identifier or "").strip()
+    As etapas ficam em _Download, compartilhadas com _adownload_config.
+    """
+    dl = _Download(request, filename, event)
+    with timing.phase("ua"):
+        response = dl.parse()
+    if response is not None:
+        return response
 
     # localizar device (tenta MAC normalizado primeiro, depois identifier)
-    device = None
+    with timing.phase("device"):
+        try:
+            device = get_device_config(dl.identifier)
+        except Exception:
+            logger.exception("Error fetching device for identifier=%s", dl.identifier)
+            device = None
+    response = dl.set_device(device)
+    if response is not None:
+        return response
+
+    # resolver template compilado (cache por worker; Mongo só em cache miss)
     try:
-        device = get_device_config(identifier)
-    except Exception:
-        logger.exception("Error fetching device for identifier=%s", identifier)
-        device = None
+        with timing.phase("template"):
+            template_entry = resolve_template(dl.template_ref, dl.model_for_query, dl.ext)
+    except Exception as exc:
+        return dl.template_error(exc)
+    return dl.respond(template_entry)
 
-    # inferir extensão (xml por padrão; se filename terminar com .cfg então cfg)
-    ext = "xml"
-    if filename and filename.lower().endswith(".cfg"):
-        ext = "cfg"
-    else:
-        # também tentar inspecionar request.path ou outros parâmetros se necessário
-        pass
 
-    template_doc = None
+async def _adownload_config(request, filename, event: dict):
+    """Mesmo fluxo de _download_config com aget_device_config/aresolve_template."""
+    dl = _Download(request, filename, event)
+    with timing.phase("ua"):
+        # com janelas compartilhadas (CACHE_ALIAS) o rate limit faz I/O no cache: fora do loop
+        response = await _off_loop(ratelimit.is_shared(), dl.parse)
+    if response is not None:
+        return response
 
-    # 1) preferir profile.template_ref se device.profile estiver presente
-    if device and device.profile and device.profile.template_ref:
+    with timing.phase("device"):
         try:
-            db = get_mongo_client()
-            coll = getattr(db, "device_templates", db.get_collection("device_templates"))
-            # tenta pelo template_ref exato
-            tref = device.profile.template_ref
-            template_doc = coll.find_one({"_id": tref})
-            if not template_doc:
-                # tenta versão lower-case (compatibilidade)
-                t_lower = str(tref).strip().lower()
-                if t_lower:
-                    template_doc = coll.find_one({"_id": t_lower})
+            device = await aget_device_config(dl.identifier)
         except Exception:
-            logger.exception("Mongo lookup by template_ref failed for %s", device.profile.template_ref)
-            template_doc = None
+            logger.exception("Error fetching device for identifier=%s", dl.identifier)
+            device = None
+    response = dl.set_device(device)
+    if response is not None:
+        return response
 
-    # 2) se não encontrou via template_ref, buscar por model extraído do UA
-    if not template_doc:
-        template_doc = get_template_from_mongo(model_for_query, ext)
+    try:
+        with timing.phase("template"):
+            template_entry = await aresolve_template(dl.template_ref, dl.model_for_query, dl.ext)
+    except Exception as exc:
+        return dl.template_error(exc)
+    response = dl.validate(template_entry)
+    if response is not None:
+        return response
+    # leitura do artefato, render e compressão bloqueiam: rodam no pool de threads, fora do event loop
+    return await sync_to_async(dl.produce, thread_sensitive=False)(template_entry)
+
+
+class _Download:
+    """Estado de um request download-xml e as etapas comuns às duas views (parse, validação, render)."""
+
+    def __init__(self, request, filename, event: dict):
+        self.request = request
+        self.filename = filename
+        self.event = event
+        self.ua_data = None
+        self.device = None
+
+    def parse(self):
+        """
+        Interpreta o User-Agent e a extensão e aplica os limites por MAC/IP (antes de qualquer
+        SQL ou Mongo). Retorna uma resposta 429 se limitado ou 403 se o UA for inválido.
+        """
+        # parse User-Agent
+        ua_data = parse_user_agent(self.request)
+        limited = self.throttle(_normalize_mac(ua_data[3]) if ua_data else None)
+        if limited is not None:
+            return limited
+        if not ua_data:
+            logger.warning("Invalid User-Agent format for request from %s", self.request.META.get("REMOTE_ADDR"))
+            self.event["notes"] = "invalid user-agent"
+            return HttpResponseForbidden("Forbidden: Invalid User-Agent format")
+
+        self.ua_data = ua_data
+        self.vendor, self.model, self.version, self.identifier = ua_data
+        self.model_for_query = (self.model or "").strip().lower()
+        self.event.update(vendor=self.vendor, model=self.model, version=self.version,
+                          identifier=self.identifier, mac_address=_normalize_mac(self.identifier))
+
+        self.ext = config_extension(self.filename)
+        return None
 
-    # 3) se ainda não encontrou -> reprovar
-    if not template_doc:
-        logger.warning("Configuration template not found for model=%s ext=%s", model_for_query, ext)
-        return HttpResponseForbidden("Configuration template not found for this model and extension")
+    def throttle(self, mac):
+        """429 com Retry-After se o MAC ou o IP de origem passou do limite (api.utils.ratelimit)."""
+        ip = _extract_public_ip(self.request)
+        hit = ratelimit.check(mac=mac, ip=ip)
+        if hit is None:
+            return None
+        kind, retry_after = hit
+        logger.debug("download-xml rate limited by %s (mac=%s ip=%s)", kind, mac, ip)
+        self.event["notes"] = f"rate limited ({kind})"
+        response = HttpResponse("Too Many Requests", status=429, content_type="text/plain; charset=utf-8")
+        response["Retry-After"] = str(retry_after)
+        return response
+
+    def set_device(self, device):
+        self.device = device
+        if device:
+            self.event.update(device_id=device.pk, identifier=device.identifier, mac_address=device.mac_address)
+        elif _unknown_device_policy() == "reject":
+            # device não cadastrado: recusar antes de qualquer acesso ao Mongo
+            self.event["notes"] = "unknown device"
+            return HttpResponseForbidden("Forbidden: unknown device")
+        return None
 
-    # obter string do template com fallback (template -> content)
-    template_str = template_doc.get("template") or template_doc.get("content")
-    if not isinstance(template_str, str):
-        logger.error("Invalid template document structure for model=%s ext=%s: %s", model_for_query, ext, template_doc)
-        return HttpResponseForbidden("Configuration template invalid")
+    @property
+    def template_ref(self):
+        device = self.device
+        return device.profile.template_ref if device and device.profile else None
+
+    def template_error(self, exc):
+        if isinstance(exc, ValueError):
+            logger.error("Invalid template document structure for model=%s ext=%s", self.model_for_query, self.ext)
+            self.event.update(status=events.STATUS_ERROR, notes="invalid template document")
+            return HttpResponseForbidden("Configuration template invalid")
+        logger.error("Error compiling template for model=%s ext=%s", self.model_for_query, self.ext, exc_info=exc)
+        self.event.update(status=events.STATUS_ERROR, notes="template compile error")
+        return HttpResponseForbidden("Forbidden: error rendering template")
 
-    # montar contexto para renderização (mapear placeholders)
+    def respond(self, template_entry):
+        """304, 403 (template ausente / erro de render) ou a configuração renderizada."""
+        response = self.validate(template_entry)
+        if response is not None:
+            return response
+        return self.produce(template_entry)
+
+    def validate(self, template_entry):
+        """403 se não há template, 304 se o aparelho já tem a versão atual, senão None (sem I/O)."""
+        event, ext = self.event, self.ext
+        if not template_entry:
+            logger.warning("Configuration template not found for model=%s ext=%s", self.model_for_query, ext)
+            event["notes"] = "template not found"
+            return HttpResponseForbidden("Configuration template not found for this model and extension")
+        event["template_ref"] = template_entry.template_id or ""
+
+        # validação condicional antes do render: If-None-Match / If-Modified-Since -> 304
+        # (cada Content-Encoding tem o seu ETag, ver api.utils.compression)
+        with timing.phase("validate"):
+            etag, last_modified = config_validators(self.device, template_entry, self.ua_data, ext)
+            coding = compression.negotiate(self.request, self.vendor)
+            not_modified = get_conditional_response(
+                self.request, etag=compression.variant_etag(etag, coding), last_modified=last_modified,
+            )
+        if not_modified is not None:
+            event["notes"] = "not modified"
+            if compression.available_codings():
+                patch_vary_headers(not_modified, ("Accept-Encoding",))
+            return not_modified
+        self.etag, self.last_modified, self.coding = etag, last_modified, coding
+        return None
+
+    def produce(self, template_entry):
+        """Configuração do artefato pré-renderizado ou renderizada, comprimida (I/O e CPU; após validate)."""
+        event, device = self.event, self.device
+        etag, last_modified, coding = self.etag, self.last_modified, self.coding
+
+        # configuração pré-renderizada (api.prerender) com o mesmo ETag: servir sem renderizar
+        store = artifacts.serving_store()
+        if store is not None:
+            with timing.phase("artifact"):
+                final_content = store.get(etag)
+            if final_content is not None:
+                event["notes"] = "served from artifact store"
+                return self._config_response(
+                    final_content, etag, last_modified, coding,
+                    loader=lambda c: store.get_encoded(etag, c),
+                )
+
+        # renderizar o plano compilado: {{ }} e %%nome%% resolvidos em uma única passada;
+        # o ETag identifica os bytes, então renders simultâneos do mesmo ETag são coalescidos
+        try:
+            with timing.phase("render"):
+                final_content = _flights.do(
+                    ("render", etag), lambda: render_compiled(template_entry.compiled, self.context()),
+                )
+        except Exception:
+            logger.exception("Error rendering template for device %s", getattr(device, "identifier", None))
+            event.update(status=events.STATUS_ERROR, notes="render error")
+            return HttpResponseForbidden("Forbidden: error rendering template")
+        return self._config_response(final_content, etag, last_modified, coding)
+
+    def _config_response(self, final_content, etag, last_modified, coding=None, loader=None):
+        content_type = "application/xml; charset=utf-8" if self.ext == "xml" else "text/plain; charset=utf-8"
+        response = HttpResponse(final_content, content_type=content_type)
+        response["ETag"] = compression.variant_etag(etag, coding)
+        if last_modified is not None:
+            response["Last-Modified"] = http_date(last_modified)
+        # corpo comprimido em cache por (ETag, coding): repetições não recomprimem
+        return compression.apply(response, etag, coding, loader)
+
+    def context(self) -> dict:
+        return build_context(self.device, self.ua_data)
+
+
+def config_extension(filename) -> str:
+    """Extensão da configuração pedida: xml por padrão; cfg se o filename terminar com .cfg."""
+    if filename and filename.lower().endswith(".cfg"):
+        return "cfg"
+    return "xml"
+
+
+def build_context(device, ua_data) -> dict:
+    """
+    Contexto de renderização (mapeia os placeholders do template) a partir do device (ou None)
+    e do User-Agent já interpretado. Usado pelo download-xml e pelo pré-render (api.prerender).
+    """
+    vendor, model, version, identifier = ua_data
+    norm_identifier = _normalize_mac(identifier) or (identifier or "").strip()
     profile = device.profile if device else None
 
-    context = {
+    return {
         # UA / device-level
         "vendor": vendor,
         "model": model,
@@ -357,33 +831,3 @@ def download_config(request, filename: str = None):
         "vlanactive": getattr(profile, "vlan_active", False) if profile else False,
         "vlanid": getattr(profile, "vlan_id", "") if profile else "",
     }
-
-    # render template using existing helper (raises TemplateSyntaxError on bad template)
-    try:
-        config_content = render_template(template_str, context)
-    except Exception:
-        logger.exception("Error rendering template for device %s", getattr(device, "identifier", None))
-        return HttpResponseForbidden("Forbidden: error rendering template")
-
-    # aplicar substituição para placeholders do tipo %%nome%% usando os dados do context
-    try:
-        final_content = substitute_percent_placeholders(config_content, context)
-    except Exception:
-        logger.exception("Failed to substitute %%...%% placeholders for device %s", getattr(device, "identifier", None))
-        final_content = config_content
-
-    # devolver final_content em vez de config_content
-    content_type = "application/xml; charset=utf-8" if ext == "xml" else "text/plain; charset=utf-8"
-    return HttpResponse(final_content, content_type=content_type)
-
-    # mark device provisioned (best-effort; preserve existing provisioning workflow)
-    try:
-        if device:
-            device.provisioned_at = timezone.now()
-            device.save(update_fields=["provisioned_at"])
-    except Exception:
-        logger.exception("Failed to update device provisioned_at for %s", getattr(device, "identifier", None))
-
-    # return rendered configuration
-    content_type = "application/xml; charset=utf-8" if ext == "xml" else "text/plain; charset=utf-8"
-    return HttpResponse(config_content, content_type=content_type)
\ No newline at end of file
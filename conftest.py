@@ -0,0 +1,37 @@
+import pytest
+
+
+@pytest.fixture(autouse=True)
+def _reset_provisioning_caches(settings):
+    """
+    Per-worker caches and write-behind buffers are module globals: start every test from a
+    cold cache and keep background writers off (tests that need them install their own).
+    """
+    from api.utils import (
+        artifacts, client_ip, compression, device_cache, device_touch, events, generations, known_devices, ratelimit,
+        template_cache,
+    )
+
+    settings.PROVISION_EVENTS = dict(getattr(settings, "PROVISION_EVENTS", {}), ENABLED=False)
+    settings.PROVISION_DEVICE_TOUCH = dict(getattr(settings, "PROVISION_DEVICE_TOUCH", {}), ENABLED=False)
+    settings.PROVISION_RATE_LIMIT = dict(getattr(settings, "PROVISION_RATE_LIMIT", {}), ENABLED=False)
+    settings.PROVISION_UNKNOWN_DEVICES = dict(getattr(settings, "PROVISION_UNKNOWN_DEVICES", {}), BACKGROUND=False)
+    template_cache.clear()
+    device_cache.clear()
+    compression.clear()
+    artifacts.clear()
+    events.set_recorder(None)
+    device_touch.set_coalescer(None)
+    known_devices.set_index(None)
+    ratelimit.set_limiter(None)
+    generations.set_generations(None)
+    client_ip.set_resolver(None)
+    yield
+    events.set_recorder(None)
+    device_touch.set_coalescer(None)
+    known_devices.set_index(None)
+    ratelimit.set_limiter(None)
+    generations.set_generations(None)
+    client_ip.set_resolver(None)
+    template_cache.clear()
+    device_cache.clear()
@@ -0,0 +1,274 @@
+"""
+Importação em massa de dispositivos (DeviceConfig) a partir de CSV ou JSONL.
+
+Usado pelo comando `manage.py import_devices` e pela view core:device_import.
+O arquivo é lido em streaming e processado em lotes de `chunk_size` linhas:
+  - normalização do MAC igual a core.models._normalize_mac;
+  - validação do lote (campos obrigatórios, tamanhos, IPs, perfil por nome e identifier já
+    usado por outro MAC) com no máximo duas queries por lote;
+  - upsert com bulk_create(update_conflicts=True) sobre mac_address, um transaction.atomic()
+    por lote (um lote inválido não desfaz os anteriores). As linhas do lote são agrupadas pelas
+    colunas que trazem (linhas JSONL podem diferir entre si): cada grupo atualiza só as suas.
+Só o lote corrente fica em memória, então o consumo não cresce com o tamanho do arquivo.
+
+Colunas aceitas: identifier, mac_address (ou mac), profile (nome do DeviceProfile),
+display_name, user_register, passwd_register, ip_address, public_ip, private_ip.
+Em dispositivos já existentes só as colunas presentes no arquivo são atualizadas.
+"""
+
+import csv
+import io
+import ipaddress
+import json
+import logging
+import time
+from itertools import islice
+
+from django.db import IntegrityError, connection, transaction
+
+from .models import DeviceConfig, DeviceProfile, _normalize_mac
+
+logger = logging.getLogger(__name__)
+
+FORMAT_CSV = "csv"
+FORMAT_JSONL = "jsonl"
+FORMATS = (FORMAT_CSV, FORMAT_JSONL)
+
+TEXT_FIELDS = ("identifier", "display_name", "user_register", "passwd_register")
+IP_FIELDS = ("ip_address", "public_ip", "private_ip")
+IMPORT_FIELDS = ("mac_address", "profile") + TEXT_FIELDS + IP_FIELDS
+_ALIASES = {"mac": "mac_address", "macaddress": "mac_address", "account": "identifier", "displayname": "display_name"}
+
+DEFAULT_CHUNK_SIZE = 1000
+MAX_REPORTED_ERRORS = 100
+
+
+def detect_format(filename: str, default: str = FORMAT_CSV) -> str:
+    name = (filename or "").lower()
+    if name.endswith((".jsonl", ".ndjson", ".json")):
+        return FORMAT_JSONL
+    if name.endswith(".csv"):
+        return FORMAT_CSV
+    return default
+
+
+def text_stream(binary_file, encoding: str = "utf-8-sig"):
+    """Envolve um arquivo binário (upload, sys.stdin.buffer) para leitura de texto em streaming."""
+    return io.TextIOWrapper(binary_file, encoding=encoding, newline="")
+
+
+def iter_records(stream, fmt: str):
+    """Gera (número da linha, dict) a partir de um stream de texto CSV ou JSONL."""
+    if fmt == FORMAT_JSONL:
+        for lineno, line in enumerate(stream, start=1):
+            line = line.strip()
+            if not line:
+                continue
+            try:
+                record = json.loads(line)
+            except ValueError as exc:
+                yield lineno, {"__error__": f"JSON inválido: {exc}"}
+                continue
+            yield lineno, record if isinstance(record, dict) else {"__error__": "linha JSONL não é um objeto"}
+    elif fmt == FORMAT_CSV:
+        reader = csv.DictReader(stream)
+        for record in reader:
+            # reader.line_num: linha física do fim do registro (1 = cabeçalho)
+            yield reader.line_num, record
+    else:
+        raise ValueError(f"formato desconhecido {fmt!r}; use um de {FORMATS}")
+
+
+class ImportStats:
+    """Contadores da importação (acumulados lote a lote)."""
+
+    def __init__(self):
+        self.read = 0
+        self.imported = 0
+        self.invalid = 0
+        self.chunks = 0
+        self.errors = []
+        self.started = time.monotonic()
+        self.elapsed = 0.0
+
+    def add_error(self, lineno, message):
+        self.invalid += 1
+        if len(self.errors) < MAX_REPORTED_ERRORS:
+            self.errors.append((lineno, message))
+
+    @property
+    def rows_per_second(self) -> float:
+        return self.read / self.elapsed if self.elapsed > 0 else 0.0
+
+    def summary(self) -> str:
+        return (
+            f"{self.read} linhas lidas, {self.imported} importadas, {self.invalid} inválidas "
+            f"em {self.elapsed:.2f}s ({self.rows_per_second:.0f} linhas/s)"
+        )
+
+
+def _canonical(record: dict) -> dict:
+    row = {}
+    for key, value in record.items():
+        if key is None:
+            continue
+        name = str(key).strip().lower()
+        name = _ALIASES.get(name, name)
+        if name in IMPORT_FIELDS:
+            row[name] = "" if value is None else str(value).strip()
+    return row
+
+
+def _validate(row: dict, profiles: dict):
+    """Retorna (kwargs de DeviceConfig, None) ou (None, mensagem de erro)."""
+    mac = _normalize_mac(row.get("mac_address"))
+    identifier = row.get("identifier") or ""
+    if not mac:
+        return None, "mac_address ausente ou inválido"
+    if len(mac) > 32:
+        return None, "mac_address longo demais"
+    if not identifier:
+        return None, "identifier ausente"
+    values = {"mac_address": mac}
+    for name, limit in (("identifier", 255), ("display_name", 100), ("user_register", 128), ("passwd_register", 128)):
+        if name in row:
+            if len(row[name]) > limit:
+                return None, f"{name} excede {limit} caracteres"
+            values[name] = row[name]
+    for name in IP_FIELDS:
+        if name in row:
+            if row[name]:
+                try:
+                    values[name] = str(ipaddress.ip_address(row[name]))
+                except ValueError:
+                    return None, f"{name} inválido: {row[name]!r}"
+            else:
+                values[name] = None
+    if "profile" in row:
+        name = row["profile"]
+        if name and name not in profiles:
+            return None, f"perfil inexistente: {name!r}"
+        values["profile_id"] = profiles.get(name) if name else None
+    return values, None
+
+
+def _load_profiles(names, profiles: dict) -> None:
+    missing = {n for n in names if n and n not in profiles}
+    if missing:
+        profiles.update(DeviceProfile.objects.filter(name__in=missing).values_list("name", "pk"))
+
+
+def _update_fields(values: dict) -> list:
+    """Campos que o upsert atualiza em um dispositivo existente: só as colunas presentes na linha."""
+    fields = [f for f in TEXT_FIELDS + IP_FIELDS if f in values]
+    if "profile_id" in values:
+        fields.append("profile")
+    return fields + ["updated_at"]
+
+
+def _import_chunk(chunk, profiles: dict, stats: ImportStats, dry_run: bool) -> None:
+    _load_profiles({_canonical(r).get("profile") for _, r in chunk}, profiles)
+
+    by_mac = {}
+    for lineno, record in chunk:
+        if "__error__" in record:
+            stats.add_error(lineno, record["__error__"])
+            continue
+        values, error = _validate(_canonical(record), profiles)
+        if error:
+            stats.add_error(lineno, error)
+            continue
+        # MAC repetido no mesmo lote: a última linha vence (um upsert não pode tocar a mesma linha duas vezes)
+        by_mac.pop(values["mac_address"], None)
+        by_mac[values["mac_address"]] = (lineno, values)
+
+    # identifier repetido no lote ou já usado por outro MAC no banco
+    seen_identifiers = {}
+    for mac, (lineno, values) in list(by_mac.items()):
+        if values["identifier"] in seen_identifiers:
+            stats.add_error(lineno, f"identifier {values['identifier']!r} repetido no arquivo")
+            del by_mac[mac]
+            continue
+        seen_identifiers[values["identifier"]] = mac
+    taken = []
+    if by_mac:
+        taken = DeviceConfig.objects.filter(identifier__in=list(seen_identifiers)).exclude(
+            mac_address__in=list(by_mac)).values_list("identifier", flat=True)
+    for identifier in taken:
+        lineno, _ = by_mac.pop(seen_identifiers[identifier])
+        stats.add_error(lineno, f"identifier {identifier!r} já pertence a outro dispositivo")
+
+    if dry_run:
+        stats.imported += len(by_mac)
+        return
+    if not by_mac:
+        return
+
+    # um upsert por conjunto de colunas: uma coluna ausente na linha nunca sobrescreve o valor existente
+    groups = {}
+    for _, values in by_mac.values():
+        fields = tuple(_update_fields(values))
+        groups.setdefault(fields, []).append(DeviceConfig(**values))
+    objs = [obj for group in groups.values() for obj in group]
+    # MySQL (ON DUPLICATE KEY UPDATE) não aceita unique_fields; SQLite/PostgreSQL exigem
+    unique_fields = ["mac_address"] if connection.features.supports_update_conflicts_with_target else None
+    try:
+        with transaction.atomic():
+            for fields, group in groups.items():
+                DeviceConfig.objects.bulk_create(
+                    group,
+                    update_conflicts=True,
+                    unique_fields=unique_fields,
+                    update_fields=list(fields),
+                )
+    except IntegrityError as exc:
+        logger.warning("Device import chunk failed: %s", exc)
+        for lineno, _ in by_mac.values():
+            stats.add_error(lineno, f"falha ao gravar o lote: {exc}")
+        return
+    stats.imported += len(objs)
+    _invalidate_caches(objs)
+
+
+def _invalidate_caches(objs) -> None:
+    # bulk_create não dispara post_save: atualizar os caches do download-xml deste worker
+    from api.utils import device_cache, known_devices
+
+    device_cache.invalidate_devices(
+        mac_addresses=[o.mac_address for o in objs],
+        identifiers=[o.identifier for o in objs],
+    )
+    for o in objs:
+        known_devices.note_device(o.mac_address, o.identifier)
+    # demais gravações do lote (e outros workers) entram no próximo refresh, que começa já
+    known_devices.expire()
+
+
+def import_devices(records, chunk_size: int = DEFAULT_CHUNK_SIZE, dry_run: bool = False,
+                   default_profile: str = None, progress=None) -> ImportStats:
+    """
+    Importa dispositivos de um iterável de (número da linha, dict), ver iter_records().
+    default_profile: nome do perfil usado quando a linha não tem a coluna 'profile'.
+    progress: callback opcional chamado com ImportStats após cada lote.
+    """
+    chunk_size = max(1, int(chunk_size))
+    stats = ImportStats()
+    profiles = {}
+    records = iter(records)
+
+    while True:
+        chunk = list(islice(records, chunk_size))
+        if not chunk:
+            break
+        if default_profile:
+            chunk = [(n, r if "profile" in r else dict(r, profile=default_profile)) for n, r in chunk]
+        stats.read += len(chunk)
+        stats.chunks += 1
+        _import_chunk(chunk, profiles, stats, dry_run)
+        stats.elapsed = time.monotonic() - stats.started
+        if progress is not None:
+            progress(stats)
+
+    stats.elapsed = time.monotonic() - stats.started
+    logger.info("Device import finished: %s", stats.summary())
+    return stats
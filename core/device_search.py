@@ -0,0 +1,128 @@
+"""
+Busca de dispositivos para a DeviceListView que usa só índices, mesmo com milhões de linhas.
+
+Cada critério é uma consulta separada sobre o seu índice, limitada a MAX_MATCHES pks:
+  - MAC em qualquer formato (aa:bb:cc, AA-BB-CC, aabb.cc..) -> prefixo do MAC normalizado
+    (índice de mac_address);
+  - identifier -> prefixo (índice unique de identifier);
+Os prefixos usam o lookup que o índice B-tree atende em cada banco (prefix_filter): no MySQL,
+LIKE sem BINARY (istartswith) sobre a collation *_ci; nos demais, startswith, já que
+UPPER(col) LIKE UPPER(...) do istartswith não usa o índice (no PostgreSQL o Django cria o
+índice varchar_pattern_ops "_like" para campos unique). O MAC é guardado normalizado em
+minúsculas; a busca por identifier diferencia maiúsculas fora do MySQL.
+  - display_name -> índice FULLTEXT no MySQL (migração 0002), MATCH ... AGAINST em modo
+    booleano com prefixo por palavra; nos demais bancos (dev/testes) cai em icontains.
+Os pks encontrados são unidos em Python e a listagem filtra por pk__in: o COUNT(*) da
+paginação fica limitado a MAX_MATCHES linhas. Sem busca, EstimatedCountPaginator usa a
+estimativa de linhas do catálogo do banco em vez de COUNT(*) na tabela inteira.
+"""
+
+import re
+
+from django.core.paginator import Paginator
+from django.db import connection
+from django.db.models import BooleanField, Q
+from django.db.models.expressions import RawSQL
+from django.utils.functional import cached_property
+
+from .models import DeviceConfig, _normalize_mac
+
+MAX_MATCHES = 1000
+# abaixo disso o COUNT(*) exato é barato e evita estimativas defasadas em tabelas pequenas
+EXACT_COUNT_BELOW = 100000
+# innodb_ft_min_token_size padrão: palavras menores não estão no índice FULLTEXT
+FULLTEXT_MIN_TOKEN = 3
+
+_MAC_INPUT = re.compile(r"^[0-9a-fA-F:.\- ]+$")
+_FULLTEXT_OPERATORS = re.compile(r'[+\-<>()~*"@]+')
+
+
+def looks_like_mac(q: str) -> bool:
+    """True se q pode ser (o início de) um MAC: só hex e separadores, com ao menos 4 dígitos."""
+    return bool(_MAC_INPUT.match(q)) and len(_normalize_mac(q)) >= 4
+
+
+def fulltext_terms(q: str) -> str:
+    """Expressão do MATCH ... AGAINST em modo booleano: todas as palavras, cada uma como prefixo."""
+    words = _FULLTEXT_OPERATORS.sub(" ", q).split()
+    return " ".join(f"+{w}*" for w in words if len(w) >= FULLTEXT_MIN_TOKEN)
+
+
+def _display_name_filter(q: str):
+    if connection.vendor != "mysql":
+        return Q(display_name__icontains=q)
+    terms = fulltext_terms(q)
+    if not terms:
+        return None
+    table = connection.ops.quote_name(DeviceConfig._meta.db_table)
+    return RawSQL(f"MATCH ({table}.`display_name`) AGAINST (%s IN BOOLEAN MODE)", [terms],
+                  output_field=BooleanField())
+
+
+def prefix_filter(field: str, value: str) -> Q:
+    """Filtro "field começa com value" atendido pelo índice do campo (ver o docstring do módulo)."""
+    lookup = "istartswith" if connection.vendor == "mysql" else "startswith"
+    return Q(**{f"{field}__{lookup}": value})
+
+
+def search_device_ids(q: str, limit: int = MAX_MATCHES):
+    """(pks em ordem crescente, truncado?) dos dispositivos que casam com q."""
+    q = (q or "").strip()
+    if not q:
+        return [], False
+    criteria = []
+    if looks_like_mac(q):
+        criteria.append(prefix_filter("mac_address", _normalize_mac(q)))
+    criteria.append(prefix_filter("identifier", q))
+    display = _display_name_filter(q)
+    if display is not None:
+        criteria.append(display)
+
+    found = set()
+    truncated = False
+    for condition in criteria:
+        # sem ORDER BY: o LIMIT para na primeira página do range do índice
+        pks = list(DeviceConfig.objects.filter(condition).order_by().values_list("pk", flat=True)[:limit + 1])
+        if len(pks) > limit:
+            truncated = True
+            pks = pks[:limit]
+        found.update(pks)
+    ids = sorted(found)
+    if len(ids) > limit:
+        truncated = True
+        ids = ids[:limit]
+    return ids, truncated
+
+
+def estimated_row_count(model):
+    """Número aproximado de linhas da tabela segundo o catálogo do banco, ou None se indisponível."""
+    table = model._meta.db_table
+    if connection.vendor == "mysql":
+        sql = "SELECT TABLE_ROWS FROM information_schema.TABLES WHERE TABLE_SCHEMA = DATABASE() AND TABLE_NAME = %s"
+    elif connection.vendor == "postgresql":
+        sql = "SELECT reltuples::bigint FROM pg_class WHERE oid = to_regclass(%s)"
+    else:
+        return None
+    with connection.cursor() as cursor:
+        cursor.execute(sql, [table])
+        row = cursor.fetchone()
+    return int(row[0]) if row and row[0] is not None and row[0] >= 0 else None
+
+
+class EstimatedCountPaginator(Paginator):
+    """
+    Paginator que, para um queryset sem filtro, usa estimated_row_count() no lugar de
+    COUNT(*) (tabelas grandes). count_is_estimate indica se o total é aproximado.
+    """
+
+    count_is_estimate = False
+
+    @cached_property
+    def count(self):
+        qs = self.object_list
+        if hasattr(qs, "query") and not qs.query.where:
+            estimate = estimated_row_count(qs.model)
+            if estimate is not None and estimate >= EXACT_COUNT_BELOW:
+                self.count_is_estimate = True
+                return estimate
+        return super().count
@@ -0,0 +1,51 @@
+from django.core.management.base import BaseCommand, CommandError
+from pymongo import UpdateOne
+
+from api.utils.mongo import get_mongo_client
+from api.utils.templates import ensure_template_indexes, get_templates_collection, template_keys
+
+
+class Command(BaseCommand):
+    help = (
+        "Preenche as chaves normalizadas (model_lc, extension) nos documentos de device_templates "
+        "e cria os índices usados pela busca de templates do download-xml e pela listagem de templates."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--batch-size", type=int, default=500, help="Documentos por bulk_write.")
+        parser.add_argument("--dry-run", action="store_true", help="Apenas conta os documentos que seriam alterados.")
+        parser.add_argument("--skip-indexes", action="store_true", help="Não criar/verificar índices.")
+
+    def handle(self, *args, **options):
+        batch_size = max(1, options["batch_size"])
+        dry_run = options["dry_run"]
+
+        try:
+            coll = get_templates_collection(get_mongo_client())
+        except Exception as exc:
+            raise CommandError(f"Falha ao conectar ao MongoDB: {exc}")
+
+        projection = {"model": 1, "extension": 1, "file_type": 1, "filename": 1, "model_lc": 1}
+        ops = []
+        scanned = changed = 0
+        for doc in coll.find({}, projection=projection):
+            scanned += 1
+            keys = template_keys(doc)
+            if all(doc.get(k) == v for k, v in keys.items()):
+                continue
+            changed += 1
+            if dry_run:
+                continue
+            ops.append(UpdateOne({"_id": doc["_id"]}, {"$set": keys}))
+            if len(ops) >= batch_size:
+                coll.bulk_write(ops, ordered=False)
+                ops = []
+        if ops:
+            coll.bulk_write(ops, ordered=False)
+
+        verb = "seriam atualizados" if dry_run else "atualizados"
+        self.stdout.write(f"{scanned} templates verificados, {changed} {verb}.")
+
+        if not options["skip_indexes"] and not dry_run:
+            names = ensure_template_indexes(coll)
+            self.stdout.write(self.style.SUCCESS(f"Índices prontos: {', '.join(names)}"))
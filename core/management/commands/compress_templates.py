@@ -0,0 +1,56 @@
+from django.core.management.base import BaseCommand, CommandError
+from pymongo import UpdateOne
+
+from api.utils.mongo import get_mongo_client
+from api.utils.templates import LEGACY_BODY_FIELDS, encode_template_body, get_templates_collection
+
+
+class Command(BaseCommand):
+    help = (
+        "Converte documentos de device_templates do formato antigo (texto em 'template' e 'content') "
+        "para uma única cópia comprimida em 'body' com content_hash."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--batch-size", type=int, default=200, help="Documentos por bulk_write.")
+        parser.add_argument("--dry-run", action="store_true", help="Apenas conta os documentos e o espaço economizado.")
+
+    def handle(self, *args, **options):
+        batch_size = max(1, options["batch_size"])
+        dry_run = options["dry_run"]
+
+        try:
+            coll = get_templates_collection(get_mongo_client())
+        except Exception as exc:
+            raise CommandError(f"Falha ao conectar ao MongoDB: {exc}")
+
+        legacy = {"body": {"$exists": False}, "$or": [{f: {"$exists": True}} for f in LEGACY_BODY_FIELDS]}
+        projection = {f: 1 for f in LEGACY_BODY_FIELDS}
+        ops = []
+        converted = skipped = before = after = 0
+        for doc in coll.find(legacy, projection=projection):
+            text = doc.get("template") or doc.get("content")
+            if not isinstance(text, str):
+                skipped += 1
+                continue
+            fields = encode_template_body(text)
+            converted += 1
+            before += sum(len(doc[f].encode("utf-8")) for f in LEGACY_BODY_FIELDS if isinstance(doc.get(f), str))
+            after += len(fields["body"])
+            if dry_run:
+                continue
+            ops.append(UpdateOne(
+                # só converte se o documento não mudou desde a leitura
+                {"_id": doc["_id"], "body": {"$exists": False}},
+                {"$set": fields, "$unset": {f: "" for f in LEGACY_BODY_FIELDS}},
+            ))
+            if len(ops) >= batch_size:
+                coll.bulk_write(ops, ordered=False)
+                ops = []
+        if ops:
+            coll.bulk_write(ops, ordered=False)
+
+        verb = "seriam convertidos" if dry_run else "convertidos"
+        self.stdout.write(
+            f"{converted} templates {verb} ({before} -> {after} bytes de texto), {skipped} sem texto ignorados."
+        )
@@ -0,0 +1,61 @@
+import sys
+
+from django.core.management.base import BaseCommand, CommandError
+
+from core.device_import import (
+    DEFAULT_CHUNK_SIZE, FORMATS, detect_format, import_devices, iter_records, text_stream,
+)
+
+
+class Command(BaseCommand):
+    help = (
+        "Importa dispositivos (DeviceConfig) em massa a partir de CSV ou JSONL, em streaming e "
+        "em lotes (upsert por MAC normalizado)."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("path", help="Arquivo CSV/JSONL ('-' para ler da entrada padrão).")
+        parser.add_argument("--format", choices=FORMATS, help="Formato do arquivo (padrão: pela extensão, senão csv).")
+        parser.add_argument("--chunk-size", type=int, default=DEFAULT_CHUNK_SIZE, help="Linhas por lote/transação.")
+        parser.add_argument("--profile", help="Nome do perfil para linhas sem a coluna 'profile'.")
+        parser.add_argument("--encoding", default="utf-8-sig", help="Codificação do arquivo.")
+        parser.add_argument("--dry-run", action="store_true", help="Apenas valida; não grava nada.")
+
+    def handle(self, *args, **options):
+        path = options["path"]
+        fmt = options["format"] or detect_format(path)
+        verbosity = options["verbosity"]
+
+        def progress(stats):
+            if verbosity >= 2 or (verbosity >= 1 and stats.chunks % 10 == 0):
+                self.stdout.write(f"  {stats.summary()}")
+
+        try:
+            binary = sys.stdin.buffer if path == "-" else open(path, "rb")
+        except OSError as exc:
+            raise CommandError(f"Não foi possível abrir {path}: {exc}")
+        try:
+            stream = text_stream(binary, encoding=options["encoding"])
+            stats = import_devices(
+                iter_records(stream, fmt),
+                chunk_size=options["chunk_size"],
+                dry_run=options["dry_run"],
+                default_profile=options["profile"],
+                progress=progress,
+            )
+        except UnicodeDecodeError as exc:
+            raise CommandError(f"Falha ao decodificar o arquivo ({options['encoding']}): {exc}")
+        finally:
+            if binary is not sys.stdin.buffer:
+                binary.close()
+
+        for lineno, message in stats.errors:
+            self.stderr.write(f"linha {lineno}: {message}")
+        if stats.invalid > len(stats.errors):
+            self.stderr.write(f"... e mais {stats.invalid - len(stats.errors)} linhas inválidas")
+
+        summary = stats.summary()
+        if options["dry_run"]:
+            summary = "[dry-run] " + summary.replace("importadas", "válidas")
+        style = self.style.SUCCESS if not stats.invalid else self.style.WARNING
+        self.stdout.write(style(summary))
@@ -0,0 +1,56 @@
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+
+from core import retention
+
+
+class Command(BaseCommand):
+    help = (
+        "Aplica a retenção de Provisioning: arquiva as linhas mais antigas que PROVISION_RETENTION['DAYS'] "
+        "em JSONL comprimido e as apaga em lotes por faixa de pk. Uma execução interrompida é retomada."
+    )
+
+    def add_arguments(self, parser):
+        conf = getattr(settings, "PROVISION_RETENTION", None) or {}
+        parser.add_argument("--days", type=int, default=conf.get("DAYS", 0),
+                            help="Manter os últimos N dias (padrão: PROVISION_RETENTION['DAYS']).")
+        parser.add_argument("--archive-dir", default=conf.get("ARCHIVE_DIR"), help="Diretório (persistente) dos arquivos .jsonl.gz.")
+        parser.add_argument("--no-archive", action="store_true", help="Apagar sem arquivar.")
+        parser.add_argument("--chunk-size", type=int, default=conf.get("CHUNK_SIZE") or retention.DEFAULT_CHUNK_SIZE,
+                            help="Linhas por lote (um DELETE por lote).")
+        parser.add_argument("--sleep", type=float, default=conf.get("SLEEP") or 0.0, help="Pausa entre lotes, em segundos.")
+        parser.add_argument("--max-chunks", type=int, help="Parar após N lotes (a próxima execução continua).")
+        parser.add_argument("--dry-run", action="store_true", help="Apenas conta as linhas que seriam removidas.")
+
+    def handle(self, *args, **options):
+        days = options["days"]
+        if not days or days < 1:
+            raise CommandError("Retenção desativada (PROVISION_RETENTION['DAYS'] = 0); informe --days N.")
+        cutoff = retention.cutoff_for(days)
+        if options["dry_run"]:
+            count = retention.count_expired(cutoff)
+            self.stdout.write(f"{count} linhas anteriores a {cutoff.isoformat()} seriam removidas.")
+            return
+
+        archive_dir = None if options["no_archive"] else options["archive_dir"]
+        if not options["no_archive"] and not archive_dir:
+            raise CommandError(
+                "Informe --archive-dir (ou PROVISION_RETENTION_ARCHIVE_DIR, um volume persistente) ou use --no-archive."
+            )
+
+        verbosity = options["verbosity"]
+
+        def progress(stats):
+            if verbosity >= 2 or (verbosity >= 1 and stats.chunks % 50 == 0):
+                self.stdout.write(f"  {stats.summary()}")
+
+        try:
+            stats = retention.prune(
+                cutoff, archive_dir=archive_dir, chunk_size=options["chunk_size"], sleep=options["sleep"],
+                max_chunks=options["max_chunks"], progress=progress,
+            )
+        except OSError as exc:
+            raise CommandError(f"Falha ao gravar o arquivo em {archive_dir}: {exc}")
+        if stats.resumed:
+            self.stdout.write("Execução anterior retomada.")
+        self.stdout.write(self.style.SUCCESS(f"Corte {cutoff.isoformat()}: {stats.summary()}."))
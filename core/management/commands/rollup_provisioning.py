@@ -0,0 +1,49 @@
+from datetime import timedelta
+
+from django.core.management.base import BaseCommand, CommandError
+
+from core import rollups
+
+
+class Command(BaseCommand):
+    help = (
+        "Recalcula os rollups horários/diários de Provisioning (ProvisioningHourly/ProvisioningDaily) "
+        "das últimas horas fechadas, ou de um intervalo para backfill."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--hours", type=int, default=2, help="Horas fechadas a recalcular (padrão: 2).")
+        parser.add_argument("--since", help="Início do intervalo (ISO 8601, UTC se sem fuso); substitui --hours.")
+        parser.add_argument("--until", help="Fim do intervalo (padrão: início da hora corrente).")
+        parser.add_argument("--chunk-days", type=int, default=1, help="Dias por transação no backfill.")
+
+    def _parse(self, value, name):
+        try:
+            return rollups.parse_when(value, f"--{name}")
+        except ValueError as exc:
+            raise CommandError(str(exc))
+
+    def handle(self, *args, **options):
+        until = self._parse(options["until"], "until") if options["until"] else rollups.closed_until()
+        if options["since"]:
+            since = self._parse(options["since"], "since")
+        else:
+            since = rollups.closed_until() - timedelta(hours=max(1, options["hours"]))
+        if since >= until:
+            raise CommandError("--since deve ser anterior a --until")
+
+        step = timedelta(days=max(1, options["chunk_days"]))
+        hours = days = 0
+        start = since
+        while start < until:
+            end = min(start + step, until)
+            done = rollups.rebuild(start, end)
+            hours += done["hours"]
+            days += done["days"]
+            if options["verbosity"] >= 2:
+                self.stdout.write(f"  {start.isoformat()} .. {end.isoformat()}: {done['hours']} horas")
+            start = end
+        self.stdout.write(self.style.SUCCESS(
+            f"Rollups recalculados de {since.isoformat()} a {until.isoformat()}: "
+            f"{hours} buckets horários, {days} diários."
+        ))
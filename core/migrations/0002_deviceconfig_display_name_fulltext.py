@@ -0,0 +1,31 @@
+from django.db import migrations
+
+INDEX_NAME = "core_devcfg_display_name_ft"
+
+
+def create_fulltext_index(apps, schema_editor):
+    # FULLTEXT só no MySQL (produção); core.device_search usa icontains nos demais bancos
+    if schema_editor.connection.vendor != "mysql":
+        return
+    table = apps.get_model("core", "DeviceConfig")._meta.db_table
+    qn = schema_editor.quote_name
+    schema_editor.execute(f"CREATE FULLTEXT INDEX {qn(INDEX_NAME)} ON {qn(table)} ({qn('display_name')})")
+
+
+def drop_fulltext_index(apps, schema_editor):
+    if schema_editor.connection.vendor != "mysql":
+        return
+    table = apps.get_model("core", "DeviceConfig")._meta.db_table
+    qn = schema_editor.quote_name
+    schema_editor.execute(f"DROP INDEX {qn(INDEX_NAME)} ON {qn(table)}")
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("core", "0001_initial"),
+    ]
+
+    operations = [
+        migrations.RunPython(create_fulltext_index, drop_fulltext_index),
+    ]
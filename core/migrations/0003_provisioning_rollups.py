@@ -0,0 +1,51 @@
+# Generated by Django 5.2.7 on 2026-10-18 01:57
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0002_deviceconfig_display_name_fulltext'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ProvisioningDaily',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('bucket', models.DateTimeField(verbose_name='bucket')),
+                ('vendor', models.CharField(blank=True, max_length=50, verbose_name='vendor')),
+                ('model', models.CharField(blank=True, max_length=50, verbose_name='model')),
+                ('version', models.CharField(blank=True, max_length=50, verbose_name='version')),
+                ('status', models.CharField(choices=[('ok', 'OK'), ('forbidden', 'Forbidden'), ('error', 'Error')], max_length=20, verbose_name='status')),
+                ('profile_pk', models.BigIntegerField(default=0, verbose_name='profile pk')),
+                ('count', models.BigIntegerField(default=0, verbose_name='count')),
+            ],
+            options={
+                'verbose_name': 'Provisioning daily rollup',
+                'verbose_name_plural': 'Provisioning daily rollups',
+                'ordering': ['-bucket'],
+                'constraints': [models.UniqueConstraint(fields=('bucket', 'vendor', 'model', 'version', 'status', 'profile_pk'), name='core_provisioning_daily_key')],
+            },
+        ),
+        migrations.CreateModel(
+            name='ProvisioningHourly',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('bucket', models.DateTimeField(verbose_name='bucket')),
+                ('vendor', models.CharField(blank=True, max_length=50, verbose_name='vendor')),
+                ('model', models.CharField(blank=True, max_length=50, verbose_name='model')),
+                ('version', models.CharField(blank=True, max_length=50, verbose_name='version')),
+                ('status', models.CharField(choices=[('ok', 'OK'), ('forbidden', 'Forbidden'), ('error', 'Error')], max_length=20, verbose_name='status')),
+                ('profile_pk', models.BigIntegerField(default=0, verbose_name='profile pk')),
+                ('count', models.BigIntegerField(default=0, verbose_name='count')),
+            ],
+            options={
+                'verbose_name': 'Provisioning hourly rollup',
+                'verbose_name_plural': 'Provisioning hourly rollups',
+                'ordering': ['-bucket'],
+                'constraints': [models.UniqueConstraint(fields=('bucket', 'vendor', 'model', 'version', 'status', 'profile_pk'), name='core_provisioning_hourly_key')],
+            },
+        ),
+    ]
@@ -0,0 +1,17 @@
+# Generated by Django 5.2.7 on 2026-10-18 02:39
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0003_provisioning_rollups'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='deviceconfig',
+            index=models.Index(fields=['updated_at'], name='core_devcfg_updated_at'),
+        ),
+    ]
@@ -124,6 +124,10 @@ class DeviceConfig(models.Model):
         ordering = ("identifier",)
         verbose_name = "Device config"
         verbose_name_plural = "Device configs"
+        indexes = [
+            # refresh incremental e verificação de mudanças do api.utils.known_devices
+            models.Index(fields=["updated_at"], name="core_devcfg_updated_at"),
+        ]
 
     def __str__(self) -> str:
         return self.identifier or self.mac_address or "<unnamed device>"
@@ -232,4 +236,53 @@ class Provisioning(models.Model):
 
     def __str__(self):
         when = self.created_at.isoformat() if self.created_at else "unknown"
-        return f"{self.mac_address or self.identifier} @ {when}"
\ No newline at end of file
+        return f"{self.mac_address or self.identifier} @ {when}"
+
+
+class ProvisioningRollup(models.Model):
+    """
+    Contagem de eventos de Provisioning por período (bucket, em UTC) e chave
+    vendor/model/version/status/perfil. Mantida por core.rollups: incrementalmente a cada lote
+    gravado por api.utils.events e/ou recalculada em lotes (`manage.py rollup_provisioning`).
+    Relatórios leem só daqui, sem varrer Provisioning.
+    """
+    bucket = models.DateTimeField("bucket")
+    vendor = models.CharField("vendor", max_length=50, blank=True)
+    model = models.CharField("model", max_length=50, blank=True)
+    version = models.CharField("version", max_length=50, blank=True)
+    status = models.CharField("status", max_length=20, choices=Provisioning.STATUS_CHOICES)
+    # pk do DeviceProfile do device (0 = sem device/perfil); sem FK para a chave única não ter NULL
+    profile_pk = models.BigIntegerField("profile pk", default=0)
+    count = models.BigIntegerField("count", default=0)
+
+    class Meta:
+        abstract = True
+
+    def __str__(self):
+        return f"{self.bucket.isoformat()} {self.vendor} {self.model} {self.status}: {self.count}"
+
+
+class ProvisioningHourly(ProvisioningRollup):
+    class Meta:
+        verbose_name = "Provisioning hourly rollup"
+        verbose_name_plural = "Provisioning hourly rollups"
+        ordering = ["-bucket"]
+        constraints = [
+            models.UniqueConstraint(
+                fields=["bucket", "vendor", "model", "version", "status", "profile_pk"],
+                name="core_provisioning_hourly_key",
+            ),
+        ]
+
+
+class ProvisioningDaily(ProvisioningRollup):
+    class Meta:
+        verbose_name = "Provisioning daily rollup"
+        verbose_name_plural = "Provisioning daily rollups"
+        ordering = ["-bucket"]
+        constraints = [
+            models.UniqueConstraint(
+                fields=["bucket", "vendor", "model", "version", "status", "profile_pk"],
+                name="core_provisioning_daily_key",
+            ),
+        ]
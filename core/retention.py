@@ -0,0 +1,202 @@
+"""
+Retenção de core.models.Provisioning: arquivamento em JSONL comprimido e remoção em lotes.
+
+Usado pelo comando `manage.py prune_provisioning`. Linhas com created_at anterior ao corte
+(agora - PROVISION_RETENTION['DAYS'], truncado para a meia-noite UTC) são percorridas em ordem
+de pk, `chunk_size` por vez:
+  1. o lote é anexado ao arquivo de `archive_dir` como um membro gzip próprio (o arquivo
+     continua um .jsonl.gz válido: `zcat` lê todos os membros em sequência) e sincronizado;
+  2. o estado da execução (arquivo .state.json ao lado) registra o pk até onde foi arquivado;
+  3. o lote é apagado por faixa de pk (pk entre o primeiro e o último do lote e created_at
+     anterior ao corte): DELETE curto, sem varrer a tabela nem segurar locks por muito tempo;
+  4. o estado registra o pk até onde foi apagado.
+O estado é um por diretório de arquivo, não por corte: uma execução interrompida é retomada ao
+rodar o comando de novo, mesmo que o corte já seja outro (outro dia UTC). O arquivo é truncado
+para o último membro completo e a faixa arquivada mas ainda não apagada é apagada (com o corte
+em que foi arquivada) antes de continuar, então nenhuma linha é perdida nem arquivada duas vezes.
+
+archive_dir precisa ser persistente (volume montado, p.ex. um bucket via Cloud Storage FUSE no
+Cloud Run): o disco do contêiner some com a instância e o arquivo some junto com as linhas.
+
+Os rollups (core.rollups) não dependem das linhas brutas e continuam valendo após a remoção.
+"""
+
+from datetime import datetime, timedelta, timezone as dt_timezone
+import gzip
+import json
+import logging
+import os
+import time
+
+from django.core.serializers.json import DjangoJSONEncoder
+from django.utils import timezone
+
+from .models import Provisioning
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_CHUNK_SIZE = 1000
+
+
+def cutoff_for(days: int, now: datetime = None) -> datetime:
+    """Corte da retenção de `days` dias: meia-noite UTC (execuções no mesmo dia usam o mesmo arquivo)."""
+    when = (now or timezone.now()).astimezone(dt_timezone.utc) - timedelta(days=days)
+    return when.replace(hour=0, minute=0, second=0, microsecond=0)
+
+
+class PruneStats:
+    """Contadores da execução (acumulados lote a lote)."""
+
+    def __init__(self):
+        self.archived = 0
+        self.deleted = 0
+        self.chunks = 0
+        self.resumed = False
+        self.started = time.monotonic()
+        self.elapsed = 0.0
+
+    def summary(self) -> str:
+        return (
+            f"{self.archived} linhas arquivadas, {self.deleted} removidas em {self.chunks} lotes "
+            f"em {self.elapsed:.2f}s"
+        )
+
+
+class ArchiveRun:
+    """
+    Estado (provisioning.state.json) de um diretório de arquivo e o .jsonl.gz da execução corrente.
+
+    O estado é um só por diretório e registra, além do corte, até que pk o arquivo vigente foi
+    arquivado e apagado. Assim uma execução retomada com outro corte (em outro dia UTC) primeiro
+    termina de apagar a faixa já arquivada (pending) e só então abre o arquivo do novo corte.
+    """
+
+    STATE_FILE = "provisioning.state.json"
+
+    def __init__(self, archive_dir: str):
+        os.makedirs(archive_dir, exist_ok=True)
+        self.archive_dir = archive_dir
+        self.state_path = os.path.join(archive_dir, self.STATE_FILE)
+        self.state = None
+        self.resumed = False
+        if os.path.exists(self.state_path):
+            with open(self.state_path, "r", encoding="utf-8") as fh:
+                self.state = json.load(fh)
+            self._truncate_partial_member()
+
+    @property
+    def path(self) -> str:
+        return os.path.join(self.archive_dir, self.state["archive"])
+
+    @property
+    def pending(self):
+        """(primeiro pk, último pk, corte) arquivados e ainda não apagados, ou None."""
+        if self.state is None:
+            return None
+        archived, deleted = self.state["archived_through"], self.state["deleted_through"]
+        if archived <= deleted:
+            return None
+        return deleted + 1, archived, datetime.fromisoformat(self.state["cutoff"])
+
+    def begin(self, cutoff: datetime) -> None:
+        """Continua o arquivo do mesmo corte ou abre o de um novo corte (após resolver pending)."""
+        if self.state is not None and self.state["cutoff"] == cutoff.isoformat():
+            self.resumed = self.state["archived_through"] > 0
+            return
+        if self.pending is not None:
+            raise RuntimeError("archived rows of the previous cutoff must be deleted first")
+        archive = f"provisioning-before-{cutoff:%Y%m%d}.jsonl.gz"
+        path = os.path.join(self.archive_dir, archive)
+        self.state = {
+            "cutoff": cutoff.isoformat(), "archive": archive,
+            "archived_through": 0, "deleted_through": 0, "rows": 0,
+            "archive_bytes": os.path.getsize(path) if os.path.exists(path) else 0,
+        }
+        self.save()
+
+    def _truncate_partial_member(self) -> None:
+        # bytes além do último membro registrado vêm de uma escrita interrompida
+        size = self.state["archive_bytes"]
+        if os.path.exists(self.path) and os.path.getsize(self.path) > size:
+            with open(self.path, "r+b") as fh:
+                fh.truncate(size)
+
+    def save(self, **changes) -> None:
+        self.state.update(changes)
+        tmp = self.state_path + ".tmp"
+        with open(tmp, "w", encoding="utf-8") as fh:
+            json.dump(self.state, fh, indent=2, sort_keys=True)
+            fh.flush()
+            os.fsync(fh.fileno())
+        os.replace(tmp, self.state_path)
+
+    def append(self, rows: list) -> None:
+        payload = "".join(json.dumps(row, cls=DjangoJSONEncoder, sort_keys=True) + "\n" for row in rows)
+        with open(self.path, "ab") as fh:
+            fh.write(gzip.compress(payload.encode("utf-8")))
+            fh.flush()
+            os.fsync(fh.fileno())
+            size = fh.tell()
+        self.save(archived_through=rows[-1]["id"], archive_bytes=size, rows=self.state["rows"] + len(rows))
+
+
+def _delete_range(first_pk: int, last_pk: int, cutoff: datetime) -> int:
+    deleted, _ = Provisioning.objects.filter(
+        pk__gte=first_pk, pk__lte=last_pk, created_at__lt=cutoff,
+    ).delete()
+    return deleted
+
+
+def count_expired(cutoff: datetime) -> int:
+    return Provisioning.objects.filter(created_at__lt=cutoff).count()
+
+
+def prune(cutoff: datetime, archive_dir: str = None, chunk_size: int = DEFAULT_CHUNK_SIZE,
+          sleep: float = 0.0, max_chunks: int = None, progress=None) -> PruneStats:
+    """
+    Arquiva (se archive_dir) e apaga os Provisioning com created_at < cutoff, em lotes de
+    chunk_size por faixa de pk. sleep pausa entre lotes (réplicas, carga do banco); max_chunks
+    limita a execução (o restante fica para a próxima, que retoma de onde parou).
+    """
+    stats = PruneStats()
+    chunk_size = max(1, int(chunk_size))
+    fields = [f.attname for f in Provisioning._meta.concrete_fields]
+    run = ArchiveRun(archive_dir) if archive_dir else None
+    last_pk = 0
+    if run is not None:
+        pending = run.pending
+        if pending is not None:
+            # interrompido entre arquivar e apagar: o lote já está no arquivo (talvez de outro corte)
+            first, last, previous_cutoff = pending
+            stats.deleted += _delete_range(first, last, previous_cutoff)
+            run.save(deleted_through=last)
+        run.begin(cutoff)
+        stats.resumed = run.resumed or pending is not None
+        last_pk = run.state["deleted_through"]
+
+    while max_chunks is None or stats.chunks < max_chunks:
+        qs = Provisioning.objects.filter(pk__gt=last_pk, created_at__lt=cutoff).order_by("pk")
+        if run is not None:
+            rows = list(qs.values(*fields)[:chunk_size])
+            pks = [row["id"] for row in rows]
+        else:
+            pks = list(qs.values_list("pk", flat=True)[:chunk_size])
+        if not pks:
+            break
+        if run is not None:
+            run.append(rows)
+            stats.archived += len(rows)
+        stats.deleted += _delete_range(pks[0], pks[-1], cutoff)
+        last_pk = pks[-1]
+        if run is not None:
+            run.save(deleted_through=last_pk)
+        stats.chunks += 1
+        stats.elapsed = time.monotonic() - stats.started
+        if progress:
+            progress(stats)
+        if sleep:
+            time.sleep(sleep)
+
+    stats.elapsed = time.monotonic() - stats.started
+    logger.info("Provisioning retention before %s: %s", cutoff.isoformat(), stats.summary())
+    return stats
@@ -0,0 +1,207 @@
+"""
+Tabelas de rollup de Provisioning (ProvisioningHourly / ProvisioningDaily).
+
+Manutenção:
+  - incremental: api.utils.events chama apply_events() com cada lote recém-gravado; as
+    contagens do lote são agregadas em memória e somadas (UPDATE count = count + n, ou
+    INSERT quando a chave ainda não existe) em uma transação por lote;
+  - em lote: rebuild() recalcula as horas fechadas de um intervalo a partir de Provisioning
+    (GROUP BY por hora) e os dias tocados a partir dos horários. Serve para backfill, para corrigir
+    um lote que falhou e para instalações com PROVISION_ROLLUPS['INCREMENTAL'] = False, que rodam
+    `manage.py rollup_provisioning` periodicamente.
+
+Consultas (dashboard e API JSON) usam query(), que só lê as tabelas de rollup: o custo depende
+do número de buckets e chaves no intervalo, não do número de eventos brutos.
+"""
+
+from collections import Counter
+from datetime import datetime, timedelta, timezone as dt_timezone
+import logging
+
+from django.conf import settings
+from django.db import IntegrityError, transaction
+from django.db.models import Count, F, Sum, Value
+from django.db.models.functions import Coalesce, TruncHour
+from django.utils import timezone
+
+from .models import DeviceConfig, Provisioning, ProvisioningDaily, ProvisioningHourly
+
+logger = logging.getLogger(__name__)
+
+PERIOD_HOUR = "hour"
+PERIOD_DAY = "day"
+PERIODS = {PERIOD_HOUR: ProvisioningHourly, PERIOD_DAY: ProvisioningDaily}
+KEY_FIELDS = ("vendor", "model", "version", "status", "profile_pk")
+GROUP_FIELDS = ("bucket",) + KEY_FIELDS
+# intervalo dos relatórios quando since não é informado
+DEFAULT_SPAN = {PERIOD_HOUR: timedelta(hours=24), PERIOD_DAY: timedelta(days=30)}
+
+
+def incremental() -> bool:
+    """True se os lotes gravados por api.utils.events atualizam os rollups na hora."""
+    conf = getattr(settings, "PROVISION_ROLLUPS", None) or {}
+    return bool(conf.get("INCREMENTAL", True))
+
+
+def hour_bucket(when: datetime) -> datetime:
+    return when.astimezone(dt_timezone.utc).replace(minute=0, second=0, microsecond=0)
+
+
+def day_bucket(when: datetime) -> datetime:
+    return hour_bucket(when).replace(hour=0)
+
+
+def _bucket(period: str, when: datetime) -> datetime:
+    return day_bucket(when) if period == PERIOD_DAY else hour_bucket(when)
+
+
+def _increment(model, counts: Counter) -> None:
+    for key, n in counts.items():
+        lookup = dict(zip(GROUP_FIELDS, key))
+        if model.objects.filter(**lookup).update(count=F("count") + n):
+            continue
+        try:
+            with transaction.atomic():
+                model.objects.create(count=n, **lookup)
+        except IntegrityError:
+            # outro worker criou a chave entre o UPDATE e o INSERT
+            model.objects.filter(**lookup).update(count=F("count") + n)
+
+
+def apply_events(rows) -> int:
+    """
+    Soma aos rollups os Provisioning em rows (objetos já gravados, com created_at).
+    Uma query resolve o perfil dos devices do lote. Retorna o número de chaves atualizadas.
+    """
+    rows = [r for r in rows if r.created_at is not None]
+    if not rows:
+        return 0
+    device_ids = {r.device_id for r in rows if r.device_id}
+    profiles = dict(
+        DeviceConfig.objects.filter(pk__in=device_ids).values_list("pk", "profile_id")
+    ) if device_ids else {}
+
+    per_period = {period: Counter() for period in PERIODS}
+    for r in rows:
+        key = (r.vendor or "", r.model or "", r.version or "", r.status or "", profiles.get(r.device_id) or 0)
+        for period, counts in per_period.items():
+            counts[(_bucket(period, r.created_at),) + key] += 1
+
+    with transaction.atomic():
+        for period, counts in per_period.items():
+            _increment(PERIODS[period], counts)
+    return sum(len(c) for c in per_period.values())
+
+
+def closed_until(now: datetime = None) -> datetime:
+    """Início da hora corrente: rebuild() não mexe em buckets ainda abertos."""
+    return hour_bucket(now or timezone.now())
+
+
+def rebuild(since: datetime, until: datetime = None) -> dict:
+    """
+    Recalcula os rollups horários de [since, until) a partir de Provisioning (until é limitado
+    ao início da hora corrente) e, a partir dos horários, os diários de cada dia tocado pelo
+    intervalo. Retorna {"hours": buckets horários gravados, "days": buckets diários gravados}.
+    """
+    limit = closed_until()
+    until = min(hour_bucket(until), limit) if until else limit
+    since = hour_bucket(since)
+    if since >= until:
+        return {"hours": 0, "days": 0}
+
+    rows = (
+        Provisioning.objects.filter(created_at__gte=since, created_at__lt=until)
+        .annotate(bucket=TruncHour("created_at", tzinfo=dt_timezone.utc),
+                  profile_pk=Coalesce(F("device__profile_id"), Value(0)))
+        .values("bucket", "vendor", "model", "version", "status", "profile_pk")
+        .annotate(n=Count("id"))
+        .order_by()
+    )
+    hourly = [ProvisioningHourly(count=r.pop("n"), **r) for r in rows.iterator()]
+
+    # o dia inteiro é somado, inclusive horas fora do intervalo (e a hora aberta, se incremental)
+    day_since = day_bucket(since)
+    day_until = day_bucket(until - timedelta(microseconds=1)) + timedelta(days=1)
+
+    with transaction.atomic():
+        ProvisioningHourly.objects.filter(bucket__gte=since, bucket__lt=until).delete()
+        ProvisioningHourly.objects.bulk_create(hourly, batch_size=1000)
+        daily = Counter()
+        sums = (
+            ProvisioningHourly.objects.filter(bucket__gte=day_since, bucket__lt=day_until)
+            .values_list("bucket", *KEY_FIELDS).annotate(n=Sum("count")).order_by()
+        )
+        for bucket, *key, n in sums.iterator():
+            daily[(day_bucket(bucket),) + tuple(key)] += n
+        ProvisioningDaily.objects.filter(bucket__gte=day_since, bucket__lt=day_until).delete()
+        ProvisioningDaily.objects.bulk_create(
+            [ProvisioningDaily(count=n, **dict(zip(GROUP_FIELDS, k))) for k, n in daily.items()],
+            batch_size=1000,
+        )
+    logger.info("Provisioning rollups rebuilt for %s .. %s: %d hourly rows, %d daily rows",
+                since.isoformat(), until.isoformat(), len(hourly), len(daily))
+    return {"hours": len({h.bucket for h in hourly}), "days": len({k[0] for k in daily})}
+
+
+def query(period: str = PERIOD_HOUR, since: datetime = None, until: datetime = None,
+          filters: dict = None, group_by=("vendor", "model", "status"), limit: int = None) -> list:
+    """
+    Contagens do rollup de `period` em [since, until), filtradas por filters (campos de
+    KEY_FIELDS) e agrupadas por group_by (subconjunto de GROUP_FIELDS). Lista de dicts com
+    os campos de group_by e 'count', do maior para o menor (ou por bucket, se agrupado por
+    bucket), com no máximo limit linhas.
+    """
+    model = PERIODS.get(period)
+    if model is None:
+        raise ValueError(f"período inválido {period!r}; use um de {tuple(PERIODS)}")
+    group_by = [g for g in group_by if g in GROUP_FIELDS]
+    qs = model.objects.all()
+    if since is not None:
+        qs = qs.filter(bucket__gte=since)
+    if until is not None:
+        qs = qs.filter(bucket__lt=until)
+    for name, value in (filters or {}).items():
+        if name in KEY_FIELDS and value not in (None, ""):
+            qs = qs.filter(**{name: value})
+    if not group_by:
+        return [{"count": qs.aggregate(n=Coalesce(Sum("count"), Value(0)))["n"]}]
+    if "bucket" in group_by:
+        ordering = ["bucket"] + [g for g in group_by if g != "bucket"]
+    else:
+        ordering = ["-total"] + group_by
+    rows = qs.values(*group_by).annotate(total=Sum("count")).order_by(*ordering)
+    if limit is not None:
+        rows = rows[:limit]
+    return [dict({g: r[g] for g in group_by}, count=r["total"]) for r in rows]
+
+
+def parse_when(value: str, name: str) -> datetime:
+    """Data/hora ISO 8601; sem fuso é tratada como UTC."""
+    try:
+        parsed = datetime.fromisoformat(value)
+    except ValueError:
+        raise ValueError(f"{name} inválido: {value!r} (use ISO 8601)")
+    return parsed if timezone.is_aware(parsed) else parsed.replace(tzinfo=dt_timezone.utc)
+
+
+def report_params(params) -> dict:
+    """
+    Interpreta os parâmetros de relatório (request.GET) comuns ao dashboard e à API:
+    period (hour|day), since/until (ISO 8601; padrão: últimas 24 h ou 30 dias) e os filtros
+    vendor/model/version/status/profile. Retorna kwargs de query(); ValueError se inválidos.
+    """
+    period = params.get("period") or PERIOD_HOUR
+    if period not in PERIODS:
+        raise ValueError(f"período inválido {period!r}; use um de {tuple(PERIODS)}")
+    until = parse_when(params["until"], "until") if params.get("until") else None
+    since = parse_when(params["since"], "since") if params.get("since") else None
+    if since is None:
+        since = _bucket(period, (until or timezone.now()) - DEFAULT_SPAN[period])
+    filters = {name: params.get(name) for name in ("vendor", "model", "version", "status") if params.get(name)}
+    if params.get("profile"):
+        try:
+            filters["profile_pk"] = int(params["profile"])
+        except ValueError:
+            raise ValueError(f"profile inválido: {params['profile']!r}")
+    return {"period": period, "since": since, "until": until, "filters": filters}
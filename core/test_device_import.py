@@ -0,0 +1,110 @@
+import io
+import json
+
+import pytest
+from django.contrib.auth import get_user_model
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.core.management import call_command
+from django.test import Client
+
+from core.device_import import FORMAT_CSV, FORMAT_JSONL, import_devices, iter_records
+from core.models import DeviceProfile, DeviceConfig
+
+
+def _csv(lines):
+    return io.StringIO("\n".join(lines) + "\n")
+
+
+@pytest.mark.django_db
+def test_csv_import_upserts_by_normalized_mac_in_chunks():
+    DeviceProfile.objects.create(name="P1")
+    existing = DeviceConfig.objects.create(identifier="1001", mac_address="aabbcc000001", display_name="Antigo",
+                                           user_register="keep")
+    stream = _csv([
+        "identifier,mac_address,profile,display_name",
+        "1001,AA:BB:CC:00:00:01,P1,Recepção",
+        "1002,aa-bb-cc-00-00-02,P1,Sala 2",
+        "1003,aabb.cc00.0003,,Sala 3",
+        "1004,,P1,sem mac",
+        "1005,aabbcc000005,NOPE,perfil errado",
+        "1006,aabbcc000006,P1,10.0.0.1",
+    ])
+    stats = import_devices(iter_records(stream, FORMAT_CSV), chunk_size=2)
+
+    assert (stats.read, stats.imported, stats.invalid, stats.chunks) == (6, 4, 2, 3)
+    assert [lineno for lineno, _ in stats.errors] == [5, 6]
+    existing.refresh_from_db()
+    assert existing.display_name == "Recepção"
+    assert existing.user_register == "keep"  # coluna ausente no arquivo não é sobrescrita
+    assert existing.profile.name == "P1"
+    assert DeviceConfig.objects.get(mac_address="aabbcc000003").profile is None
+    assert DeviceConfig.objects.count() == 4
+
+
+@pytest.mark.django_db
+def test_jsonl_rows_with_different_columns_only_update_their_own():
+    DeviceProfile.objects.create(name="P1")
+    first = DeviceConfig.objects.create(identifier="3001", mac_address="aabbcc000201", passwd_register="s3cret",
+                                        display_name="Antigo")
+    second = DeviceConfig.objects.create(identifier="3002", mac_address="aabbcc000202", passwd_register="keep",
+                                         user_register="u2")
+    lines = [
+        json.dumps({"identifier": "3001", "mac": "aabbcc000201", "passwd_register": "novo"}),
+        json.dumps({"identifier": "3003", "mac": "aabbcc000203", "display_name": "Nova"}),
+        # lote seguinte: sem passwd_register, com colunas que o primeiro lote não tinha
+        json.dumps({"identifier": "3002", "mac": "aabbcc000202", "display_name": "Sala", "profile": "P1"}),
+        json.dumps({"identifier": "3001", "mac": "aabbcc000201", "user_register": "u1"}),
+    ]
+    stats = import_devices(iter_records(io.StringIO("\n".join(lines)), FORMAT_JSONL), chunk_size=2)
+
+    assert (stats.imported, stats.invalid) == (4, 0)
+    first.refresh_from_db()
+    second.refresh_from_db()
+    assert (first.passwd_register, first.display_name, first.user_register) == ("novo", "Antigo", "u1")
+    assert (second.passwd_register, second.user_register, second.display_name) == ("keep", "u2", "Sala")
+    assert second.profile.name == "P1"
+    assert DeviceConfig.objects.get(mac_address="aabbcc000203").display_name == "Nova"
+
+
+@pytest.mark.django_db
+def test_jsonl_import_rejects_bad_rows_and_identifier_taken_by_other_mac():
+    DeviceConfig.objects.create(identifier="2001", mac_address="aabbcc000101")
+    lines = [
+        json.dumps({"identifier": "2001", "mac": "aabbcc000102"}),
+        "{not json",
+        json.dumps({"identifier": "2003", "mac_address": "aabbcc000103", "public_ip": "999.1.1.1"}),
+        json.dumps({"identifier": "2004", "mac_address": "aabbcc000104", "public_ip": "200.1.2.3"}),
+    ]
+    stats = import_devices(iter_records(io.StringIO("\n".join(lines)), FORMAT_JSONL))
+
+    assert stats.imported == 1 and stats.invalid == 3
+    assert DeviceConfig.objects.get(identifier="2004").public_ip == "200.1.2.3"
+    assert not DeviceConfig.objects.filter(mac_address="aabbcc000102").exists()
+
+
+@pytest.mark.django_db
+def test_import_devices_command_dry_run(tmp_path):
+    path = tmp_path / "devices.csv"
+    path.write_text("identifier,mac_address\n3001,aa:bb:cc:00:02:01\n3002,aa:bb:cc:00:02:02\n")
+    out = io.StringIO()
+    call_command("import_devices", str(path), "--dry-run", stdout=out, stderr=io.StringIO())
+    assert "[dry-run] 2 linhas lidas, 2 válidas" in out.getvalue()
+    assert DeviceConfig.objects.count() == 0
+
+    call_command("import_devices", str(path), stdout=io.StringIO(), stderr=io.StringIO())
+    assert set(DeviceConfig.objects.values_list("mac_address", flat=True)) == {"aabbcc000201", "aabbcc000202"}
+
+
+@pytest.mark.django_db
+def test_device_import_view_requires_staff_and_imports():
+    DeviceProfile.objects.create(name="UP")
+    User = get_user_model()
+    client = Client()
+    client.force_login(User.objects.create_user(username="plain", password="x"))
+    assert client.get("/devices/import/").status_code == 302
+
+    client.force_login(User.objects.create_user(username="staff", password="x", is_staff=True))
+    upload = SimpleUploadedFile("devices.csv", b"identifier,mac_address\n4001,aabbcc000301\n", content_type="text/csv")
+    resp = client.post("/devices/import/", {"file": upload, "profile": "UP"})
+    assert resp.status_code == 200
+    assert DeviceConfig.objects.get(mac_address="aabbcc000301").profile.name == "UP"
@@ -0,0 +1,72 @@
+import pytest
+from django.contrib.auth import get_user_model
+from django.test import Client
+from django.test.utils import CaptureQueriesContext
+from django.db import connection
+
+from core import device_search
+from core.models import DeviceConfig
+
+
+@pytest.fixture
+def devices(db):
+    return [
+        DeviceConfig.objects.create(identifier="1001", mac_address="00156501aa01", display_name="Recepção"),
+        DeviceConfig.objects.create(identifier="1002", mac_address="00156501aa02", display_name="Sala de reunião"),
+        DeviceConfig.objects.create(identifier="2001", mac_address="805ec0000001", display_name="Portaria"),
+    ]
+
+
+def test_looks_like_mac_and_fulltext_terms():
+    assert device_search.looks_like_mac("00:15:65")
+    assert device_search.looks_like_mac("0015.6501")
+    assert not device_search.looks_like_mac("00")
+    assert not device_search.looks_like_mac("sala")
+    assert device_search.fulltext_terms('sala +de "reunião"') == "+sala* +reunião*"
+    assert device_search.fulltext_terms("a b") == ""
+
+
+@pytest.mark.django_db
+def test_search_by_mac_in_any_format(devices):
+    ids, truncated = device_search.search_device_ids("00-15-65-01-AA")
+    assert ids == [devices[0].pk, devices[1].pk]
+    assert not truncated
+    assert device_search.search_device_ids("0015.6501.aa02")[0] == [devices[1].pk]
+
+
+@pytest.mark.django_db
+def test_search_by_identifier_prefix_and_display_name(devices):
+    assert device_search.search_device_ids("100")[0] == [devices[0].pk, devices[1].pk]
+    # prefixo, não substring
+    assert device_search.search_device_ids("001")[0] == []
+    assert device_search.search_device_ids("reunião")[0] == [devices[1].pk]
+
+
+def test_prefix_filter_uses_the_lookup_the_index_serves(monkeypatch):
+    assert device_search.prefix_filter("identifier", "10").children == [("identifier__startswith", "10")]
+    monkeypatch.setattr(connection, "vendor", "mysql")
+    assert device_search.prefix_filter("identifier", "10").children == [("identifier__istartswith", "10")]
+
+
+@pytest.mark.django_db
+def test_search_is_capped(devices):
+    ids, truncated = device_search.search_device_ids("00156501", limit=1)
+    assert ids == [devices[0].pk]
+    assert truncated
+
+
+@pytest.mark.django_db
+def test_device_list_search_view(devices, monkeypatch):
+    client = Client()
+    client.force_login(get_user_model().objects.create_user(username="ops", password="x"))
+    resp = client.get("/devices/", {"q": "00:15:65:01"})
+    assert resp.status_code == 200
+    assert [d.pk for d in resp.context["devices"]] == [devices[0].pk, devices[1].pk]
+
+    # sem filtro, uma estimativa grande do catálogo substitui o COUNT(*)
+    monkeypatch.setattr(device_search, "estimated_row_count", lambda model: 2_000_000)
+    with CaptureQueriesContext(connection) as ctx:
+        resp = client.get("/devices/")
+    assert resp.context["paginator"].count == 2_000_000
+    assert resp.context["paginator"].count_is_estimate
+    assert not any("COUNT(" in q["sql"].upper() for q in ctx.captured_queries)
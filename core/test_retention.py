@@ -0,0 +1,116 @@
+import gzip
+import json
+from datetime import timedelta
+
+import pytest
+from django.core.management import call_command
+from django.utils import timezone
+
+from core import retention
+from core.models import Provisioning
+
+
+def _rows(n, age_days):
+    rows = Provisioning.objects.bulk_create([Provisioning(identifier=f"r{i}", vendor="yealink") for i in range(n)])
+    Provisioning.objects.filter(pk__in=[r.pk for r in rows]).update(
+        created_at=timezone.now() - timedelta(days=age_days)
+    )
+    return rows
+
+
+def _archived(path):
+    with gzip.open(path, "rt", encoding="utf-8") as fh:
+        return [json.loads(line) for line in fh]
+
+
+@pytest.mark.django_db
+def test_prune_archives_and_deletes_only_expired_rows_in_chunks(tmp_path):
+    old = _rows(5, age_days=100)
+    _rows(2, age_days=1)
+    cutoff = retention.cutoff_for(90)
+
+    stats = retention.prune(cutoff, archive_dir=str(tmp_path), chunk_size=2)
+
+    assert (stats.archived, stats.deleted, stats.chunks) == (5, 5, 3)
+    assert Provisioning.objects.count() == 2
+    run = retention.ArchiveRun(str(tmp_path))
+    assert [row["id"] for row in _archived(run.path)] == [r.pk for r in old]
+    assert run.state["deleted_through"] == old[-1].pk and run.state["rows"] == 5
+
+
+@pytest.mark.django_db
+def test_interrupted_run_resumes_without_losing_or_duplicating_rows(tmp_path, monkeypatch):
+    old = _rows(6, age_days=100)
+    cutoff = retention.cutoff_for(90)
+
+    # interrompido depois de arquivar o segundo lote e antes de apagá-lo
+    real_delete = retention._delete_range
+    calls = []
+
+    def crash_on_second(first, last, when):
+        calls.append(first)
+        if len(calls) == 2:
+            raise KeyboardInterrupt
+        return real_delete(first, last, when)
+
+    monkeypatch.setattr(retention, "_delete_range", crash_on_second)
+    with pytest.raises(KeyboardInterrupt):
+        retention.prune(cutoff, archive_dir=str(tmp_path), chunk_size=2)
+    assert Provisioning.objects.count() == 4
+    # escrita parcial de um membro gzip no fim do arquivo
+    run = retention.ArchiveRun(str(tmp_path))
+    with open(run.path, "ab") as fh:
+        fh.write(b"\x1f\x8b partial")
+
+    monkeypatch.setattr(retention, "_delete_range", real_delete)
+    stats = retention.prune(cutoff, archive_dir=str(tmp_path), chunk_size=2)
+
+    assert stats.resumed
+    assert not Provisioning.objects.exists()
+    assert [row["id"] for row in _archived(run.path)] == [r.pk for r in old]
+
+
+@pytest.mark.django_db
+def test_run_resumed_on_a_later_cutoff_does_not_archive_rows_twice(tmp_path, monkeypatch):
+    old = _rows(4, age_days=100)
+    cutoff = retention.cutoff_for(90)
+    real_delete = retention._delete_range
+
+    def crash(first, last, when):
+        raise KeyboardInterrupt
+
+    monkeypatch.setattr(retention, "_delete_range", crash)
+    with pytest.raises(KeyboardInterrupt):
+        retention.prune(cutoff, archive_dir=str(tmp_path), chunk_size=2)
+    first_archive = retention.ArchiveRun(str(tmp_path)).path
+
+    # retomado no dia UTC seguinte: outro corte, que também alcança linhas mais novas
+    monkeypatch.setattr(retention, "_delete_range", real_delete)
+    later = _rows(1, age_days=90)
+    next_cutoff = retention.cutoff_for(90, now=timezone.now() + timedelta(days=1))
+    stats = retention.prune(next_cutoff, archive_dir=str(tmp_path), chunk_size=2)
+
+    assert stats.resumed and not Provisioning.objects.exists()
+    run = retention.ArchiveRun(str(tmp_path))
+    assert run.path != first_archive and run.state["cutoff"] == next_cutoff.isoformat()
+    archived = [row["id"] for row in _archived(first_archive) + _archived(run.path)]
+    assert sorted(archived) == sorted(r.pk for r in old + later)
+
+
+@pytest.mark.django_db
+def test_command_dry_run_and_disabled_retention(tmp_path, capsys, settings):
+    _rows(3, age_days=40)
+    call_command("prune_provisioning", "--days", "30", "--dry-run")
+    assert "3 linhas" in capsys.readouterr().out
+    assert Provisioning.objects.count() == 3
+
+    settings.PROVISION_RETENTION = {"DAYS": 30, "ARCHIVE_DIR": None}
+    with pytest.raises(Exception, match="--archive-dir"):
+        call_command("prune_provisioning")
+
+    settings.PROVISION_RETENTION = {"DAYS": 0}
+    with pytest.raises(Exception, match="Retenção desativada"):
+        call_command("prune_provisioning", "--archive-dir", str(tmp_path))
+
+    call_command("prune_provisioning", "--days", "30", "--no-archive", "--sleep", "0")
+    assert not Provisioning.objects.exists()
@@ -0,0 +1,111 @@
+import json
+from datetime import datetime, timedelta, timezone as dt_timezone
+
+import pytest
+from django.contrib.auth import get_user_model
+from django.test import RequestFactory
+from django.urls import reverse
+
+from api import report_views
+from api.utils.events import ProvisioningRecorder
+from core import rollups
+from core.models import DeviceConfig, DeviceProfile, Provisioning, ProvisioningDaily, ProvisioningHourly
+
+
+def _unwrap(func):
+    while hasattr(func, "__wrapped__"):
+        func = func.__wrapped__
+    return func
+
+
+def _event(device=None, model="T46S", status="ok"):
+    return {"device_id": device.pk if device else None, "vendor": "yealink", "model": model,
+            "version": "66.86", "status": status, "identifier": "x"}
+
+
+@pytest.fixture
+def device():
+    profile = DeviceProfile.objects.create(name="RL")
+    return DeviceConfig.objects.create(profile=profile, identifier="rl-1", mac_address="aa:bb:cc:00:00:31")
+
+
+@pytest.mark.django_db
+def test_recorder_batches_increment_hourly_and_daily_rollups(device):
+    recorder = ProvisioningRecorder(background=False, max_batch=100)
+    for _ in range(3):
+        recorder.add(_event(device))
+    recorder.add(_event(status="forbidden"))
+    recorder.flush()
+    recorder.add(_event(device))
+    recorder.flush()
+
+    hourly = {(r.status, r.profile_pk): r.count for r in ProvisioningHourly.objects.all()}
+    assert hourly == {("ok", device.profile_id): 4, ("forbidden", 0): 1}
+    assert sorted(ProvisioningDaily.objects.values_list("count", flat=True)) == [1, 4]
+    assert ProvisioningHourly.objects.get(status="ok").bucket == rollups.hour_bucket(datetime.now(dt_timezone.utc))
+
+
+@pytest.mark.django_db
+def test_recorder_skips_rollups_when_not_incremental(settings, device):
+    settings.PROVISION_ROLLUPS = {"INCREMENTAL": False}
+    recorder = ProvisioningRecorder(background=False, max_batch=100)
+    recorder.add(_event(device))
+    recorder.flush()
+    assert Provisioning.objects.count() == 1
+    assert not ProvisioningHourly.objects.exists()
+
+
+@pytest.mark.django_db
+def test_rebuild_recomputes_closed_hours_and_their_days(device):
+    start = rollups.closed_until() - timedelta(hours=3)
+    rows = Provisioning.objects.bulk_create([Provisioning(**_event(device)) for _ in range(5)])
+    Provisioning.objects.filter(pk__in=[r.pk for r in rows[:2]]).update(created_at=start + timedelta(minutes=5))
+    Provisioning.objects.filter(pk__in=[r.pk for r in rows[2:]]).update(created_at=start + timedelta(hours=1, minutes=1))
+    # linha obsoleta no intervalo: deve ser substituída
+    ProvisioningHourly.objects.create(bucket=start, vendor="yealink", model="T46S", version="66.86",
+                                      status="ok", profile_pk=device.profile_id, count=99)
+
+    done = rollups.rebuild(start - timedelta(hours=1))
+    assert done["hours"] == 2
+    assert dict(ProvisioningHourly.objects.values_list("bucket", "count")) == {
+        start: 2, start + timedelta(hours=1): 3,
+    }
+    assert sum(ProvisioningDaily.objects.values_list("count", flat=True)) == 5
+
+
+@pytest.mark.django_db
+def test_query_filters_and_groups_only_the_rollup_tables():
+    bucket = datetime(2024, 5, 1, 10, tzinfo=dt_timezone.utc)
+    for model, status, n in (("T46S", "ok", 5), ("T46S", "error", 1), ("T48S", "ok", 2)):
+        ProvisioningHourly.objects.create(bucket=bucket, vendor="yealink", model=model, version="1",
+                                          status=status, count=n)
+    ProvisioningHourly.objects.create(bucket=bucket - timedelta(days=2), vendor="yealink", model="T46S",
+                                      version="1", status="ok", count=50)
+
+    since = bucket - timedelta(hours=1)
+    assert rollups.query(since=since, group_by=("model",)) == [
+        {"model": "T46S", "count": 6}, {"model": "T48S", "count": 2},
+    ]
+    assert rollups.query(since=since, filters={"status": "ok"}, group_by=()) == [{"count": 7}]
+    with pytest.raises(ValueError):
+        rollups.report_params({"period": "week"})
+
+
+@pytest.mark.django_db
+def test_dashboard_and_api_read_rollups(client):
+    bucket = rollups.hour_bucket(datetime.now(dt_timezone.utc))
+    ProvisioningHourly.objects.create(bucket=bucket, vendor="yealink", model="T46S", version="1",
+                                      status="ok", profile_pk=7, count=3)
+
+    user = get_user_model().objects.create_user("rep", password="x")
+    client.force_login(user)
+    response = client.get(reverse("core:provisioning_dashboard"))
+    assert response.status_code == 200
+    assert response.context["total"] == 3
+    assert response.context["top_models"] == [{"vendor": "yealink", "model": "T46S", "count": 3}]
+
+    view = _unwrap(report_views.provisioning_stats)
+    data = json.loads(view(RequestFactory().get("/api/provisioning-stats/", {"group_by": "bucket,profile"})).content)
+    assert data["rows"] == [{"bucket": bucket.isoformat(), "profile": 7, "count": 3}]
+    bad = view(RequestFactory().get("/api/provisioning-stats/", {"group_by": "user_agent"}))
+    assert bad.status_code == 400
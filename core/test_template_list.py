@@ -0,0 +1,96 @@
+import pytest
+from django.contrib.auth import get_user_model
+from django.test import Client
+
+import core.views as core_views
+from api.utils.templates import TemplateListing, search_query
+
+pytestmark = pytest.mark.integration
+
+
+class MockCursor:
+    def __init__(self, coll, query):
+        self.coll = coll
+        self.query = query
+        self.skipped = 0
+        self.limited = 0
+
+    def sort(self, keys):
+        self.coll.sorts.append(keys)
+        return self
+
+    def skip(self, n):
+        self.skipped = n
+        return self
+
+    def limit(self, n):
+        self.limited = n
+        return self
+
+    def __iter__(self):
+        end = self.skipped + self.limited if self.limited else None
+        return iter([dict(d) for d in self.coll.docs[self.skipped:end]])
+
+
+class MockColl:
+    def __init__(self, n):
+        self.docs = [{"_id": f"tpl-{i:03d}", "filename": f"tpl-{i:03d}.xml"} for i in range(n)]
+        self.finds = []
+        self.sorts = []
+        self.counts = []
+
+    def find(self, query, projection=None):
+        assert "template" not in projection and "content" not in projection
+        self.finds.append(query)
+        return MockCursor(self, query)
+
+    def count_documents(self, query):
+        self.counts.append(("exact", query))
+        return len(self.docs)
+
+    def estimated_document_count(self):
+        self.counts.append(("estimated", None))
+        return len(self.docs)
+
+
+def test_search_query_is_prefix_anchored_and_escaped():
+    assert search_query("  ") == {}
+    query = search_query("Yealink.T4")
+    assert query == {"$or": [
+        {"_id": {"$regex": r"^Yealink\.T4"}},
+        {"model_lc": {"$regex": r"^yealink\.t4"}},
+    ]}
+
+
+def test_listing_slices_in_mongo():
+    coll = MockColl(60)
+    listing = TemplateListing(coll)
+    page = listing[25:50]
+    assert [d["id"] for d in page] == [f"tpl-{i:03d}" for i in range(25, 50)]
+    assert listing.count() == 60
+    assert coll.counts == [("estimated", None)]
+    assert listing[0:0] == []
+
+
+@pytest.mark.django_db
+def test_template_list_reads_only_one_page(monkeypatch):
+    coll = MockColl(60)
+
+    class MockDB:
+        device_templates = coll
+
+        def get_collection(self, name):
+            return coll
+
+    monkeypatch.setattr(core_views, "get_mongo_client", lambda: MockDB())
+    client = Client()
+    client.force_login(get_user_model().objects.create_user(username="tpl", password="x"))
+
+    resp = client.get("/templates/", {"q": "tpl", "page": 3})
+    assert resp.status_code == 200
+    page_obj = resp.context["page_obj"]
+    assert page_obj.number == 3
+    assert page_obj.paginator.num_pages == 3
+    assert [d["id"] for d in page_obj] == [f"tpl-{i:03d}" for i in range(50, 60)]
+    assert coll.counts == [("exact", search_query("tpl"))]
+    assert coll.finds == [search_query("tpl")]
@@ -8,6 +8,7 @@ urlpatterns = [
     path("", views.DeviceListView.as_view(), name="device_list"),
     path("devices/", views.DeviceListView.as_view(), name="device_list"),
     path("devices/create/", views.DeviceCreateView.as_view(), name="device_create"),
+    path("devices/import/", views.device_import, name="device_import"),
     path("devices/<int:pk>/", views.DeviceDetailView.as_view(), name="device_detail"),
     path("devices/<int:pk>/edit/", views.DeviceUpdateView.as_view(), name="device_update"),
     path("devices/<int:pk>/delete/", views.DeviceDeleteView.as_view(), name="device_delete"),
@@ -24,4 +25,7 @@ urlpatterns = [
     path("templates/<str:name>/", views.template_detail, name="template_detail"),
     path("templates/<str:name>/download/", views.template_download, name="template_download"),
     path("templates/<str:name>/delete/", views.template_delete, name="template_delete"),
+
+    # Reports (read only from the rollup tables)
+    path("reports/provisioning/", views.provisioning_dashboard, name="provisioning_dashboard"),
 ]
\ No newline at end of file
@@ -7,7 +7,10 @@ from django.contrib.auth.mixins import LoginRequiredMixin
 from django.contrib.auth.decorators import login_required, user_passes_test
 from .models import DeviceConfig, DeviceProfile
 from .forms import DeviceProfileForm, DeviceFormSet
-from django.http import Http404
+from . import device_import as device_import_utils
+from . import device_search
+from . import rollups
+from django.http import Http404, HttpResponse
 from django.views.decorators.http import require_http_methods
 from django.conf import settings
 from datetime import datetime
@@ -19,6 +22,8 @@ import re
 
 # Use the shared mongo util
 from api.utils.mongo import get_mongo_client
+from api.utils import compression, template_cache
+from api.utils.templates import TemplateListing, content_hash, encode_template_body, template_keys, template_text
 
 logger = logging.getLogger(__name__)
 
@@ -39,7 +44,7 @@ def _sanitize_filename(name: str) -> str:
     return safe
 
 # View to list templates imported
-# -- template_download: ler 'template' com fallback para 'content' --
+# -- template_download: corpo comprimido ('body') ou, em documentos legados, 'template'/'content' --
 @require_http_methods(["GET"])
 @login_required
 def template_download(request, name: str):
@@ -59,12 +64,12 @@ def template_download(request, name: str):
     if not doc:
         raise Http404("Template não encontrado.")
 
-    # prefer 'template' com fallback para 'content'
-    content = doc.get("template") or doc.get("content") or ""
-    if isinstance(content, str):
-        body = content.encode("utf-8")
-    else:
-        body = content
+    try:
+        text = template_text(doc) or ""
+    except ValueError as exc:
+        logger.error("Template %s ilegível: %s", name, exc)
+        raise Http404("Template não encontrado.")
+    body = text.encode("utf-8")
 
     file_type = (doc.get("file_type") or "").lower()
     filename = doc.get("filename") or f"{name}.{file_type or 'txt'}"
@@ -77,7 +82,10 @@ def template_download(request, name: str):
 
     resp = HttpResponse(body, content_type=content_type)
     resp["Content-Disposition"] = f'attachment; filename="{filename}"'
-    return resp
+    # gzip/br conforme Accept-Encoding; o corpo comprimido fica em cache pelo content_hash
+    coding = compression.negotiate(request)
+    version = doc.get("content_hash") or content_hash(text)
+    return compression.apply(resp, ("template", name, version), coding)
 
 # --- view de remoção ---
 @require_http_methods(["POST"])
@@ -105,6 +113,9 @@ def template_delete(request, name: str):
         messages.error(request, "Erro ao remover o template. Verifique os logs.")
         return redirect("core:template_list")
 
+    # descartar template compilado/resoluções em cache deste worker
+    template_cache.invalidate_template(name)
+
     from django.contrib import messages
     if result.deleted_count:
         messages.success(request, f"Template '{name}' removido com sucesso.")
@@ -126,32 +137,19 @@ def template_list(request):
         context = {"page_obj": None, "q": q}
         return render(request, "core/template_list.html", context)
 
-    query = {}
-    if q:
-        query = {"_id": {"$regex": q, "$options": "i"}}
-
+    # contagem e página (skip/limit) resolvidas no Mongo; busca por prefixo do nome (indexada)
+    paginator = Paginator(TemplateListing(coll, q), 25)
     try:
-        # não traz o campo template para agilizar a listagem
-        cursor = coll.find(query, projection={"template": 0, "content": 0}).sort("uploaded_at", -1)
-        docs = []
-        for d in cursor:
-            d["id"] = str(d.get("_id"))
-            docs.append(d)
+        page_obj = paginator.get_page(page)
     except Exception as exc:
         logger.exception("Erro ao consultar templates: %s", exc)
         messages.error(request, "Erro ao consultar templates no MongoDB.")
-        docs = []
-
-    paginator = Paginator(docs, 25)
-    try:
-        page_obj = paginator.get_page(page)
-    except Exception:
-        page_obj = paginator.get_page(1)
+        page_obj = Paginator([], 25).get_page(1)
 
     context = {"page_obj": page_obj, "q": q}
     return render(request, "core/template_list.html", context)
 
-# -- template_detail: usar 'template' com fallback em 'content' --
+# -- template_detail: texto via template_text (corpo comprimido ou campos legados) --
 @login_required
 def template_detail(request, name: str):
     try:
@@ -173,8 +171,12 @@ def template_detail(request, name: str):
     # adicionar id para o template acessar sem underscore
     doc["id"] = str(doc.get("_id"))
 
-    # prefer 'template' (schema API) e cair em 'content' como fallback
-    content = doc.get("template") or doc.get("content") or ""
+    try:
+        content = template_text(doc) or ""
+    except ValueError as exc:
+        logger.error("Template %s ilegível: %s", name, exc)
+        content = ""
+        messages.error(request, "Não foi possível ler o conteúdo deste template.")
 
     context = {"doc": doc, "content": content}
     return render(request, "core/template_detail.html", context)
@@ -184,18 +186,23 @@ class DeviceListView(LoginRequiredMixin, ListView):
     template_name = "core/device_list.html"
     context_object_name = "devices"
     paginate_by = 25
+    paginator_class = device_search.EstimatedCountPaginator
 
     def get_queryset(self):
         qs = DeviceConfig.objects.select_related("profile").all().order_by("id")
-        q = self.request.GET.get("q")
+        q = (self.request.GET.get("q") or "").strip()
+        self.search_truncated = False
         if q:
-            from django.db.models import Q
-            qs = qs.filter(Q(identifier__icontains=q) | Q(mac_address__icontains=q) | Q(display_name__icontains=q))
+            # cada critério usa o seu índice (ver core.device_search); no máximo MAX_MATCHES resultados
+            ids, self.search_truncated = device_search.search_device_ids(q)
+            qs = qs.filter(pk__in=ids)
         return qs
 
     def get_context_data(self, **kwargs):
         ctx = super().get_context_data(**kwargs)
         ctx["q"] = self.request.GET.get("q", "")
+        ctx["search_truncated"] = self.search_truncated
+        ctx["max_matches"] = device_search.MAX_MATCHES
         return ctx
 
 
@@ -281,6 +288,51 @@ class DeviceDeleteView(LoginRequiredMixin, DeleteView):
         return super().delete(request, *args, **kwargs)
 
 
+# importação em massa de dispositivos (CSV/JSONL), mesma rotina do comando import_devices
+@require_http_methods(["GET", "POST"])
+@login_required
+@staff_required
+def device_import(request):
+    """
+    Upload de CSV/JSONL com dispositivos; o arquivo é lido em streaming e gravado em lotes
+    (core.device_import). Exibe o resumo (linhas lidas/importadas/inválidas, linhas/s) e os erros.
+    """
+    profiles = DeviceProfile.objects.order_by("name").values_list("name", flat=True)
+    ctx = {"profiles": profiles}
+    if request.method == "POST":
+        uploaded = request.FILES.get("file")
+        if not uploaded:
+            messages.error(request, "Selecione um arquivo (.csv ou .jsonl).")
+            return render(request, "core/device_import.html", ctx)
+
+        fmt = request.POST.get("format") or device_import_utils.detect_format(uploaded.name)
+        if fmt not in device_import_utils.FORMATS:
+            messages.error(request, "Formato inválido. Use CSV ou JSONL.")
+            return render(request, "core/device_import.html", ctx)
+        dry_run = request.POST.get("dry_run") in ("on", "true", "1")
+
+        try:
+            stream = device_import_utils.text_stream(uploaded.file)
+            stats = device_import_utils.import_devices(
+                device_import_utils.iter_records(stream, fmt),
+                dry_run=dry_run,
+                default_profile=request.POST.get("profile") or None,
+            )
+        except UnicodeDecodeError:
+            messages.error(request, "Não foi possível ler o arquivo: use UTF-8.")
+            return render(request, "core/device_import.html", ctx)
+
+        summary = stats.summary()
+        if dry_run:
+            summary = "Validação (nada foi gravado): " + summary.replace("importadas", "válidas")
+        if stats.invalid:
+            messages.warning(request, summary)
+        else:
+            messages.success(request, summary)
+        ctx.update(stats=stats, dry_run=dry_run)
+    return render(request, "core/device_import.html", ctx)
+
+
 # Profile (master) + Device (detail) master/detail view using inline formset
 @login_required
 def profile_list(request):
@@ -325,7 +377,7 @@ def profile_create_or_update(request, pk=None):
 
     return render(request, "core/profile_form.html", {"form": form, "formset": formset, "profile": profile})
 
-# -- import_template: salvar 'template' (compatível com api.views) --
+# -- import_template: salvar o corpo comprimido + content_hash (ver api.utils.templates) --
 @require_http_methods(["GET", "POST"])
 @login_required
 def import_template(request):
@@ -376,21 +428,22 @@ def import_template(request):
             messages.error(request, "Falha ao conectar ao MongoDB. Verifique logs.")
             return render(request, "core/import_template.html", {"name": name})
 
-        existing = coll.find_one({"_id": name})
+        existing = coll.find_one({"_id": name}, projection={"_id": 1})
         if existing and not overwrite:
             messages.error(request, "Já existe um template com esse nome. Marque 'Sobrescrever' para atualizar.")
             return render(request, "core/import_template.html", {"name": name})
 
-        # Usar chave 'template' para compatibilidade com app/provision/api/views.py
+        # uma única cópia do texto, comprimida, com content_hash (versão usada pelos caches da API)
         doc = {
             "_id": name,
             "filename": uploaded.name,
             "file_type": file_type,
-            "template": content,      # chave esperada pela API
-            "content": content,       # manter como fallback/compatibilidade (opcional)
             "uploaded_by": request.user.username if request.user.is_authenticated else None,
             "uploaded_at": datetime.utcnow(),
         }
+        doc.update(encode_template_body(content))
+        # chaves normalizadas (model_lc + extension) usadas pela busca indexada da API
+        doc.update(template_keys(doc))
 
         try:
             coll.replace_one({"_id": name}, doc, upsert=True)
@@ -398,7 +451,35 @@ def import_template(request):
             messages.error(request, "Falha ao salvar o template no MongoDB. Verifique logs.")
             return render(request, "core/import_template.html", {"name": name})
 
+        # descartar versão anterior em cache (compilado e resoluções) deste worker
+        template_cache.invalidate_template(name)
+
         messages.success(request, f"Template '{name}' salvo com sucesso.")
         return redirect("core:template_list")
     else:
-        return render(request, "core/import_template.html", {})
\ No newline at end of file
+        return render(request, "core/import_template.html", {})
+
+
+@login_required
+def provisioning_dashboard(request):
+    """
+    Dashboard de provisionamentos por hora/dia, lido só das tabelas de rollup (core.rollups):
+    totais por status, série por bucket e os modelos mais frequentes no intervalo.
+    """
+    try:
+        params = rollups.report_params(request.GET)
+    except ValueError as exc:
+        messages.error(request, str(exc))
+        params = rollups.report_params({})
+    by_status = rollups.query(group_by=("status",), **params)
+    context = {
+        "period": params["period"],
+        "since": params["since"],
+        "until": params["until"],
+        "filters": params["filters"],
+        "total": sum(row["count"] for row in by_status),
+        "by_status": by_status,
+        "series": rollups.query(group_by=("bucket",), **params),
+        "top_models": rollups.query(group_by=("vendor", "model"), limit=20, **params),
+    }
+    return render(request, "core/provisioning_dashboard.html", context)
@@ -0,0 +1,21 @@
+"""
+Gunicorn server hooks (read automatically from the working directory, see Dockerfile CMD).
+
+post_worker_init runs in each worker once the Django application is loaded: it opens the
+worker's MongoDB connection (api.utils.mongo.warm_up) before the first request, so the first
+phone served by a fresh worker does not pay for server selection and the TCP/TLS handshake.
+With --preload the master's MongoClient is never reused: api.utils.mongo drops it after fork.
+It also starts building the worker's known-devices filter (api.utils.known_devices.warm_up)
+in a background thread, so the table scan never happens inside a request.
+"""
+
+
+def post_worker_init(worker):
+    from api.utils import mongo
+
+    if mongo.warmup_enabled():
+        mongo.warm_up()
+
+    from api.utils import known_devices
+
+    known_devices.warm_up()
@@ -5,6 +5,11 @@ It exposes the ASGI callable as a module-level variable named ``application``.
 
 For more information on this file, see
 https://docs.djangoproject.com/en/5.2/howto/deployment/asgi/
+
+With PROVISION_ASYNC_DOWNLOAD=1 the download-xml route uses the native async view
+(api.views.download_config_async), e.g.:
+
+    gunicorn provision.asgi:application -k uvicorn.workers.UvicornWorker
 """
 
 import os
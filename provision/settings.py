@@ -197,6 +197,180 @@ else:
     }
 
 
+# Pool, timeouts e opções do MongoClient por worker (api.utils.mongo); opções já presentes na
+# URI têm prioridade. WARMUP: conectar no boot do worker (gunicorn.conf.py, post_worker_init).
+MONGODB.update({
+    "MAX_POOL_SIZE": int(os.getenv("MONGODB_MAX_POOL_SIZE", 20)),
+    "MIN_POOL_SIZE": int(os.getenv("MONGODB_MIN_POOL_SIZE", 1)),
+    "MAX_IDLE_TIME_MS": int(os.getenv("MONGODB_MAX_IDLE_TIME_MS", 300000)),
+    "SERVER_SELECTION_TIMEOUT_MS": int(os.getenv("MONGODB_SERVER_SELECTION_TIMEOUT_MS", 3000)),
+    "CONNECT_TIMEOUT_MS": int(os.getenv("MONGODB_CONNECT_TIMEOUT_MS", 2000)),
+    "SOCKET_TIMEOUT_MS": int(os.getenv("MONGODB_SOCKET_TIMEOUT_MS", 5000)),
+    "WAIT_QUEUE_TIMEOUT_MS": int(os.getenv("MONGODB_WAIT_QUEUE_TIMEOUT_MS", 2000)),
+    "READ_PREFERENCE": os.getenv("MONGODB_READ_PREFERENCE", "primaryPreferred"),
+    "COMPRESSORS": os.getenv("MONGODB_COMPRESSORS", "zlib"),
+    "APPNAME": os.getenv("MONGODB_APPNAME", "provision"),
+    "WARMUP": os.getenv("MONGODB_WARMUP", "1") == "1",
+})
+
+
+# --- Provisionamento (download-xml hot path) ---
+# Cache por worker de templates compilados (api.utils.template_cache).
+# TTL (segundos) limita por quanto tempo outros workers servem uma versão antiga após import/remoção.
+PROVISION_TEMPLATE_CACHE = {
+    "MAX_SIZE": int(os.getenv("PROVISION_TEMPLATE_CACHE_SIZE", 256)),
+    "TTL": float(os.getenv("PROVISION_TEMPLATE_CACHE_TTL", 300)),
+}
+
+# Eventos de provisionamento (core.models.Provisioning) gravados em lote por api.utils.events.
+# OVERFLOW: drop_oldest | drop_new | sync (grava no próprio request quando a fila enche).
+PROVISION_EVENTS = {
+    "ENABLED": os.getenv("PROVISION_EVENTS_ENABLED", "1") == "1",
+    "BATCH_SIZE": int(os.getenv("PROVISION_EVENTS_BATCH_SIZE", 500)),
+    "FLUSH_INTERVAL": float(os.getenv("PROVISION_EVENTS_FLUSH_INTERVAL", 2)),
+    "MAX_QUEUE": int(os.getenv("PROVISION_EVENTS_MAX_QUEUE", 10000)),
+    "OVERFLOW": os.getenv("PROVISION_EVENTS_OVERFLOW", "drop_oldest"),
+}
+
+# provisioned_at / attempts_provisioning agregados por device e aplicados em lote (api.utils.device_touch)
+PROVISION_DEVICE_TOUCH = {
+    "ENABLED": os.getenv("PROVISION_DEVICE_TOUCH_ENABLED", "1") == "1",
+    "FLUSH_INTERVAL": float(os.getenv("PROVISION_DEVICE_TOUCH_FLUSH_INTERVAL", 10)),
+    "MAX_BATCH": int(os.getenv("PROVISION_DEVICE_TOUCH_MAX_BATCH", 1000)),
+    "MAX_PENDING": int(os.getenv("PROVISION_DEVICE_TOUCH_MAX_PENDING", 100000)),
+}
+
+# Cache por worker de DeviceConfig+profile no download-xml (api.utils.device_cache)
+PROVISION_DEVICE_CACHE = {
+    "ENABLED": os.getenv("PROVISION_DEVICE_CACHE_ENABLED", "1") == "1",
+    "MAX_SIZE": int(os.getenv("PROVISION_DEVICE_CACHE_MAX_SIZE", 10000)),
+    "TTL": float(os.getenv("PROVISION_DEVICE_CACHE_TTL", 60)),
+}
+
+# Dispositivos desconhecidos no download-xml: filtro Bloom de MACs/identifiers conhecidos
+# (api.utils.known_devices), cache negativo e política (generic = template genérico, reject = 403)
+PROVISION_UNKNOWN_DEVICES = {
+    "POLICY": os.getenv("PROVISION_UNKNOWN_DEVICE_POLICY", "generic"),
+    "BLOOM_ENABLED": os.getenv("PROVISION_UNKNOWN_DEVICES_BLOOM", "1") == "1",
+    # filtro construído/atualizado em thread de fundo (nunca dentro de um request)
+    "BACKGROUND": os.getenv("PROVISION_UNKNOWN_DEVICES_BACKGROUND", "1") == "1",
+    "ERROR_RATE": float(os.getenv("PROVISION_UNKNOWN_DEVICES_ERROR_RATE", 0.001)),
+    "REFRESH_INTERVAL": float(os.getenv("PROVISION_UNKNOWN_DEVICES_REFRESH_INTERVAL", 30)),
+    "REBUILD_INTERVAL": float(os.getenv("PROVISION_UNKNOWN_DEVICES_REBUILD_INTERVAL", 3600)),
+    # um "não" do filtro só vale se nenhuma linha mudou após o último refresh (EXISTS em updated_at,
+    # no máximo uma vez por intervalo); do contrário o lookup vai ao SQL até o próximo refresh
+    "CHANGE_CHECK_INTERVAL": float(os.getenv("PROVISION_UNKNOWN_DEVICES_CHANGE_CHECK_INTERVAL", 1)),
+    "NEGATIVE_TTL": float(os.getenv("PROVISION_UNKNOWN_DEVICES_NEGATIVE_TTL", 30)),
+    "NEGATIVE_MAX_SIZE": int(os.getenv("PROVISION_UNKNOWN_DEVICES_NEGATIVE_MAX_SIZE", 50000)),
+}
+
+# download-xml assíncrono (ASGI): api.views.download_config_async com ORM assíncrono e
+# pymongo AsyncMongoClient. Usar com gunicorn -k uvicorn.workers.UvicornWorker provision.asgi:application
+PROVISION_ASYNC_DOWNLOAD = os.getenv("PROVISION_ASYNC_DOWNLOAD", "0") == "1"
+
+# Pré-render das configurações (manage.py prerender_configs) em um diretório endereçado por
+# conteúdo (api.utils.artifacts); SERVE=1 faz o download-xml servir o artefato com o mesmo ETag.
+# DIR não tem padrão: deve ser um volume montado e compartilhado entre o job de pré-render e as
+# instâncias web (no Cloud Run, Cloud Storage FUSE ou NFS), não o disco efêmero do contêiner.
+# Com SERVE=1 e DIR ausente ou não montado, o download-xml registra um aviso e renderiza normalmente.
+PROVISION_ARTIFACTS = {
+    "DIR": os.getenv("PROVISION_ARTIFACTS_DIR") or None,
+    "SERVE": os.getenv("PROVISION_ARTIFACTS_SERVE", "0") == "1",
+    "WORKERS": int(os.getenv("PROVISION_ARTIFACTS_WORKERS", 0)) or None,
+}
+
+
+# Tempos por etapa do download-xml (api.utils.timing): cabeçalho Server-Timing e log estruturado.
+# SAMPLE_RATE (0..1) mede só uma fração dos requests; LOG_MIN_MS loga apenas os mais lentos.
+PROVISION_TIMING = {
+    "ENABLED": os.getenv("PROVISION_TIMING_ENABLED", "1") == "1",
+    "SAMPLE_RATE": float(os.getenv("PROVISION_TIMING_SAMPLE_RATE", 1.0)),
+    "HEADER": os.getenv("PROVISION_TIMING_HEADER", "1") == "1",
+    "LOG": os.getenv("PROVISION_TIMING_LOG", "1") == "1",
+    "LOG_MIN_MS": float(os.getenv("PROVISION_TIMING_LOG_MIN_MS", 0)),
+}
+
+
+# Rollups horários/diários de Provisioning (core.rollups). INCREMENTAL atualiza as tabelas a cada lote
+# gravado pelo recorder; desligado, rode `manage.py rollup_provisioning` periodicamente (ex.: cron a cada hora).
+PROVISION_ROLLUPS = {
+    "INCREMENTAL": os.getenv("PROVISION_ROLLUPS_INCREMENTAL", "1") == "1",
+}
+
+
+# Retenção de Provisioning (core.retention / `manage.py prune_provisioning`): linhas com mais de DAYS dias
+# são arquivadas em ARCHIVE_DIR (.jsonl.gz) e apagadas em lotes de CHUNK_SIZE. DAYS = 0 mantém tudo.
+# ARCHIVE_DIR não tem padrão: deve ser um volume persistente (no Cloud Run, um bucket montado via Cloud
+# Storage FUSE), pois o disco do contêiner é descartado com a instância. Sem ele o comando exige
+# --archive-dir ou --no-archive.
+PROVISION_RETENTION = {
+    "DAYS": int(os.getenv("PROVISION_RETENTION_DAYS", 90)),
+    "ARCHIVE_DIR": os.getenv("PROVISION_RETENTION_ARCHIVE_DIR") or None,
+    "CHUNK_SIZE": int(os.getenv("PROVISION_RETENTION_CHUNK_SIZE", 1000)),
+    "SLEEP": float(os.getenv("PROVISION_RETENTION_SLEEP", 0.05)),
+}
+
+
+# Content-Encoding do download-xml e do download de templates (api.utils.compression). 'br' exige o pacote
+# opcional brotli. EXCLUDE_VENDORS (lista separada por vírgula) recebe sempre a resposta sem compressão.
+PROVISION_COMPRESSION = {
+    "ENABLED": os.getenv("PROVISION_COMPRESSION_ENABLED", "1") == "1",
+    "CODINGS": os.getenv("PROVISION_COMPRESSION_CODINGS", "br,gzip"),
+    "MIN_SIZE": int(os.getenv("PROVISION_COMPRESSION_MIN_SIZE", 512)),
+    "GZIP_LEVEL": int(os.getenv("PROVISION_COMPRESSION_GZIP_LEVEL", 6)),
+    "BROTLI_QUALITY": int(os.getenv("PROVISION_COMPRESSION_BROTLI_QUALITY", 5)),
+    "CACHE_SIZE": int(os.getenv("PROVISION_COMPRESSION_CACHE_SIZE", 1024)),
+    "EXCLUDE_VENDORS": os.getenv("PROVISION_COMPRESSION_EXCLUDE_VENDORS", ""),
+}
+
+
+# Limites do download-xml por MAC e por IP de origem (api.utils.ratelimit): RATE em requisições/s, BURST de folga.
+# CACHE_ALIAS (ex.: um cache Redis em CACHES) compartilha os limites entre workers; vazio = só por worker.
+PROVISION_RATE_LIMIT = {
+    "ENABLED": os.getenv("PROVISION_RATE_LIMIT_ENABLED", "1") == "1",
+    "MAC_RATE": float(os.getenv("PROVISION_RATE_LIMIT_MAC_RATE", 0.2)),
+    "MAC_BURST": float(os.getenv("PROVISION_RATE_LIMIT_MAC_BURST", 10)),
+    "IP_RATE": float(os.getenv("PROVISION_RATE_LIMIT_IP_RATE", 50)),
+    "IP_BURST": float(os.getenv("PROVISION_RATE_LIMIT_IP_BURST", 200)),
+    "CACHE_ALIAS": os.getenv("PROVISION_RATE_LIMIT_CACHE_ALIAS", ""),
+    "MAX_KEYS": int(os.getenv("PROVISION_RATE_LIMIT_MAX_KEYS", 100000)),
+}
+
+
+# Gerações por perfil/template (api.utils.generations) que carimbam os caches por worker: salvar um perfil ou
+# template invalida as entradas em todos os workers sem varredura. CACHE_ALIAS deve ser um cache compartilhado
+# (Redis/Memcached, ver PROVISION_CACHE_URL abaixo); com LocMemCache as gerações são desativadas e os signals
+# voltam à varredura local. LOCAL_TTL (s) é o atraso máximo de propagação.
+PROVISION_GENERATIONS = {
+    "ENABLED": os.getenv("PROVISION_GENERATIONS_ENABLED", "1") == "1",
+    "CACHE_ALIAS": os.getenv("PROVISION_GENERATIONS_CACHE_ALIAS", "default"),
+    "LOCAL_TTL": float(os.getenv("PROVISION_GENERATIONS_LOCAL_TTL", 1.0)),
+    "MAX_KEYS": int(os.getenv("PROVISION_GENERATIONS_MAX_KEYS", 100000)),
+}
+
+
+# IP do cliente no download-xml (api.utils.client_ip): X-Forwarded-For só é seguido através destes proxies
+# (CIDRs separados por vírgula). Padrão: apenas loopback (proxy na mesma máquina). Atrás de um load balancer,
+# informe as faixas dele (ex.: 35.191.0.0/16,130.211.0.0/22 no Google Cloud); não inclua redes privadas
+# inteiras, ou um aparelho atrás de um NAT/proxy da LAN poderia forjar o próprio IP público.
+PROVISION_CLIENT_IP = {
+    "TRUSTED_PROXIES": os.getenv("PROVISION_TRUSTED_PROXIES", "127.0.0.0/8,::1/128"),
+    "CACHE_SIZE": int(os.getenv("PROVISION_CLIENT_IP_CACHE_SIZE", 10000)),
+}
+
+
+# Cache compartilhado entre workers e instâncias (gerações de api.utils.generations; CACHE_ALIAS de
+# PROVISION_RATE_LIMIT). PROVISION_CACHE_URL: redis://host:6379/0 (requer o pacote `redis`) ou host:porta de
+# um Memcached (requer `pymemcache`). Sem ele o Django usa um LocMemCache por processo e as gerações ficam
+# desativadas (aviso no log).
+_provision_cache_url = os.getenv("PROVISION_CACHE_URL", "")
+if _provision_cache_url.startswith(("redis://", "rediss://")):
+    CACHES = {"default": {"BACKEND": "django.core.cache.backends.redis.RedisCache", "LOCATION": _provision_cache_url}}
+elif _provision_cache_url:
+    CACHES = {"default": {"BACKEND": "django.core.cache.backends.memcached.PyMemcacheCache",
+                          "LOCATION": _provision_cache_url}}
+
+
 # --- Arquivos Estáticos e de Mídia (GCS) ---
 
 # Usa a detecção robusta de ambiente